@@ -22,10 +22,20 @@ GESTURE_SIGNAL = 'gesture_signal'
 SHAKE_SIGNAL = 'shake_signal'
 SHAKE_SENDER = 'shake_sender'
 PACKER = '2shhfff2s'
+# little endian, no padding: start marker, counter, delta ms, acc_x, acc_y, acc_z, end marker
+BINARY_PACKER = '<' + PACKER
 ZMQ_PORT = '5556'
 
 
 acc_data_structure = collections.namedtuple('acc_scan', 'millis, counter, acc_x, acc_y, acc_z')
 acc_data_headers = ['millis', 'counter', 'acc_x', 'acc_y', 'acc_z']
 
-
+# numpy structured array layout for a batch of parsed scans, see Parse_accelerometer_data.parse_batch
+acc_scan_dtype = np.dtype([('millis', '<i8'), ('counter', '<i4'), ('acc_x', '<i2'), ('acc_y', '<i2'), ('acc_z', '<i2')])
+# scans on a uniform time grid, see resampler.py: millis is the grid time, counter the grid point number,
+# values are interpolated and gap is set on the first grid point after points left out in a counter gap
+resampled_scan_dtype = np.dtype([('millis', '<f8'), ('counter', '<i4'), ('acc_x', '<f4'), ('acc_y', '<f4'),
+    ('acc_z', '<f4'), ('gap', '?')])
+# numpy layout of a binary frame packed with BINARY_PACKER, see binary_protocol.py
+binary_frame_dtype = np.dtype([('start', 'S2'), ('counter', '<i2'), ('delta', '<i2'),
+    ('acc_x', '<f4'), ('acc_y', '<f4'), ('acc_z', '<f4'), ('end', 'S2')])
@@ -0,0 +1,199 @@
+'''
+Event loop for acquisition: readers on file descriptors and timers, on one thread.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Replaces a thread per serial port sleeping or blocking on a read timeout. An AcquisitionLoop
+waits in selectors.select until a registered file descriptor is readable or the next timer
+is due, so received bytes are handled as soon as they arrive and an idle loop uses no cpu.
+One loop serves any number of serial ports, pipes and timers.
+
+add_reader(fileobj, callback) - callback() is called when fileobj is readable
+call_later(delay, callback) - callback() is called once after delay s
+call_every(interval, callback) - callback() is called every interval s, from when it is added
+Both timer calls return a Timer, which can be cancelled.
+
+run() runs the loop in the calling thread until stop(), start() runs it in its own thread.
+stop() can be called from any thread or from a callback. It wakes the loop through a
+socket pair, so the loop ends straight away, not after a timeout.
+
+Readers and timers can be added and removed from other threads. A callback that raises
+is logged and the loop carries on, so one failing device does not stop the others.
+
+stats() gives the number of readers and timers, wakeups and callbacks run.
+
+@author: matthew oppenheim
+last update: 2025_05_22
+'''
+import heapq
+import itertools
+import logging
+import selectors
+import socket
+import threading
+import time
+
+
+class Timer():
+    ''' A callback due at a time.monotonic() time, repeated every interval s if interval is set. '''
+
+    def __init__(self, due, callback, interval=None):
+        self.due = due
+        self.callback = callback
+        self.interval = interval
+        self.cancelled = False
+
+
+    def cancel(self):
+        ''' Stop the timer, it is removed from the loop when it is next due. '''
+        self.cancelled = True
+
+
+class AcquisitionLoop():
+    ''' Call reader callbacks when their file descriptors are readable, and timer callbacks when due. '''
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock() # guards self.timers, readers and timers can be added from other threads
+        self.timers = [] # heap of (due, sequence number, Timer)
+        self.sequence = itertools.count() # orders timers that are due at the same time
+        # a byte written to wake_write wakes the loop from select, socketpair works on windows too
+        self.wake_read, self.wake_write = socket.socketpair()
+        self.wake_read.setblocking(False)
+        self.wake_write.setblocking(False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, self.drain_wakeup)
+        self.running = False
+        self.thread = None
+        self.wakeups = 0
+        self.callbacks = 0
+        self.errors = 0
+
+
+    def add_reader(self, fileobj, callback):
+        ''' Call callback() whenever fileobj, a file descriptor or object with fileno(), is readable. '''
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+        self.wake()
+
+
+    def call_every(self, interval, callback):
+        ''' Call callback() every interval s, return the Timer. '''
+        return self.call_later(interval, callback, interval)
+
+
+    def call_later(self, delay, callback, interval=None):
+        ''' Call callback() after delay s, then every interval s if interval is set. Return the Timer. '''
+        timer = Timer(time.monotonic() + delay, callback, interval)
+        with self.lock:
+            heapq.heappush(self.timers, (timer.due, next(self.sequence), timer))
+        self.wake()
+        return timer
+
+
+    def close(self):
+        ''' Stop the loop and release the selector and wakeup sockets. '''
+        self.stop()
+        self.selector.close()
+        self.wake_read.close()
+        self.wake_write.close()
+
+
+    def drain_wakeup(self):
+        ''' Empty the wakeup socket. '''
+        try:
+            while self.wake_read.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+
+    def remove_reader(self, fileobj):
+        ''' Stop watching fileobj, return False if it was not being watched. '''
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            return False
+        self.wake()
+        return True
+
+
+    def run(self):
+        ''' Wait for readers and timers and call their callbacks, until stop() is called. '''
+        self.running = True
+        while self.running:
+            events = self.selector.select(self.time_to_next_timer())
+            self.wakeups += 1
+            for key, mask in events:
+                self.run_callback(key.data)
+            self.run_due_timers()
+
+
+    def run_callback(self, callback):
+        ''' Call callback, log any exception rather than ending the loop. '''
+        self.callbacks += 1
+        try:
+            callback()
+        except Exception:
+            self.errors += 1
+            logging.exception(f'acquisition loop callback {getattr(callback, "__qualname__", callback)} failed')
+
+
+    def run_due_timers(self):
+        ''' Call the callbacks of timers that are due, and schedule the repeating ones again. '''
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0][0] > now:
+                    return
+                due, number, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                # from the time it was due, so a repeating timer does not drift, skipping missed calls
+                timer.due = max(due + timer.interval, now)
+                with self.lock:
+                    heapq.heappush(self.timers, (timer.due, next(self.sequence), timer))
+            self.run_callback(timer.callback)
+
+
+    def start(self):
+        ''' Run the loop in its own thread. '''
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='acquisition loop', daemon=True)
+        self.thread.start()
+
+
+    def stats(self):
+        ''' Return a dictionary of the number of readers and timers, wakeups, callbacks and callback errors. '''
+        with self.lock:
+            num_timers = sum(not timer.cancelled for due, number, timer in self.timers)
+        return {'readers': len(self.selector.get_map()) - 1, 'timers': num_timers, 'wakeups': self.wakeups,
+            'callbacks': self.callbacks, 'errors': self.errors}
+
+
+    def stop(self):
+        ''' End the loop, and wait for its thread unless called from it. '''
+        self.running = False
+        self.wake()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+
+    def time_to_next_timer(self):
+        ''' Return the time in s until the next timer is due, 0 if one is overdue, None if there are none. '''
+        with self.lock:
+            while self.timers and self.timers[0][2].cancelled:
+                heapq.heappop(self.timers)
+            if not self.timers:
+                return None
+            return max(self.timers[0][0] - time.monotonic(), 0)
+
+
+    def wake(self):
+        ''' Wake the loop from select, so that it sees new readers, timers or a stop. '''
+        try:
+            self.wake_write.send(b'\0')
+        except (BlockingIOError, OSError):
+            # the socket buffer is full, so the loop will wake anyway, or it is closed
+            pass
@@ -0,0 +1,262 @@
+'''
+Run serial acquisition and processing in a separate process.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Serial reading, parsing, the dataframe update and IMU_calcs otherwise run under the
+same GIL as the Qt event loop, so heavy redraws delay reading and heavy reading stalls the GUI.
+
+In multi-process mode a worker process owns Serial_Connect, the parser, the feature
+calculations and file recording. It writes into a SharedRingBuffer, a RingBuffer whose
+data lives in multiprocessing.shared_memory. The GUI process maps the same memory and only reads it.
+
+A sequence counter in the shared header works as a seqlock: the writer makes it odd
+while it updates the buffer and even when it has finished. The reader copies the columns
+and retries if the counter was odd or changed during the copy.
+
+Control messages (record on/off, stop) are sent to the worker over a multiprocessing Pipe.
+The worker's main thread runs the AcquisitionLoop that reads the serial port, see acquisition_loop.py,
+and the control pipe is one more reader on that loop, so the worker does not poll for messages.
+Pause is handled in the GUI process: the worker keeps updating the buffer and rolling statistics,
+so that the features are up to date when plotting starts again.
+
+If latency.py is enabled when the worker starts, the worker records the parse, dataframe
+and features latencies and logs them when it stops. The arrival time of the oldest scan not
+yet plotted is passed to the GUI process in the shared header, for the render latency.
+time.monotonic uses the same clock in both processes.
+
+@author: matthew oppenheim
+last update: 2025_05_22
+'''
+import accelerometer_data_structure as ads
+import block_dispatcher
+from dataframe import DataFrame
+import dispatcher_signals as ds
+from files import Files
+from imu_calcs import IMU_calcs
+import latency
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import queue
+from resampler import Resampler
+from ring_buffer import RingBuffer
+import threading
+import time
+
+# index of each value in the shared header
+WRITE_INDEX = 0
+COUNT = 1
+SEQUENCE = 2
+ARRIVAL = 3 # arrival time in ns of the oldest scan not yet read by the GUI, 0 if none
+HEADER_LENGTH = 4 # int64 values
+HEADER_BYTES = HEADER_LENGTH * np.dtype(np.int64).itemsize
+
+
+class SharedRingBuffer(RingBuffer):
+    ''' RingBuffer with its data and indices in shared memory.
+    Create with name=None in the GUI process, attach with the same name in the worker process. '''
+
+    MAX_READ_ATTEMPTS = 1000 # seqlock retries before reading an inconsistent copy
+
+    def __init__(self, col_names, capacity, name=None):
+        data_bytes = len(col_names) * 2 * capacity * np.dtype(float).itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=HEADER_BYTES + data_bytes)
+        self.header = np.ndarray((HEADER_LENGTH,), dtype=np.int64, buffer=self.shm.buf)
+        if self.owner:
+            self.header[:] = 0
+        write_index, count = self.header[WRITE_INDEX], self.header[COUNT]
+        super().__init__(col_names, capacity)
+        self.data = np.ndarray((len(col_names), 2*capacity), dtype=float, buffer=self.shm.buf, offset=HEADER_BYTES)
+        if self.owner:
+            self.data.fill(self.fill_value)
+        else:
+            # RingBuffer.__init__ zeroed the shared indices
+            self.header[WRITE_INDEX], self.header[COUNT] = write_index, count
+
+
+    @property
+    def arrival_time(self):
+        ''' time.monotonic() arrival time of the oldest scan not yet taken with take_arrival_time, None if none. '''
+        arrival_ns = int(self.header[ARRIVAL])
+        return arrival_ns / 1e9 if arrival_ns else None
+
+
+    @arrival_time.setter
+    def arrival_time(self, value):
+        self.header[ARRIVAL] = 0 if value is None else int(value * 1e9)
+
+
+    @property
+    def count(self):
+        return int(self.header[COUNT])
+
+
+    @count.setter
+    def count(self, value):
+        self.header[COUNT] = value
+
+
+    @property
+    def name(self):
+        ''' Name of the shared memory block, used to attach to it from another process. '''
+        return self.shm.name
+
+
+    @property
+    def write_index(self):
+        return int(self.header[WRITE_INDEX])
+
+
+    @write_index.setter
+    def write_index(self, value):
+        self.header[WRITE_INDEX] = value
+
+
+    def begin_write(self):
+        ''' Mark the buffer as being written, readers will retry. '''
+        self.header[SEQUENCE] += 1
+
+
+    def close(self):
+        ''' Release the shared memory, the owner also removes it. '''
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+    def end_write(self):
+        ''' Mark the write as finished. '''
+        self.header[SEQUENCE] += 1
+
+
+    def mark_arrival(self, arrival):
+        ''' Keep arrival as the oldest unread arrival time, if there is not one already. '''
+        if arrival is not None and not self.header[ARRIVAL]:
+            self.arrival_time = arrival
+
+
+    def read_columns(self, names):
+        ''' Return (count, dictionary of column copies) from one consistent state of the buffer. '''
+        for attempt in range(self.MAX_READ_ATTEMPTS):
+            sequence = int(self.header[SEQUENCE])
+            if sequence % 2:
+                # a write is in progress
+                time.sleep(0)
+                continue
+            count = self.count
+            columns = {name: column.copy() for name, column in self.columns(names).items()}
+            if int(self.header[SEQUENCE]) == sequence:
+                return count, columns
+        logging.debug('shared ring buffer read did not get a consistent copy')
+        return count, columns
+
+
+    def take_arrival_time(self):
+        ''' Return the oldest unread arrival time and clear it. '''
+        arrival = self.arrival_time
+        self.arrival_time = None
+        return arrival
+
+
+class AcquisitionProcess():
+    ''' GUI side of multi-process mode. Owns the shared buffer and the worker process. '''
+
+    def __init__(self, serial_port=None, max_rows=DataFrame.MAX_DATAFRAME_ROWS, rolling_windows=None, record_format='text',
+            resample_rate=None):
+        self.col_names = ads.acc_data_headers + DataFrame.PROCESSING_HEADERS
+        self.max_rows = max_rows
+        self.buffer = SharedRingBuffer(self.col_names, max_rows)
+        self.control, worker_control = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=acquisition_worker, name='acquisition',
+            args=(self.buffer.name, self.col_names, max_rows, worker_control, serial_port, rolling_windows,
+                latency.enabled, record_format, resample_rate),
+            daemon=True)
+        self.process.start()
+
+
+    def acquire(self, last_generation=None):
+        ''' Return (generation, columns) as SnapshotBuffer.acquire, columns is None if nothing has changed.
+        The generation is the number of scans written by the worker. '''
+        generation = self.buffer.count
+        if generation == last_generation:
+            return generation, None
+        if latency.enabled:
+            latency.published(self.buffer.take_arrival_time())
+        return self.buffer.read_columns(DataFrame.PLOT_HEADERS)
+
+
+    def send_control(self, name, value=None):
+        ''' Send a control message to the worker, e.g. ('record', True). '''
+        self.control.send((name, value))
+
+
+    def stop(self):
+        ''' Stop the worker and release the shared memory. '''
+        if self.process.is_alive():
+            self.send_control('stop')
+            self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.buffer.close()
+
+
+def acquisition_worker(shm_name, col_names, max_rows, control, serial_port=None, rolling_windows=None,
+        latency_enabled=False, record_format='text', resample_rate=None):
+    ''' Run in the worker process: read, parse and process data into the shared buffer.
+    With resample_rate, scans resampled to resample_rate scans per s are processed. '''
+    # imported here so that importing this module does not import pyserial into the GUI process
+    from serial_connection import Serial_Connect
+    buffer = SharedRingBuffer(col_names, max_rows, name=shm_name)
+    imu = IMU_calcs()
+    windows = rolling_windows or (imu.rolling_window_length,)
+    dataframe = DataFrame(max_rows, rolling_windows=windows, buffer=buffer)
+    if latency_enabled:
+        latency.enable()
+
+    def receive_data(message):
+        ''' Update the shared buffer with a block of scans. '''
+        buffer.begin_write()
+        try:
+            dataframe.update_dataframe(message)
+            imu.update_buffer(buffer, len(message))
+        finally:
+            buffer.end_write()
+        buffer.mark_arrival(latency.arrival_time())
+
+    resampler = Resampler(resample_rate, sender=ds.PARSER_SENDER) if resample_rate else None
+    signal = ds.RESAMPLED_SIGNAL if resample_rate else ds.PARSER_SIGNAL
+    block_dispatcher.connect(receive_data, signal=signal, sender=ds.PARSER_SENDER)
+    files_queue = queue.Queue(maxsize=1)
+    threading.Thread(target=Files, args=(files_queue,), kwargs={'record_format': record_format}, daemon=True).start()
+    serial_connection = Serial_Connect(serial_port=serial_port)
+
+    def receive_control():
+        ''' Handle a control message from the GUI process. '''
+        try:
+            name, value = control.recv()
+        except EOFError: # the GUI process has gone
+            serial_connection.loop.stop()
+            return
+        logging.debug(f'acquisition control message: {name} {value}')
+        if name == 'record':
+            files_queue.put(value)
+        elif name == 'stop':
+            # the file thread flushes and closes the recording
+            files_queue.put('stop')
+            serial_connection.loop.stop()
+
+    serial_connection.loop.add_reader(control, receive_control)
+    # runs until a stop message, or the GUI process has gone
+    serial_connection.run()
+    serial_connection.loop.remove_reader(control)
+    serial_connection.stop()
+    block_dispatcher.disconnect(receive_data, signal)
+    if resampler:
+        resampler.stop()
+    if latency.enabled:
+        logging.info(f'acquisition worker latency:\n{latency.summary()}')
+    buffer.close()
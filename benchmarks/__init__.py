@@ -0,0 +1,5 @@
+'''
+Benchmarks for the handshake project.
+Run from the scripts directory (not the benchmarks directory) using e.g.:
+python -m benchmarks.bench_parser
+'''
@@ -0,0 +1,76 @@
+'''
+Microbenchmark of the batch parser against the per record parser.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The recorded scans in slow_swing_handshake_data.txt are turned back into T-Watch
+debug log lines, repeated to make NUM_RECORDS records, then fed to each parser
+in chunks of CHUNK_LINES lines, as the serial reader would.
+
+Run from the scripts directory using:
+python -m benchmarks.bench_parser
+
+@author: matthew oppenheim
+last update: 2025_05_05
+'''
+import argparse
+import time
+
+from benchmarks.data import synthetic_scans
+from parse_accelerometer_data import Parse_accelerometer_data
+from replay_data import format_log_lines
+
+CHUNK_LINES = 64 # number of log lines handed to the parser in one call
+NUM_RECORDS = 100000
+
+
+def load_log_lines(num_records):
+    ''' Return num_records T-Watch log lines made by repeating the recorded scans. '''
+    return format_log_lines(synthetic_scans(num_records)).splitlines(keepends=True)
+
+
+def make_chunks(lines, chunk_lines=CHUNK_LINES):
+    ''' Join lines into chunks of chunk_lines lines. '''
+    return [''.join(lines[i:i+chunk_lines]) for i in range(0, len(lines), chunk_lines)]
+
+
+def time_batch(parser, chunks):
+    ''' Time parse_batch over all chunks, return elapsed seconds and the number of scans parsed. '''
+    num_scans = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        num_scans += len(parser.parse_batch(chunk.encode()))
+    return time.perf_counter() - start, num_scans
+
+
+def time_per_record(parser, chunks):
+    ''' Time extract_single_scan and parse_single_scan over all chunks.
+    The values are converted to ints, as every downstream consumer has to. '''
+    num_scans = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        while True:
+            try:
+                chunk, single_scan = parser.extract_single_scan(chunk, parser.START_MARKER, parser.END_MARKER)
+            except ValueError:
+                break
+            scan = parser.parse_single_scan(single_scan)
+            [int(value) for value in scan]
+            num_scans += 1
+    return time.perf_counter() - start, num_scans
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='parse_batch vs parse_single_scan benchmark')
+    arg_parser.add_argument('--records', type=int, default=NUM_RECORDS)
+    arg_parser.add_argument('--chunk-lines', type=int, default=CHUNK_LINES)
+    args = arg_parser.parse_args()
+    chunks = make_chunks(load_log_lines(args.records), args.chunk_lines)
+    parser = Parse_accelerometer_data()
+    for name, timer in [('per record', time_per_record), ('batch', time_batch)]:
+        elapsed, num_scans = timer(parser, chunks)
+        print(f'{name:>10}: {num_scans} scans in {elapsed:6.3f}s {num_scans/elapsed:12.0f} scans/s '
+            f'{1e6*elapsed/num_scans:6.2f} us/scan')
+
+
+if __name__ == '__main__':
+    main()
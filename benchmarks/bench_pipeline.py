@@ -0,0 +1,221 @@
+'''
+End to end benchmark of the parse -> DataFrame -> IMU_calcs -> plot data pipeline.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Synthetic data made from slow_swing_handshake_data.txt is fed through each stage on
+its own, then through the whole pipeline, in chunks of --chunk scans, as the serial
+reader would hand them over. Only the stage being measured is timed.
+
+Stages:
+parse - Parse_accelerometer_data.parse_new_data on T-Watch debug log lines
+resample - Resampler.resample onto a RESAMPLE_RATE grid, used with main.py --resample
+dataframe - DataFrame.update_dataframe
+imu_calcs - IMU_calcs.update_buffer
+plot_columns - DataFrame.publish_snapshot and the snapshot acquire done by Handshake.update_line_graphs
+end_to_end - parse_new_data, with the dataframe, IMU_calcs and snapshot updated by a block_dispatcher receiver,
+    then the snapshot acquire
+
+For each stage and window size (MAX_DATAFRAME_ROWS) the results are scans/s,
+per call and per scan latency percentiles, and peak traced memory.
+Results are saved as JSON. Use --compare with an earlier JSON file to show the change in scans/s.
+
+Run from the scripts directory using e.g.:
+python -m benchmarks.bench_pipeline --scans 100000 1000000 --rows 200 2000 --output bench.json
+
+@author: matthew oppenheim
+last update: 2025_05_25
+'''
+import argparse
+import datetime
+import json
+import numpy as np
+import platform
+import subprocess
+import time
+import tracemalloc
+
+from benchmarks.data import log_chunks, synthetic_scans
+import block_dispatcher
+from dataframe import DataFrame
+import dispatcher_signals as ds
+from imu_calcs import IMU_calcs
+from parse_accelerometer_data import Parse_accelerometer_data
+from resampler import Resampler
+
+CHUNK_SCANS = 64 # scans handed to the pipeline in one call
+MEMORY_CHUNKS = 200 # calls traced with tracemalloc to find peak memory
+NUM_SCANS = [100000]
+PERCENTILES = [50, 95, 99]
+RESAMPLE_RATE = 12.5 # scans per s, the rate of slow_swing_handshake_data.txt
+ROWS = [DataFrame.MAX_DATAFRAME_ROWS]
+STAGES = ['parse', 'resample', 'dataframe', 'imu_calcs', 'plot_columns', 'end_to_end']
+
+
+class Pipeline():
+    ''' The pipeline objects for one window size, with a method to run each stage on a chunk. '''
+
+    def __init__(self, rows):
+        self.parser = Parse_accelerometer_data()
+        self.dataframe = DataFrame(rows)
+        self.imu = IMU_calcs()
+        self.resampler = Resampler(RESAMPLE_RATE)
+        self.generation = None
+        self.connected = False
+
+
+    def acquire_columns(self):
+        ''' Get the newest snapshot and its columns, as Handshake.update_line_graphs does. '''
+        generation, columns = self.dataframe.snapshot.acquire(self.generation)
+        if columns is not None:
+            self.generation = generation
+            [columns[name] for name in DataFrame.PLOT_HEADERS]
+
+
+    def connect(self):
+        ''' Connect the dataframe update to the parser, as Handshake does. '''
+        block_dispatcher.connect(self.receive_data, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+        self.connected = True
+
+
+    def disconnect(self):
+        if self.connected:
+            block_dispatcher.disconnect(self.receive_data, ds.PARSER_SIGNAL)
+            self.connected = False
+
+
+    def receive_data(self, message):
+        ''' Same processing as Handshake.dispatcher_receive_data, without the logging. '''
+        self.dataframe.update_dataframe(message)
+        self.imu.update_buffer(self.dataframe.buffer, len(message))
+        self.dataframe.publish_snapshot()
+
+
+    def run(self, stage, block, text):
+        ''' Run stage on one chunk, return the time taken in s. Work before the stage is not timed. '''
+        if stage == 'parse':
+            start = time.perf_counter()
+            self.parser.parse_new_data(text)
+            return time.perf_counter() - start
+        if stage == 'resample':
+            start = time.perf_counter()
+            self.resampler.resample(block)
+            return time.perf_counter() - start
+        if stage == 'end_to_end':
+            start = time.perf_counter()
+            self.parser.parse_new_data(text)
+            self.acquire_columns()
+            return time.perf_counter() - start
+        if stage == 'dataframe':
+            start = time.perf_counter()
+            self.dataframe.update_dataframe(block)
+            return time.perf_counter() - start
+        self.dataframe.update_dataframe(block)
+        if stage == 'imu_calcs':
+            start = time.perf_counter()
+            self.imu.update_buffer(self.dataframe.buffer, len(block))
+            return time.perf_counter() - start
+        self.imu.update_buffer(self.dataframe.buffer, len(block))
+        start = time.perf_counter()
+        self.dataframe.publish_snapshot()
+        self.acquire_columns()
+        return time.perf_counter() - start
+
+
+def benchmark_stage(stage, scans, rows, chunk_scans):
+    ''' Return a dictionary of results for stage over scans. '''
+    pipeline = Pipeline(rows)
+    if stage == 'end_to_end':
+        pipeline.connect()
+    durations = []
+    try:
+        for block, text in log_chunks(scans, chunk_scans):
+            durations.append(pipeline.run(stage, block, text))
+    finally:
+        pipeline.disconnect()
+    durations = np.array(durations)
+    total = durations.sum()
+    result = {'stage': stage, 'scans': len(scans), 'rows': rows, 'chunk_scans': chunk_scans,
+        'total_s': float(total), 'scans_per_s': len(scans)/total if total else None,
+        'peak_memory_bytes': peak_memory(stage, scans, rows, chunk_scans)}
+    for percentile in PERCENTILES:
+        call_us = float(np.percentile(durations, percentile)) * 1e6
+        result[f'call_p{percentile}_us'] = call_us
+        result[f'scan_p{percentile}_us'] = call_us / chunk_scans
+    return result
+
+
+def compare(results, previous_file):
+    ''' Print the change in scans/s against results saved in previous_file. '''
+    with open(previous_file) as file_object:
+        previous = json.load(file_object)
+    previous_rates = {(r['stage'], r['scans'], r['rows'], r['chunk_scans']): r['scans_per_s'] for r in previous['results']}
+    print(f"\ncompared with {previous_file} ({previous['metadata'].get('commit')})")
+    for result in results:
+        key = (result['stage'], result['scans'], result['rows'], result['chunk_scans'])
+        if previous_rates.get(key) and result['scans_per_s']:
+            change = 100 * (result['scans_per_s'] / previous_rates[key] - 1)
+            print(f"{result['stage']:>12} scans={result['scans']:<9} rows={result['rows']:<6} {change:+7.1f}% scans/s")
+
+
+def metadata():
+    ''' Return a dictionary describing the code and machine the benchmark ran on. '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+        'processor': platform.processor()}
+
+
+def peak_memory(stage, scans, rows, chunk_scans):
+    ''' Return peak traced memory in bytes for the first MEMORY_CHUNKS calls of stage. '''
+    pipeline = Pipeline(rows)
+    if stage == 'end_to_end':
+        pipeline.connect()
+    tracemalloc.start()
+    try:
+        for block, text in log_chunks(scans[:MEMORY_CHUNKS*chunk_scans], chunk_scans):
+            pipeline.run(stage, block, text)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        pipeline.disconnect()
+    return peak
+
+
+def print_result(result):
+    print(f"{result['stage']:>12} scans={result['scans']:<9} rows={result['rows']:<6} "
+        f"{result['scans_per_s']:12.0f} scans/s  per scan p50/p95/p99 "
+        f"{result['scan_p50_us']:7.2f} {result['scan_p95_us']:7.2f} {result['scan_p99_us']:7.2f} us  "
+        f"peak {result['peak_memory_bytes']/1024:8.1f} KiB")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='handshake pipeline benchmark')
+    arg_parser.add_argument('--scans', type=int, nargs='+', default=NUM_SCANS, help='number of scans, e.g. 100000 1000000')
+    arg_parser.add_argument('--rows', type=int, nargs='+', default=ROWS, help='window sizes, MAX_DATAFRAME_ROWS')
+    arg_parser.add_argument('--chunk', type=int, default=CHUNK_SCANS, help='scans handed over in one call')
+    arg_parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    arg_parser.add_argument('--output', help='save the results to this JSON file')
+    arg_parser.add_argument('--compare', help='JSON file from an earlier run to compare with')
+    args = arg_parser.parse_args()
+    results = []
+    for num_scans in args.scans:
+        scans = synthetic_scans(num_scans)
+        for rows in args.rows:
+            for stage in args.stages:
+                result = benchmark_stage(stage, scans, rows, args.chunk)
+                print_result(result)
+                results.append(result)
+    if args.output:
+        with open(args.output, 'w') as file_object:
+            json.dump({'metadata': metadata(), 'results': results}, file_object, indent=2)
+        print(f'saved results to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
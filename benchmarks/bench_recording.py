@@ -0,0 +1,96 @@
+'''
+Benchmark of the recording formats: size, encode and decode throughput.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Scans made by repeating slow_swing_handshake_data.txt are encoded as the Recorder in files.py
+encodes them, in the text, binary and each compressed format, then read back with
+replay_data.read_recording, as a replay would. Size is compared with the text format and
+given as MB per day of recording at --rate scans per s.
+
+The repeated recording starts again every 123 scans. zlib and lzma find the repeats,
+so their sizes are smaller than for a real recording. The pack sizes are not affected.
+
+Run from the scripts directory using:
+python -m benchmarks.bench_recording
+
+@author: matthew oppenheim
+last update: 2025_05_19
+'''
+import argparse
+import binary_recording
+import compressed_recording
+import files
+import io
+import numpy as np
+import os
+import tempfile
+import time
+
+from benchmarks.data import synthetic_scans
+from replay_data import read_recording
+
+BLOCK_SCANS = 64 # scans in one block handed to the encoder, as the parser publishes them
+NUM_SCANS = 200000
+RATE = 50 # sensor scans per s, for the size of a day of recording
+
+
+def encode(scans, record_format):
+    ''' Return scans encoded in record_format as bytes, including any file header, as the Recorder writes them. '''
+    blocks = [scans[start:start+BLOCK_SCANS] for start in range(0, len(scans), BLOCK_SCANS)]
+    if record_format == 'text':
+        return b''.join(''.join(files.RECORD_LINE.format(*scan) for scan in block.tolist()).encode()
+            for block in blocks)
+    header = io.BytesIO()
+    if record_format == 'binary':
+        binary_recording.write_header(header)
+    else:
+        compressed_recording.write_header(header)
+    data = [header.getvalue()]
+    if record_format == 'binary':
+        return b''.join(data + [binary_recording.encode_block(block) for block in blocks])
+    encoder = compressed_recording.ChunkEncoder(record_format)
+    for block in blocks:
+        chunks, chunk_numbers = encoder.add(block)
+        data.extend(chunks)
+    data.append(encoder.end_chunk())
+    return b''.join(data)
+
+
+def time_format(scans, record_format, directory):
+    ''' Return a dictionary of the encoded size, encode time and decode time for record_format. '''
+    start = time.perf_counter()
+    data = encode(scans, record_format)
+    encode_time = time.perf_counter() - start
+    file_path = os.path.join(directory, f'recording.{record_format}')
+    with open(file_path, 'wb') as file_object:
+        file_object.write(data)
+    start = time.perf_counter()
+    # np.array, so that a memory mapped binary recording is read
+    decoded = np.array(read_recording(file_path))
+    decode_time = time.perf_counter() - start
+    if not np.array_equal(decoded, scans):
+        raise ValueError(f'{record_format} recording does not read back')
+    return {'bytes': len(data), 'encode_time': encode_time, 'decode_time': decode_time}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='recording format size and throughput benchmark')
+    arg_parser.add_argument('--scans', type=int, default=NUM_SCANS)
+    arg_parser.add_argument('--rate', type=float, default=RATE, help='scans per s, for MB per day')
+    arg_parser.add_argument('--formats', nargs='+', choices=files.RECORD_FORMATS, default=files.RECORD_FORMATS)
+    args = arg_parser.parse_args()
+    scans = synthetic_scans(args.scans)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {record_format: time_format(scans, record_format, directory) for record_format in args.formats}
+    text_bytes = results['text']['bytes'] if 'text' in results else None
+    for record_format, result in results.items():
+        bytes_per_scan = result['bytes'] / len(scans)
+        ratio = f'{text_bytes / result["bytes"]:6.1f}x' if text_bytes else ''
+        print(f'{record_format:>6}: {bytes_per_scan:6.2f} bytes/scan {ratio} '
+            f'{bytes_per_scan * args.rate * 86400 / 1e6:8.1f} MB/day '
+            f'encode {len(scans)/result["encode_time"]:10.0f} scans/s '
+            f'decode {len(scans)/result["decode_time"]:10.0f} scans/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+'''
+Benchmark input data made from a recording.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The recorded scans are repeated to make as many scans as needed, with millis
+stepping by MILLIS_STEP and the counter incrementing, so the data looks like
+a long, unbroken recording.
+
+@author: matthew oppenheim
+last update: 2025_05_12
+'''
+import numpy as np
+from replay_data import TEST_FILE, format_log_lines, read_recording
+
+MILLIS_STEP = 80 # ms between synthetic scans, as in slow_swing_handshake_data.txt
+
+
+def log_chunks(scans, chunk_scans):
+    ''' Yield (block of scans, block as T-Watch debug log line bytes) for each chunk of chunk_scans scans.
+    The log lines are made as they are needed, so that long runs do not hold them all in memory. '''
+    for start in range(0, len(scans), chunk_scans):
+        block = scans[start:start+chunk_scans]
+        yield block, format_log_lines(block).encode()
+
+
+def synthetic_scans(num_scans, file_path=TEST_FILE):
+    ''' Return num_scans scans of ads.acc_scan_dtype made by repeating the scans in file_path. '''
+    recorded = read_recording(file_path)
+    scans = np.resize(recorded, num_scans)
+    scans['millis'] = recorded['millis'][0] + MILLIS_STEP*np.arange(num_scans)
+    scans['counter'] = recorded['counter'][0] + np.arange(num_scans)
+    return scans
@@ -0,0 +1,129 @@
+'''
+Decode and encode binary accelerometer frames.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Frames are packed with ads.BINARY_PACKER, the little endian version of ads.PACKER:
+start marker b'ST', int16 counter, int16 delta, float32 acc_x, acc_y, acc_z, end marker b'EN'.
+delta is the time in ms since the previous scan, millis is rebuilt by adding up the deltas,
+so the delta of a corrupt frame is lost from millis of the frames after it.
+A frame is 20 bytes, compared with about 80 bytes for a text debug line.
+
+Runs of valid frames are decoded in bulk using np.frombuffer.
+After corrupt data the decoder resyncs on the next start marker that has an end marker
+in the right place.
+
+detect_protocol looks at received data and decides if it is text debug lines or binary frames.
+
+@author: matthew oppenheim
+last update: 2025_05_07
+'''
+import accelerometer_data_structure as ads
+import logging
+import numpy as np
+from parse_accelerometer_data import Parse_accelerometer_data
+
+FRAME_SIZE = ads.binary_frame_dtype.itemsize
+START_MARKER = b'ST'
+END_MARKER = b'EN'
+END_OFFSET = FRAME_SIZE - len(END_MARKER)
+
+
+class BinaryFrameDecoder():
+    ''' Decode a stream of binary frames to numpy structured arrays of ads.acc_scan_dtype. '''
+
+    def __init__(self, start_millis=0):
+        self.buffer = bytearray()
+        self.millis = start_millis # millis of the last decoded scan
+        self.frames_decoded = 0
+        self.resyncs = 0
+        self.bytes_skipped = 0
+
+
+    def decode(self, data):
+        ''' Add received bytes and return all complete frames decoded so far. '''
+        self.buffer += data
+        blocks = []
+        position = 0
+        while len(self.buffer) - position >= FRAME_SIZE:
+            if not is_frame(self.buffer, position):
+                position = self.resync(position)
+                continue
+            num_frames = (len(self.buffer) - position) // FRAME_SIZE
+            frames = np.frombuffer(self.buffer, dtype=ads.binary_frame_dtype, count=num_frames, offset=position)
+            valid = (frames['start'] == START_MARKER) & (frames['end'] == END_MARKER)
+            # decode the run of valid frames up to the first corrupt one
+            num_valid = num_frames if valid.all() else int(np.argmin(valid))
+            blocks.append(self.frames_to_scans(frames[:num_valid]))
+            # release the view of the buffer so that it can be resized
+            del frames
+            position += num_valid*FRAME_SIZE
+        del self.buffer[:position]
+        if not blocks:
+            return np.zeros(0, dtype=ads.acc_scan_dtype)
+        return np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+
+
+    def frames_to_scans(self, frames):
+        ''' Convert binary frames to a new array of ads.acc_scan_dtype. '''
+        scans = np.zeros(len(frames), dtype=ads.acc_scan_dtype)
+        scans['millis'] = self.millis + np.cumsum(frames['delta'], dtype=np.int64)
+        scans['counter'] = frames['counter']
+        for axis in ['acc_x', 'acc_y', 'acc_z']:
+            scans[axis] = np.rint(frames[axis])
+        if len(scans):
+            self.millis = int(scans['millis'][-1])
+        self.frames_decoded += len(scans)
+        return scans
+
+
+    def resync(self, position):
+        ''' Return the position of the next possible frame after corrupt data at <position>. '''
+        next_start = self.buffer.find(START_MARKER, position + 1)
+        if next_start == -1:
+            # keep the last byte, it may be the first byte of a start marker
+            next_start = len(self.buffer) - 1
+        self.resyncs += 1
+        self.bytes_skipped += next_start - position
+        logging.debug(f'binary resync, skipped {next_start - position} bytes')
+        return next_start
+
+
+    def stats(self):
+        ''' Return a dictionary of decoder counters. '''
+        return {'frames_decoded': self.frames_decoded, 'resyncs': self.resyncs,
+            'bytes_skipped': self.bytes_skipped, 'buffered_bytes': len(self.buffer)}
+
+
+def detect_protocol(data):
+    ''' Return 'text' or 'binary' for received <data>, or None if it is not clear yet. '''
+    if Parse_accelerometer_data.SCAN_PATTERN.search(data):
+        return 'text'
+    # two back to back frames are needed to call the data binary
+    position = data.find(START_MARKER)
+    while position != -1 and position + 2*FRAME_SIZE <= len(data):
+        if is_frame(data, position) and is_frame(data, position + FRAME_SIZE):
+            return 'binary'
+        position = data.find(START_MARKER, position + 1)
+    return None
+
+
+def is_frame(data, position):
+    ''' Return True if data has start and end markers for a frame starting at <position>. '''
+    return (data[position:position+len(START_MARKER)] == START_MARKER and
+        data[position+END_OFFSET:position+FRAME_SIZE] == END_MARKER)
+
+
+def pack_frames(scans, previous_millis=None):
+    ''' Pack an array of ads.acc_scan_dtype scans into binary frames.
+    The delta of the first scan is measured from previous_millis, or is 0. '''
+    millis = scans['millis'].astype(np.int64)
+    if previous_millis is None:
+        previous_millis = millis[0] if len(millis) else 0
+    frames = np.zeros(len(scans), dtype=ads.binary_frame_dtype)
+    frames['start'] = START_MARKER
+    frames['counter'] = scans['counter'].astype(np.int16)
+    frames['delta'] = np.diff(millis, prepend=previous_millis)
+    for axis in ['acc_x', 'acc_y', 'acc_z']:
+        frames[axis] = scans[axis]
+    frames['end'] = END_MARKER
+    return frames.tobytes()
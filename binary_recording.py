@@ -0,0 +1,143 @@
+'''
+Binary recording format, written by files.py and read with np.memmap.
+Part of the handshake project: mattoppenheim.com/handshake
+
+A recording is a HEADER_SIZE byte header followed by fixed width little endian records
+of ads.acc_scan_dtype: int64 millis, int32 counter, int16 acc_x, acc_y, acc_z.
+A record is 18 bytes, compared with about 70 bytes for a text acc_data_structure line.
+
+Header, little endian:
+magic b'HSREC\x00\r\n' - the \r\n shows up files damaged by text mode transfers
+uint16 version
+uint16 header size in bytes
+uint16 record size in bytes
+uint16 flags, unused, 0
+float64 host time.time() when the recording was started
+8 spare bytes
+
+A partly written last record, e.g. after a crash, is ignored by the reader.
+
+BinaryRecording maps the records with np.memmap, so opening a multi-hour recording
+does not read it and slicing gives numpy views of the file.
+
+Convert a text recording, from the scripts directory:
+python binary_recording.py slow_swing_handshake_data.txt
+creates slow_swing_handshake_data.hsr
+
+@author: matthew oppenheim
+last update: 2025_05_17
+'''
+import accelerometer_data_structure as ads
+import argparse
+import numpy as np
+import os
+import struct
+import time
+
+EXTENSION = '.hsr'
+HEADER_FORMAT = '<8sHHHHd8x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'HSREC\x00\r\n'
+RECORD_DTYPE = ads.acc_scan_dtype.newbyteorder('<')
+RECORD_SIZE = RECORD_DTYPE.itemsize
+TEXT_CHUNK_BYTES = 1 << 20 # text read at a time when converting
+VERSION = 1
+
+
+class BinaryRecording():
+    ''' Read only view of a binary recording. self.scans is an np.memmap of RECORD_DTYPE. '''
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as file_object:
+            self.header = read_header(file_object)
+        num_records = (os.path.getsize(file_path) - self.header['header_size']) // self.header['record_size']
+        if num_records > 0:
+            self.scans = np.memmap(file_path, dtype=RECORD_DTYPE, mode='r', offset=self.header['header_size'],
+                shape=(num_records,))
+        else:
+            # np.memmap can not map 0 bytes
+            self.scans = np.zeros(0, dtype=RECORD_DTYPE)
+
+
+    def __getitem__(self, index):
+        return self.scans[index]
+
+
+    def __len__(self):
+        return len(self.scans)
+
+
+    @property
+    def start_time(self):
+        ''' Host time.time() when the recording was started. '''
+        return self.header['start_time']
+
+
+def convert_text_recording(text_path, binary_path=None):
+    ''' Convert a text recording made by files.py to a binary recording, return the binary file path.
+    The text is read in chunks, so large recordings do not have to fit in memory. '''
+    # imported here as replay_data imports this module
+    from replay_data import RECORDED_SCAN_PATTERN
+    binary_path = binary_path or os.path.splitext(text_path)[0] + EXTENSION
+    with open(text_path) as text_file, open(binary_path, 'wb') as binary_file:
+        write_header(binary_file, os.path.getmtime(text_path))
+        remainder = ''
+        while True:
+            text = text_file.read(TEXT_CHUNK_BYTES)
+            at_end = not text
+            text = remainder + text
+            # only whole lines are parsed until the end of the file, the rest is kept for the next chunk
+            last_line_end = len(text) if at_end else text.rfind('\n') + 1
+            remainder = text[last_line_end:]
+            values = RECORDED_SCAN_PATTERN.findall(text, 0, last_line_end)
+            if values:
+                binary_file.write(encode_block(np.array(values, dtype=np.int64)))
+            if at_end:
+                break
+    return binary_path
+
+
+def encode_block(scans):
+    ''' Return the records for a block of scans, an array of ads.acc_scan_dtype or a (n, 5) array, as bytes. '''
+    if scans.dtype.names is None:
+        records = np.zeros(len(scans), dtype=RECORD_DTYPE)
+        for index, header in enumerate(ads.acc_data_headers):
+            records[header] = scans[:, index]
+        return records.tobytes()
+    return scans.astype(RECORD_DTYPE, copy=False).tobytes()
+
+
+def is_binary_recording(file_path):
+    ''' Return True if file_path starts with the binary recording magic bytes. '''
+    with open(file_path, 'rb') as file_object:
+        return file_object.read(len(MAGIC)) == MAGIC
+
+
+def read_header(file_object):
+    ''' Read and check the header at the start of file_object, return it as a dictionary. '''
+    data = file_object.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE or not data.startswith(MAGIC):
+        raise ValueError(f'{getattr(file_object, "name", file_object)} is not a binary recording')
+    magic, version, header_size, record_size, flags, start_time = struct.unpack(HEADER_FORMAT, data)
+    if version > VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f'unsupported binary recording version {version}, record size {record_size}')
+    return {'version': version, 'header_size': header_size, 'record_size': record_size, 'flags': flags,
+        'start_time': start_time}
+
+
+def write_header(file_object, start_time=None):
+    ''' Write a header to file_object, start_time defaults to now. '''
+    start_time = time.time() if start_time is None else start_time
+    file_object.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE, RECORD_SIZE, 0, start_time))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='convert a text recording to a binary recording')
+    arg_parser.add_argument('text_file')
+    arg_parser.add_argument('binary_file', nargs='?', help=f'defaults to text_file with a {EXTENSION} extension')
+    args = arg_parser.parse_args()
+    binary_path = convert_text_recording(args.text_file, args.binary_file)
+    recording = BinaryRecording(binary_path)
+    print(f'wrote {len(recording)} scans to {binary_path}, {os.path.getsize(binary_path)} bytes '
+        f'from {os.path.getsize(args.text_file)} bytes')
@@ -0,0 +1,164 @@
+'''
+Publish/subscribe for blocks of parsed scans.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Replaces PyDispatcher for sensor data. A message is a numpy structured array
+holding every scan parsed from one read, not a single scan, so the lookup and
+call cost is paid once per block instead of once per scan.
+
+Subscribing works the same way as with PyDispatcher:
+    block_dispatcher.connect(self.dispatcher_receive_data, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+The receiver is called with the keyword 'message'.
+
+Receivers connected with queued=True get their own bounded queue and thread,
+so a slow receiver, e.g. file writing, cannot stall the serial reader.
+If a queue is full the new block is dropped and counted.
+stats() returns delivered, dropped, queue depth and lag for every receiver.
+
+@author: matthew oppenheim
+last update: 2025_05_08
+'''
+import logging
+import queue
+import threading
+import time
+
+ANY = 'any_sender' # connect to a signal from any sender
+QUEUE_SIZE = 256 # blocks held for a queued receiver before blocks are dropped
+
+
+class Receiver():
+    ''' A receiver connected to a signal, called directly on the sending thread. '''
+
+    def __init__(self, receiver, signal, sender):
+        self.receiver = receiver
+        self.signal = signal
+        self.sender = sender
+        self.name = getattr(receiver, '__qualname__', repr(receiver))
+        self.blocks_delivered = 0
+        self.samples_delivered = 0
+        self.blocks_dropped = 0
+        self.last_lag = 0.0 # time in s from send to the receiver being called
+        self.max_lag = 0.0
+
+
+    def call(self, message, send_time):
+        ''' Call the receiver with message and update the lag metrics. '''
+        lag = time.monotonic() - send_time
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        try:
+            self.receiver(message=message)
+        except Exception as e:
+            logging.exception(f'receiver {self.name} error: {e}')
+        self.blocks_delivered += 1
+        self.samples_delivered += len(message)
+
+
+    def deliver(self, message, send_time):
+        ''' Deliver message to the receiver. '''
+        self.call(message, send_time)
+
+
+    def stats(self):
+        ''' Return a dictionary of delivery metrics. '''
+        return {'receiver': self.name, 'signal': self.signal, 'queued': False,
+            'blocks_delivered': self.blocks_delivered, 'samples_delivered': self.samples_delivered,
+            'blocks_dropped': self.blocks_dropped, 'queue_depth': 0, 'max_queue_depth': 0,
+            'last_lag_s': self.last_lag, 'max_lag_s': self.max_lag}
+
+
+    def stop(self):
+        ''' Nothing to stop for a direct receiver. '''
+        pass
+
+
+class QueuedReceiver(Receiver):
+    ''' A receiver with its own queue, called on its own thread. '''
+
+    def __init__(self, receiver, signal, sender, maxsize=QUEUE_SIZE):
+        super().__init__(receiver, signal, sender)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.max_queue_depth = 0
+        self.thread = threading.Thread(target=self.run, name=f'receiver {self.name}', daemon=True)
+        self.thread.start()
+
+
+    def deliver(self, message, send_time):
+        ''' Queue message for the receiver thread, drop it if the queue is full. '''
+        try:
+            self.queue.put_nowait((message, send_time))
+        except queue.Full:
+            self.blocks_dropped += 1
+            return
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+
+    def run(self):
+        ''' Call the receiver with each queued message until stopped. '''
+        while True:
+            message, send_time = self.queue.get()
+            if message is None:
+                break
+            self.call(message, send_time)
+
+
+    def stats(self):
+        ''' Return a dictionary of delivery metrics, including the queue depth. '''
+        stats = super().stats()
+        stats.update({'queued': True, 'queue_depth': self.queue.qsize(), 'max_queue_depth': self.max_queue_depth})
+        return stats
+
+
+    def stop(self):
+        ''' Stop the receiver thread once the queued messages are delivered.
+        If the queue is full, e.g. the receiver is stuck, the oldest messages are dropped so stop does not block. '''
+        while True:
+            try:
+                self.queue.put_nowait((None, None))
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+                self.blocks_dropped += 1
+            except queue.Empty:
+                pass
+
+
+receivers = {} # signal: tuple of Receivers, replaced rather than changed so send needs no lock
+receivers_lock = threading.Lock()
+
+
+def connect(receiver, signal, sender=ANY, queued=False, maxsize=QUEUE_SIZE):
+    ''' Connect receiver to signal. The receiver is called with keyword argument message. '''
+    if queued:
+        new_receiver = QueuedReceiver(receiver, signal, sender, maxsize)
+    else:
+        new_receiver = Receiver(receiver, signal, sender)
+    with receivers_lock:
+        receivers[signal] = receivers.get(signal, ()) + (new_receiver,)
+    return new_receiver
+
+
+def disconnect(receiver, signal):
+    ''' Disconnect receiver from signal. '''
+    with receivers_lock:
+        connected = receivers.get(signal, ())
+        removed = [r for r in connected if r.receiver == receiver]
+        receivers[signal] = tuple(r for r in connected if r.receiver != receiver)
+    for r in removed:
+        r.stop()
+
+
+def send(signal, sender, message):
+    ''' Send message, a block of scans, to all receivers connected to signal and sender. '''
+    send_time = time.monotonic()
+    for receiver in receivers.get(signal, ()):
+        if receiver.sender == ANY or receiver.sender == sender:
+            receiver.deliver(message, send_time)
+
+
+def stats():
+    ''' Return a list of delivery metrics dictionaries, one for each receiver. '''
+    return [receiver.stats() for connected in receivers.values() for receiver in connected]
@@ -0,0 +1,158 @@
+'''
+Online host/device clock offset and drift estimate, and transport latency.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Each scan carries the watch's millis, counted from when it was switched on, and the host
+only knows when the bytes holding it were read. The host time of a read, less the millis
+of a scan in it, is the clock offset plus the time the scan took to reach the host, which
+is never less than the fastest transport. So the smallest delta seen over a while is the
+best estimate of the offset, and the rest of each delta is transport latency.
+
+A ClockEstimator keeps the smallest host - device delta in each WINDOW_MS of device time,
+for the last NUM_WINDOWS windows, and fits a line through them. The slope of the line is
+the drift of the watch crystal against the host clock, in ppm. Until a window has ended
+the smallest delta so far is used. When millis go backwards, e.g. the watch was reset,
+the estimate starts again.
+
+update(millis, arrival_ms) returns host_ms, the host time.time() in ms of each scan, and
+adds the transport latency of the newest scan, arrival less its host_ms, to a histogram.
+Jitter is the standard deviation of that latency over the last JITTER_BLOCKS blocks.
+The fastest transport time can not be seen without a round trip to the watch, so host_ms
+is early, and transport latency short, by that constant amount, a ms or so over USB.
+
+The serial reader, or the replay, calls mark_arrival when a chunk of bytes is read, as
+it does for latency.py, and the DataFrame updated on the same thread picks it up with
+arrival_ms. The arrival time is kept per thread.
+
+stats() gives the offset, drift, windows fitted, resets and the transport latency
+percentiles and jitter. summary() gives the same as one line for the textedit.
+
+@author: matthew oppenheim
+last update: 2025_05_24
+'''
+import collections
+import latency
+import logging
+import math
+import numpy as np
+from rolling_stats import RollingStats
+import threading
+import time
+
+JITTER_BLOCKS = 50 # blocks the transport jitter is worked out over
+NUM_WINDOWS = 30 # windows of smallest deltas the drift line is fitted through
+WINDOW_MS = 2000 # device ms that each smallest delta is taken over
+
+thread_data = threading.local() # host time.time() in ms that the chunk being processed on this thread arrived
+
+
+def arrival_ms():
+    ''' Return the host time in ms the chunk being processed on this thread arrived, None if not marked. '''
+    return getattr(thread_data, 'arrival_ms', None)
+
+
+def mark_arrival(arrival=None):
+    ''' Record that a chunk of bytes has arrived on this thread, now or at arrival, a host time.time() in ms. '''
+    thread_data.arrival_ms = 1000*time.time() if arrival is None else arrival
+
+
+class ClockEstimator():
+    ''' Estimate the host - device clock offset and drift from the smallest deltas, and time the transport. '''
+
+    def __init__(self, window_ms=WINDOW_MS, num_windows=NUM_WINDOWS, jitter_blocks=JITTER_BLOCKS):
+        if window_ms <= 0 or num_windows < 1:
+            raise ValueError(f'need window_ms > 0 and num_windows >= 1, not {window_ms}, {num_windows}')
+        self.window_ms = window_ms
+        self.jitter_blocks = jitter_blocks
+        self.minima = collections.deque(maxlen=num_windows) # (device ms, host - device ms) smallest in each window
+        self.transport = latency.LatencyHistogram() # transport latency of the newest scan of each block
+        self.jitter = RollingStats(jitter_blocks)
+        self.resets = 0
+        self.blocks = 0
+        self.clear()
+
+
+    def clear(self):
+        ''' Forget the windows and fitted line, e.g. after the watch was reset. '''
+        self.minima.clear()
+        self.window_start = None # device ms the current window started at
+        self.window_min = None # (device ms, host - device ms) smallest in the current window
+        self.origin = None # device ms the fitted line starts from
+        self.intercept = None # host - device ms at self.origin
+        self.slope = 0.0 # drift, ms of host time per ms of device time, less 1
+        self.last_millis = None
+
+
+    def fit(self):
+        ''' Fit the offset line through the smallest delta of each window. '''
+        device_ms, deltas = np.array(self.minima).T
+        self.origin = device_ms[0]
+        if len(self.minima) < 2:
+            self.slope, self.intercept = 0.0, deltas[0]
+            return
+        # least squares line, worked out directly as np.polyfit costs more than the rest of an update
+        device_ms = device_ms - self.origin
+        mean_ms, mean_delta = device_ms.mean(), deltas.mean()
+        spread = device_ms - mean_ms
+        self.slope = float(spread @ (deltas - mean_delta) / (spread @ spread))
+        self.intercept = float(mean_delta - self.slope * mean_ms)
+
+
+    def offset(self, millis):
+        ''' Return host - device ms at device millis, None before the first block. '''
+        if self.intercept is None:
+            return self.window_min[1] if self.window_min else None
+        return self.intercept + self.slope * (np.asarray(millis, dtype=float) - self.origin)
+
+
+    def stats(self):
+        ''' Return a dictionary of the offset, drift, windows, resets, transport latency in ms and jitter. '''
+        offset = self.offset(self.last_millis) if self.last_millis is not None else None
+        return {'offset_ms': None if offset is None else float(offset), 'drift_ppm': 1e6*float(self.slope),
+            'windows': len(self.minima), 'resets': self.resets, 'blocks': self.blocks,
+            'transport': self.transport.stats(), 'jitter_ms': math.sqrt(self.jitter.variance(self.jitter_blocks))}
+
+
+    def summary(self):
+        ''' Return one line of the offset, drift, transport latency and jitter, for display. '''
+        stats = self.stats()
+        if stats['offset_ms'] is None:
+            return 'clock: no data'
+        transport = stats['transport']
+        percentiles = '/'.join(f"{transport[f'p{percent}_ms']:.1f}" for percent in latency.PERCENTILES)
+        return (f"clock drift: {stats['drift_ppm']:.0f} ppm transport p50/p95/p99 ms: {percentiles} "
+            f"jitter: {stats['jitter_ms']:.1f} ms")
+
+
+    def update(self, millis, arrival=None):
+        ''' Add a block of scans with device millis that arrived at host time arrival in ms, this thread's
+        arrival mark by default, or now. Return the host time in ms of each scan. '''
+        millis = np.asarray(millis, dtype=float)
+        if not len(millis):
+            return millis
+        if arrival is None:
+            arrival = arrival_ms() or 1000*time.time()
+        if self.last_millis is not None and millis[0] < self.last_millis:
+            logging.info(f'device millis went back from {self.last_millis:.0f} to {millis[0]:.0f}, '
+                'restarting the clock estimate')
+            self.resets += 1
+            self.clear()
+        deltas = arrival - millis
+        smallest = int(np.argmin(deltas))
+        if self.window_min is None or deltas[smallest] < self.window_min[1]:
+            self.window_min = (millis[smallest], deltas[smallest])
+        if self.window_start is None:
+            self.window_start = millis[0]
+        if millis[-1] - self.window_start >= self.window_ms:
+            # the window has ended, its smallest delta is added to the line
+            self.minima.append(self.window_min)
+            self.fit()
+            self.window_start, self.window_min = millis[-1], None
+        host_ms = millis + self.offset(millis)
+        # time the newest scan took to arrive, more than the fastest transport
+        transport_ms = arrival - host_ms[-1]
+        self.transport.add(max(transport_ms, 0.0) / 1000)
+        self.jitter.update(transport_ms)
+        self.last_millis = millis[-1]
+        self.blocks += 1
+        return host_ms
@@ -0,0 +1,284 @@
+'''
+Compressed recording format, written by files.py with record_format 'pack', 'zlib' or 'lzma'.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Scans are written in chunks of up to CHUNK_SCANS scans, or CHUNK_MS of device millis.
+In a chunk, each column, millis, counter, acc_x, acc_y and acc_z, is stored as its first value
+and the differences between neighbouring values. millis steps by about 80, counter by 1 and the
+accelerometer axes change slowly, so the differences are small. They are zigzag encoded,
+0, -1, 1, -2, 2 ... to 0, 1, 2, 3, 4 ..., so that small negative differences are small numbers.
+Then, by codec:
+pack - each column is bit packed, at the number of bits its largest difference needs
+zlib, lzma - each column is stored in the smallest of 1, 2, 4 or 8 bytes that fits, and the chunk compressed
+
+Compression is done by the Recorder's writer thread, so the serial reader does not wait for it.
+The Recorder also ends a chunk at its flush deadline, so at most files.FLUSH_INTERVAL s of scans
+are lost if it stops without closing the file. At low scan rates the chunks are then shorter
+than CHUNK_SCANS, and compress less well.
+
+File, little endian:
+header: magic b'HSCMP\x00\r\n', uint16 version, uint16 header size, uint16 chunk header size,
+uint16 flags, unused, 0, float64 host time.time() when the recording was started, 8 spare bytes
+chunks: magic b'HSCK', uint8 codec, 3 spare bytes, uint64 number of the chunk's first scan in the recording,
+uint32 number of scans, uint32 payload size in bytes, then the payload
+payload before zlib or lzma: for each column an int64 first value and a uint8 number of bits
+per difference, then the differences of each column
+
+A partly written last chunk, e.g. after a crash, is ignored by the reader.
+read_chunks decompresses one chunk at a time, so replay does not decompress the whole recording first.
+
+Convert a text or binary recording, from the scripts directory:
+python compressed_recording.py slow_swing_handshake_data.txt --codec zlib
+creates slow_swing_handshake_data.hsz
+
+@author: matthew oppenheim
+last update: 2025_05_19
+'''
+import accelerometer_data_structure as ads
+import argparse
+import binary_recording
+import logging
+import lzma
+import numpy as np
+import os
+import struct
+import time
+import zlib
+
+CHUNK_HEADER_FORMAT = '<4sB3xQII'
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER_FORMAT)
+CHUNK_MAGIC = b'HSCK'
+CHUNK_MS = 60000 # device millis covered by one chunk at most
+CHUNK_SCANS = 4096 # scans in one chunk at most
+CODECS = ('pack', 'zlib', 'lzma')
+COLUMN_HEADER_FORMAT = '<qB'
+COLUMN_HEADER_SIZE = struct.calcsize(COLUMN_HEADER_FORMAT)
+EXTENSION = '.hsz'
+HEADER_FORMAT = '<8sHHHHd8x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'HSCMP\x00\r\n'
+VERSION = 1
+ZLIB_LEVEL = 6
+
+
+class ChunkEncoder():
+    ''' Collect scans into chunks and encode each chunk when it is complete. '''
+
+    def __init__(self, codec='pack', first_scan=0, chunk_scans=CHUNK_SCANS, chunk_ms=CHUNK_MS):
+        if codec not in CODECS:
+            raise ValueError(f'codec must be one of {CODECS}, not {codec}')
+        self.codec = codec
+        self.first_scan = first_scan # number of the first scan of the chunk being collected
+        self.chunk_scans = chunk_scans
+        self.chunk_ms = chunk_ms
+        self.chunk_start_millis = None
+        self.pending = [] # blocks of scans in the chunk being collected
+        self.num_pending = 0
+
+
+    def add(self, scans):
+        ''' Add a block of scans, an array of ads.acc_scan_dtype.
+        Return a list of the chunks completed, as bytes, and an array of the position in that list
+        of the chunk each scan is in. Scans in the chunk still being collected are at len(list). '''
+        chunks = []
+        chunk_numbers = np.zeros(len(scans), dtype=np.int64)
+        start = 0
+        while start < len(scans):
+            if not self.num_pending:
+                self.chunk_start_millis = int(scans['millis'][start])
+            end = min(start + self.chunk_scans - self.num_pending, len(scans))
+            late = np.flatnonzero(scans['millis'][start:end] - self.chunk_start_millis >= self.chunk_ms)
+            if len(late):
+                end = start + int(late[0])
+            self.pending.append(scans[start:end])
+            self.num_pending += end - start
+            chunk_numbers[start:end] = len(chunks)
+            if end < len(scans) or self.num_pending >= self.chunk_scans:
+                chunks.append(self.end_chunk())
+            start = end
+        return chunks, chunk_numbers
+
+
+    def end_chunk(self):
+        ''' Return the scans collected so far as an encoded chunk, b'' if there are none. '''
+        if not self.num_pending:
+            return b''
+        chunk = encode_chunk(np.concatenate(self.pending), self.codec, self.first_scan)
+        self.first_scan += self.num_pending
+        self.pending = []
+        self.num_pending = 0
+        return chunk
+
+
+def byte_dtype(bits):
+    ''' Return the smallest little endian unsigned integer dtype holding bits bits. '''
+    for size in (1, 2, 4):
+        if bits <= 8*size:
+            return np.dtype(f'<u{size}')
+    return np.dtype('<u8')
+
+
+def convert_recording(input_path, output_path=None, codec='pack', chunk_scans=CHUNK_SCANS):
+    ''' Convert a text or binary recording made by files.py to a compressed recording, return its file path.
+    The input is read a block at a time, so large recordings do not have to fit in memory. '''
+    # imported here as recording_index imports this module
+    from recording_index import read_text_scans
+    output_path = output_path or os.path.splitext(input_path)[0] + EXTENSION
+    if binary_recording.is_binary_recording(input_path):
+        recording = binary_recording.BinaryRecording(input_path)
+        start_time = recording.start_time
+        blocks = (recording.scans[start:start+CHUNK_SCANS] for start in range(0, len(recording), CHUNK_SCANS))
+    else:
+        start_time = os.path.getmtime(input_path)
+        blocks = read_text_scans(input_path)
+    encoder = ChunkEncoder(codec, chunk_scans=chunk_scans)
+    with open(output_path, 'wb') as file_object:
+        write_header(file_object, start_time)
+        for block in blocks:
+            chunks, chunk_numbers = encoder.add(block)
+            file_object.write(b''.join(chunks))
+        file_object.write(encoder.end_chunk())
+    return output_path
+
+
+def decode_chunk(codec, num_scans, payload):
+    ''' Return the num_scans scans in a chunk's payload as an array of ads.acc_scan_dtype. '''
+    if codec == 'zlib':
+        payload = zlib.decompress(payload)
+    elif codec == 'lzma':
+        payload = lzma.decompress(payload)
+    scans = np.zeros(num_scans, dtype=ads.acc_scan_dtype)
+    num_differences = num_scans - 1
+    position = len(ads.acc_data_headers) * COLUMN_HEADER_SIZE
+    for number, header in enumerate(ads.acc_data_headers):
+        first_value, bits = struct.unpack_from(COLUMN_HEADER_FORMAT, payload, number * COLUMN_HEADER_SIZE)
+        if codec == 'pack':
+            size = -(-num_differences * bits // 8)
+            differences = unpack_bits(payload[position:position+size], num_differences, bits)
+        else:
+            dtype = byte_dtype(bits)
+            size = num_differences * dtype.itemsize
+            differences = np.frombuffer(payload, dtype, num_differences, position).astype(np.uint64)
+        position += size
+        values = np.empty(num_scans, dtype=np.int64)
+        values[0] = 0
+        np.cumsum(unzigzag(differences), out=values[1:])
+        scans[header] = values + first_value
+    return scans
+
+
+def encode_chunk(scans, codec, first_scan):
+    ''' Return scans, an array of ads.acc_scan_dtype, as a chunk: the chunk header and the encoded payload. '''
+    column_headers = []
+    columns = []
+    for header in ads.acc_data_headers:
+        values = scans[header].astype(np.int64)
+        differences = zigzag(np.diff(values))
+        bits = int(differences.max()).bit_length() if len(differences) else 0
+        column_headers.append(struct.pack(COLUMN_HEADER_FORMAT, int(values[0]), bits))
+        if codec == 'pack':
+            columns.append(pack_bits(differences, bits))
+        else:
+            columns.append(differences.astype(byte_dtype(bits)).tobytes())
+    payload = b''.join(column_headers + columns)
+    if codec == 'zlib':
+        payload = zlib.compress(payload, ZLIB_LEVEL)
+    elif codec == 'lzma':
+        payload = lzma.compress(payload)
+    return struct.pack(CHUNK_HEADER_FORMAT, CHUNK_MAGIC, CODECS.index(codec), first_scan, len(scans),
+        len(payload)) + payload
+
+
+def is_compressed_recording(file_path):
+    ''' Return True if file_path starts with the compressed recording magic bytes. '''
+    with open(file_path, 'rb') as file_object:
+        return file_object.read(len(MAGIC)) == MAGIC
+
+
+def pack_bits(values, bits):
+    ''' Return the low bits bits of each of values, an array of np.uint64, packed into bytes. '''
+    if bits == 0:
+        return b''
+    bit_array = ((values[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)).astype(np.uint8)
+    return np.packbits(bit_array, bitorder='little').tobytes()
+
+
+def read_chunk_records(file_path, offset=None):
+    ''' Yield (byte offset, number of the first scan, number of scans, codec, payload) for each complete chunk,
+    from the chunk at byte offset, or from the first chunk. '''
+    with open(file_path, 'rb') as file_object:
+        header = read_header(file_object)
+        file_object.seek(header['header_size'] if offset is None else offset)
+        while True:
+            chunk_offset = file_object.tell()
+            data = file_object.read(CHUNK_HEADER_SIZE)
+            if len(data) < CHUNK_HEADER_SIZE:
+                return
+            magic, codec, first_scan, num_scans, payload_size = struct.unpack(CHUNK_HEADER_FORMAT, data)
+            if magic != CHUNK_MAGIC or codec >= len(CODECS):
+                logging.warning(f'{file_path}: no chunk found at byte {chunk_offset}')
+                return
+            payload = file_object.read(payload_size)
+            if len(payload) < payload_size:
+                return
+            yield chunk_offset, first_scan, num_scans, CODECS[codec], payload
+
+
+def read_chunks(file_path, offset=None):
+    ''' Yield the scans of each chunk as an array of ads.acc_scan_dtype, decompressing one chunk at a time. '''
+    for chunk_offset, first_scan, num_scans, codec, payload in read_chunk_records(file_path, offset):
+        yield decode_chunk(codec, num_scans, payload)
+
+
+def read_header(file_object):
+    ''' Read and check the header at the start of file_object, return it as a dictionary. '''
+    data = file_object.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE or not data.startswith(MAGIC):
+        raise ValueError(f'{getattr(file_object, "name", file_object)} is not a compressed recording')
+    magic, version, header_size, chunk_header_size, flags, start_time = struct.unpack(HEADER_FORMAT, data)
+    if version > VERSION or chunk_header_size != CHUNK_HEADER_SIZE:
+        raise ValueError(f'unsupported compressed recording version {version}, chunk header size {chunk_header_size}')
+    return {'version': version, 'header_size': header_size, 'chunk_header_size': chunk_header_size,
+        'flags': flags, 'start_time': start_time}
+
+
+def read_recording(file_path):
+    ''' Return all the scans in a compressed recording as an array of ads.acc_scan_dtype. '''
+    chunks = list(read_chunks(file_path))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=ads.acc_scan_dtype)
+
+
+def unpack_bits(data, count, bits):
+    ''' Return count values of bits bits packed by pack_bits as an array of np.uint64. '''
+    if bits == 0:
+        return np.zeros(count, dtype=np.uint64)
+    bit_array = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count*bits, bitorder='little')
+    bit_array = bit_array.reshape(count, bits).astype(np.uint64)
+    return (bit_array << np.arange(bits, dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+
+
+def unzigzag(values):
+    ''' Return zigzag encoded values, an array of np.uint64, as np.int64. '''
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def write_header(file_object, start_time=None):
+    ''' Write a header to file_object, start_time defaults to now. '''
+    start_time = time.time() if start_time is None else start_time
+    file_object.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE, CHUNK_HEADER_SIZE, 0, start_time))
+
+
+def zigzag(values):
+    ''' Return values, an array of np.int64, zigzag encoded as np.uint64. '''
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='convert a text or binary recording to a compressed recording')
+    arg_parser.add_argument('input_file')
+    arg_parser.add_argument('output_file', nargs='?', help=f'defaults to input_file with a {EXTENSION} extension')
+    arg_parser.add_argument('--codec', choices=CODECS, default='pack')
+    args = arg_parser.parse_args()
+    output_path = convert_recording(args.input_file, args.output_file, args.codec)
+    print(f'wrote {len(read_recording(output_path))} scans to {output_path}, {os.path.getsize(output_path)} bytes '
+        f'from {os.path.getsize(args.input_file)} bytes')
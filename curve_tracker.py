@@ -0,0 +1,88 @@
+'''
+Dirty tracking for the graph curves, so that setData is only called when a curve's data has changed.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The graph timer already skips a tick if the snapshot generation has not changed, or if
+plotting is paused. Each CurveTracker keeps the generation it last drew, and skips curves
+that are hidden, as setData and the repaint that follows cost milliseconds.
+While streaming every column changes with each generation, so the data is not compared.
+
+setData is given the tracker's own copy of the column, not the snapshot buffer, which
+the SnapshotBuffer writer reuses once the graph thread has moved on to the next snapshot.
+
+By default the x values are the sample numbers. With x_column, e.g. 'host_ms', they are taken
+from that column, less x_origin and times x_scale, so that the curves of several watches
+share a time axis.
+
+RenderCounter counts timer ticks, ticks with at least one redraw, skipped ticks and
+setData calls, for the graph rate written to the textedit.
+
+@author: matthew oppenheim
+last update: 2025_05_23
+'''
+import numpy as np
+
+
+class CurveTracker():
+    ''' Calls curve.setData for one column, only for a new snapshot generation and a visible curve. '''
+
+    def __init__(self, curve, column, length, x_column=None, x_origin=0.0, x_scale=1.0):
+        self.curve = curve
+        self.column = column
+        self.last_data = np.full(length, np.nan)
+        self.generation = None # snapshot generation last drawn
+        self.x_column = x_column
+        self.x_origin = x_origin
+        self.x_scale = x_scale
+        # fixed x values, so that setData does not create them each time, or the copied x_column
+        self.x_values = np.arange(length) if x_column is None else np.full(length, np.nan)
+
+
+    def update(self, columns, generation=None):
+        ''' Redraw the curve from its column in columns, the snapshot of generation, return True if it was redrawn.
+        Hidden curves and a generation that has already been drawn are skipped. '''
+        if generation is not None and generation == self.generation:
+            return False
+        if not self.curve.isVisible():
+            # drawn when it is shown and the next generation arrives
+            self.generation = None
+            return False
+        np.copyto(self.last_data, columns[self.column])
+        if self.x_column is not None:
+            np.subtract(columns[self.x_column], self.x_origin, out=self.x_values)
+            self.x_values *= self.x_scale
+        self.curve.setData(self.x_values, self.last_data)
+        self.generation = generation
+        return True
+
+
+class RenderCounter():
+    ''' Count redraws and skipped graph timer ticks. '''
+
+    def __init__(self):
+        self.reset_interval()
+
+
+    def add_tick(self, curves_redrawn):
+        ''' Count a timer tick that redrew curves_redrawn curves, 0 for a skipped tick. '''
+        self.ticks += 1
+        if curves_redrawn:
+            self.redraws += 1
+            self.curves_redrawn += curves_redrawn
+        else:
+            self.skipped += 1
+
+
+    def rates(self, interval):
+        ''' Return a dictionary of tick, redraw, skipped and setData rates per s over interval in s. '''
+        if interval <= 0:
+            return None
+        return {'ticks': self.ticks / interval, 'redraws': self.redraws / interval,
+            'skipped': self.skipped / interval, 'curves': self.curves_redrawn / interval}
+
+
+    def reset_interval(self):
+        self.ticks = 0
+        self.redraws = 0
+        self.skipped = 0
+        self.curves_redrawn = 0
@@ -1,19 +1,28 @@
 ''' Create and update a data array.
 Part of the handshake project: mattoppenheim.com/handshake
-Sensor data is stored in a pandas dataframe.
-New scans are added to the end of the dataframe.
-Old scans are removed from the start of the array.
+Sensor data is stored in a fixed size numpy ring buffer, see ring_buffer.py.
+New scans are added to the end of the buffer.
+Old scans are overwritten once the buffer is full.
 Sensor data in stored in columns 0-x.
-Extra columns of processed data are added beyond row x
-The pandas dataframe is used by a graph display class to create plots.
+Extra columns of processed data are added beyond column x
+The buffer columns are used by a graph display class to create plots.
+A pandas dataframe is only created on demand, using the df property.
+publish_snapshot copies the columns to plot into a SnapshotBuffer, see snapshot.py,
+so the graph thread gets a consistent set of columns without reading the ring buffer.
+The host_ms column holds the host clock time of each scan, from the device millis and a
+clock_sync.ClockEstimator, used to line up the plots of several watches and to find how old plotted scans are.
 
 Author: Matthew Oppenheim
-Last update: 2025_04_14
+Last update: 2025_05_24
 '''
 import accelerometer_data_structure as ads
+from clock_sync import ClockEstimator
+import latency
 import logging
-import numpy as np # using np.nan to initialise dataframe
-import pandas as pd
+import numpy as np
+from ring_buffer import RingBuffer
+from rolling_stats import RollingStats
+from snapshot import SnapshotBuffer
 
 # as this class does not run in the main thread, __ini__ definition of logging does not work
 logging.basicConfig(level=logging.DEBUG, format='%(message)s')
@@ -26,61 +35,84 @@ class DataFrame():
   # MAX_DATAFRAME_ROWS = 300 # data_array size
   # *** FOR TESTING
   MAX_DATAFRAME_ROWS = 200 # data_array size
-  PROCESSING_HEADERS = ['acc_abs', 'pitch', 'roll', 'yaw', 'y_rolling_mean', 'y_exceeded_mean']
+  PROCESSING_HEADERS = ['acc_abs', 'pitch', 'roll', 'yaw', 'y_rolling_mean', 'y_exceeded_mean', 'host_ms']
+  PLOT_HEADERS = ['millis', 'acc_x', 'acc_y', 'acc_z', 'acc_abs', 'pitch', 'roll', 'yaw', 'y_exceeded_mean',
+    'host_ms'] # columns in snapshots
 
-  def __init__(self):
-    # create an empty array for storing data
+  def __init__(self, max_rows=MAX_DATAFRAME_ROWS, rolling_windows=(ROLLING_WINDOW_LENGTH,), buffer=None):
     self.df_col_names = ads.acc_data_headers + self.PROCESSING_HEADERS
-    # initialise a dataframe filled with 0's so that graphs of column data start full-size
-    self.df = self.initialise_df(self.df_col_names, self.MAX_DATAFRAME_ROWS)
-    logging.debug(f'self.df:\n{self.df}')
+    # initialise a buffer filled with NaN's so that graphs of column data start full-size
+    # a buffer can be supplied, e.g. a SharedRingBuffer in multi-process mode
+    self.buffer = buffer if buffer is not None else RingBuffer(self.df_col_names, max_rows)
+    # processing columns are zero until they are calculated
+    self.empty_processing = [0] * len(self.PROCESSING_HEADERS)
+    # incremental rolling statistics of acc_y, per sample cost does not depend on max_rows
+    self.y_stats = RollingStats(set(rolling_windows) | {ROLLING_WINDOW_LENGTH})
+    # consistent copies of the plotted columns, handed to the graph thread
+    self.snapshot = SnapshotBuffer(self.PLOT_HEADERS, max_rows)
+    # host - device clock offset and drift, and the transport latency
+    self.clock = ClockEstimator()
 
 
-  def add_means(self, df):
-    ''' Update dataframe rolling means and differences columns. '''
-    df['y_rolling_mean'] = df.rolling(ROLLING_WINDOW_LENGTH)['acc_y'].mean().astype(float)
-    df['y_exceeded_mean'] = 2*np.abs(df['acc_y'] - df['y_rolling_mean']).astype(float)
-    return df
+  def add_means(self, acc_y):
+    ''' Update rolling mean and difference columns for the newest scans, whose acc_y values are acc_y.
+    acc_y is taken from the new block, not the buffer, so a block longer than the buffer is all counted. '''
+    y_rolling_mean = self.y_stats.extend(acc_y, window=ROLLING_WINDOW_LENGTH)
+    y_exceeded_mean = 2*np.abs(acc_y - y_rolling_mean)
+    self.buffer.set_latest('y_rolling_mean', y_rolling_mean)
+    self.buffer.set_latest('y_exceeded_mean', y_exceeded_mean)
 
 
-  def create_acc_scan_df(self, acc_data):
-    ''' Create a pandas dataframe row representing accelerometer sensor data. '''
+  def create_acc_scan_block(self, acc_scans):
+    ''' Create a (columns, scans) float array of accelerometer sensor data and processing columns.
+    acc_scans is a numpy structured array of ads.acc_scan_dtype. '''
+    block = np.zeros((len(self.df_col_names), len(acc_scans)))
+    for index, header in enumerate(ads.acc_data_headers):
+      block[index] = acc_scans[header]
+    # processing columns are initialised to 0
+    return block
+
+
+  def create_acc_scan_row(self, acc_data):
+    ''' Create a list of floats representing accelerometer sensor data and processing columns. '''
     # acc_data_structure is a named tuple described in accelerometer_data_structure.py
-    millis = acc_data.millis
-    counter = acc_data.counter
-    acc_x = acc_data.acc_x
-    acc_y = acc_data.acc_y
-    acc_z = acc_data.acc_z
-    scan_data = [millis, counter, acc_x, acc_y, acc_z] # ads.acc_data_structure
-    df_single_scan = pd.DataFrame([scan_data], columns=ads.acc_data_headers, dtype=float)
-    # need to add extra columns and intialise to 0
-    df_single_scan[self.PROCESSING_HEADERS] = 0
-    return df_single_scan
-  
-  
-  def initialise_df(self, col_names, num_rows):
-    ''' Create a pandas dataframe to store ads data. '''
-    row_range = range(num_rows)
-    # create a dataframe with 0's, number rows = num_rows
-    df = pd.DataFrame(np.nan, index=row_range, columns=col_names)              
-    return df
-
-
-# I've read that this is inefficient timewise - see README.md for timings
+    scan_data = [float(acc_data.millis), float(acc_data.counter), float(acc_data.acc_x),
+      float(acc_data.acc_y), float(acc_data.acc_z)]
+    # processing columns are initialised to 0
+    return scan_data + self.empty_processing
+
+
+  @property
+  def df(self):
+    ''' Return a pandas dataframe of the stored data, oldest scan first. '''
+    return self.buffer.to_dataframe()
+
+
+  def publish_snapshot(self):
+    ''' Copy the plotted columns into a new snapshot for the graph thread, return its generation. '''
+    generation = self.snapshot.publish(self.buffer.columns(self.PLOT_HEADERS))
+    latency.published()
+    return generation
+
+
   def update_dataframe(self, acc_scan_to_add):
-    ''' Shift all rows in self.df down one row and insert df_to_add as last row.  '''
-    # convert acc_scan_to_add to a dataframe
-    df_to_add = self.create_acc_scan_df(acc_scan_to_add)
-    # have to convert df_to_add to a list of lists then extract first element
-    df_to_add_as_list = df_to_add.values.tolist()[0] 
-    # shift all the rows in the dataframe up 1 - oldest row is removed this way
-    self.df = self.df.shift(1)
-    # first row is now all NaN's. Replace this with df_to_add_as_list
-    self.df.loc[0,:] = df_to_add_as_list # row 0, all columns = df_to_add_as_list
-    #logging.debug(f'\nself.df.head():\n{self.df.head()}')
-    self.df = self.add_means(self.df)
-    return self.df
-    
+    ''' Append acc_scan_to_add to the ring buffer, overwriting the oldest scans when full.
+    acc_scan_to_add is a block of scans as a numpy structured array, or a single acc_data_structure.
+    The host_ms column is set from the millis and the arrival time marked with clock_sync.mark_arrival. '''
+    if isinstance(acc_scan_to_add, np.ndarray):
+      acc_y = acc_scan_to_add['acc_y'].astype(float)
+      millis = acc_scan_to_add['millis']
+      self.buffer.extend(self.create_acc_scan_block(acc_scan_to_add))
+    else:
+      acc_y = np.array([float(acc_scan_to_add.acc_y)])
+      millis = np.array([float(acc_scan_to_add.millis)])
+      self.buffer.append(self.create_acc_scan_row(acc_scan_to_add))
+    if len(acc_y):
+      self.add_means(acc_y)
+      self.buffer.set_latest('host_ms', self.clock.update(millis))
+    latency.record('dataframe')
+    return self.buffer
+
 
 if __name__ == '__main__':
-   data_array = DataFrame()
\ No newline at end of file
+   data_array = DataFrame()
@@ -9,4 +9,6 @@ MAIN_SENDER = 'main_sender'
 MAIN_SIGNAL = 'main_signal'
 
 PARSER_SENDER = 'parser_sender'
-PARSER_SIGNAL = 'parser_signal'
\ No newline at end of file
+PARSER_SIGNAL = 'parser_signal'
+# blocks of scans on a uniform time grid, sent from the parser's sender, see resampler.py
+RESAMPLED_SIGNAL = 'resampled_signal'
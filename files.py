@@ -3,16 +3,43 @@
 @author: matthew oppenheim
 Handles creating and writing data to a file.
 Written to run in a thread.
-Communication to the thread uses a queue.
+Communication to the thread uses a queue: True starts recording, False stops it
+and 'stop' closes the file and ends the thread.
 
-last update: 2025_04_30
+Blocks of parsed scans are handed to a Recorder through a bounded queue, so writing
+to file does not hold up the serial reader. If the queue is full the block is dropped and counted.
+The Recorder's writer thread keeps one file open and writes each scan as an acc_data_structure line,
+or, with record_format='binary', as a fixed width record described in binary_recording.py.
+With record_format 'pack', 'zlib' or 'lzma' the scans are delta encoded and compressed in chunks,
+see compressed_recording.py. This is done on the writer thread too. A chunk that is still being
+collected is ended and written at the flush deadline, so no more than FLUSH_INTERVAL s of scans
+are held in memory in any format.
+
+Writes are flushed in batches, when FLUSH_BYTES have been written or FLUSH_INTERVAL s
+after the first unflushed write. The fsync policy sets when the data is forced to disk:
+'never' - left to the operating system
+'flush' - at every batched flush
+'close' - when a file is closed, at rotation or stop
+Files are rotated, i.e. a new file is started, after max_bytes bytes or max_seconds s.
+
+Recorder.stats() returns the write backlog, drops, bytes written, flushes and rotations.
+
+A time index, see recording_index.py, is written next to each recording as it is written,
+with the host time each block arrived at.
+
+last update: 2025_05_19
 '''
+import accelerometer_data_structure as ads
+import binary_recording
+import block_dispatcher
+import compressed_recording
 import dispatcher_signals as ds
 import datetime
 import logging
 import os
-from pydispatch import dispatcher
+import numpy as np
 import queue # for inter-thread communication
+import recording_index
 import threading
 import time
 
@@ -20,38 +47,63 @@ import time
 # as this class does not run in the main thread, __ini__ definition of logging does not work
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+FLUSH_BYTES = 64 * 1024 # flush when this many bytes have been written since the last flush
+FLUSH_INTERVAL = 1.0 # time in s after the first unflushed write before flushing
+FSYNC_POLICIES = ('never', 'flush', 'close')
+RECORD_FORMATS = ('text', 'binary') + compressed_recording.CODECS
+QUEUE_SIZE = 256 # blocks held for the writer thread before blocks are dropped
+# one recorded scan, the same text as str(ads.acc_data_structure(...)) for integer values
+RECORD_LINE = 'acc_scan(millis={}, counter={}, acc_x={}, acc_y={}, acc_z={})\n'
+
 
 class Files():
 
     FILENAME = 'handshake_data.txt' # part of saved data's filename
-    
-    def __init__(self, queue_in):
-        # set up a dispatcher to receive data from the sensor data parser
-        dispatcher.connect(self.dispatcher_receive_data,signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+
+    def __init__(self, queue_in, save_dir=None, fsync='close', max_bytes=None, max_seconds=None, record_format='text',
+            sender=ds.PARSER_SENDER, device=None):
+        ''' Record the blocks published by sender. device, e.g. 'watch1', is added to the filename
+        when several watches are recorded at once. '''
         self.overwrite = False
+        self.device = device
         self.save_data = False
         self.filepath = None # filepath for saved data
         self.queue_in = queue_in # for inter-thread communication from main.py
+        self.save_dir = save_dir or os.path.dirname(__file__) # by default use this script's directory to save data
+        self.record_format = record_format
+        self.recorder = Recorder(self.create_filepath, fsync=fsync, max_bytes=max_bytes, max_seconds=max_seconds,
+            record_format=record_format)
+        # set up a dispatcher to receive data from the sensor data parser
+        # the recorder's queue is the handoff to the writer thread, so the receiver is not queued
+        block_dispatcher.connect(self.dispatcher_receive_data, signal=ds.PARSER_SIGNAL, sender=sender)
         self.main()
 
-    
+
     def main(self):
+        ''' Handle messages from main.py until a 'stop' message. '''
         while(1):
             # look for a message sent from main.py to the thread this object runs in
-            try:
-                message = self.queue_in.get()
-                self.handle_queue_message(message)
-            except AttributeError as e:
-                pass
-            time.sleep(0.1)
+            # get() blocks until there is a message
+            message = self.queue_in.get()
+            if message == 'stop':
+                break
+            self.handle_queue_message(message)
+        block_dispatcher.disconnect(self.dispatcher_receive_data, ds.PARSER_SIGNAL)
+        self.recorder.stop()
+        logging.info(f'recorder stats: {self.recorder.stats()}')
 
 
-    def create_filepath(self):
-        ''' Create a date and time stamped filepath. '''
+    def create_filepath(self, part=0):
+        ''' Create a date and time stamped filepath, part is the number of earlier rotated files. '''
         datestring = datetime.datetime.now().strftime("%Y_%m_%d:%H:%M:%S")
-        filename = f'{datestring}_{self.FILENAME}'
-        save_dir = os.path.dirname(__file__) # use this script's directory to save data
-        filepath = os.path.join(save_dir, filename)
+        if self.device:
+            datestring = f'{datestring}_{self.device}'
+        filename = f'{datestring}_{self.FILENAME}' if not part else f'{datestring}_part{part}_{self.FILENAME}'
+        if self.record_format == 'binary':
+            filename = os.path.splitext(filename)[0] + binary_recording.EXTENSION
+        elif self.record_format in compressed_recording.CODECS:
+            filename = os.path.splitext(filename)[0] + compressed_recording.EXTENSION
+        filepath = os.path.join(self.save_dir, filename)
         logging.info(f'created filepath: {filepath}')
         return filepath
 
@@ -59,26 +111,30 @@ class Files():
     # must use keyword 'message' in dispatcher setup
     def dispatcher_receive_data(self, message):
         ''' Received data from dispatcher set up in serial_connection.  '''
-        if not self.filepath and self.save_data: 
-            logging.error('*** no self.filepath')
-        # save to file if the filepath exists and self.save_data is True
-        if self.filepath and self.save_data:
-            self.write_to_file(self.filepath, message)
-    
+        # save to file if self.save_data is True, the block is written by the recorder's thread
+        if self.save_data:
+            self.recorder.put(message)
+
 
     def handle_queue_message(self, message):
         ''' Handle data received by inter-thread communication queue. '''
         # message shoule only be what the status of self.save_data should be set to
         logging.debug(f'\n*** received queue message {message}\n')
-        if message in [True, False]:
-            self.save_data = message
-        if self.save_data:
+        if message not in [True, False]:
+            return
+        if message and not self.save_data:
             if not(self.filepath):
                 self.filepath = self.create_filepath()
                 self.initialise_file(self.filepath)
-         
+            # recording again after a pause appends to the same file, or to the newest rotated file
+            self.recorder.start(self.recorder.filepath or self.filepath)
+        elif not message and self.save_data:
+            # cleared first, so that no block is put on the queue of a recorder that is stopping
+            self.save_data = False
+            self.recorder.stop()
+        self.save_data = message
+
 
-    
     def initialise_file(self, file_path):
         ''' Create a blank file. '''
         if os.path.exists(file_path):
@@ -87,12 +143,218 @@ class Files():
         file_object.close()
 
 
-    def write_to_file(self, file_path, data):
-        ''' Write <data> to <filepath>. '''
-        file_object = open(file_path,'a')
-        file_object.write(data.__str__())
-        file_object.write('\n') # new line
+class Recorder():
+    ''' Write blocks of scans to file on a writer thread, with batched flushes and file rotation. '''
+
+    def __init__(self, create_filepath, queue_size=QUEUE_SIZE, flush_bytes=FLUSH_BYTES, flush_interval=FLUSH_INTERVAL,
+            fsync='close', max_bytes=None, max_seconds=None, record_format='text', index_stride=recording_index.STRIDE):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'fsync must be one of {FSYNC_POLICIES}, not {fsync}')
+        if record_format not in RECORD_FORMATS:
+            raise ValueError(f'record_format must be one of {RECORD_FORMATS}, not {record_format}')
+        self.record_format = record_format
+        self.index_stride = index_stride
+        self.index = None # RecordingIndex of the open file
+        self.encoder = None # compressed_recording.ChunkEncoder for a compressed recording
+        self.create_filepath = create_filepath # called with the part number to name rotated files
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.file_object = None
+        self.filepath = None
+        self.file_bytes = 0 # size of the open file
+        self.file_start = None # time.monotonic() when the open file was started
+        self.unflushed_bytes = 0
+        self.flush_deadline = None # time.monotonic() to flush by, None if nothing is unflushed
+        self.thread = None
+        self.part = 0 # number of files started by rotation
+        self.scans_queued = 0
+        self.scans_written = 0
+        self.blocks_dropped = 0
+        self.scans_dropped = 0
+        self.bytes_written = 0
+        self.flushes = 0
+        self.fsyncs = 0
+
+
+    def close_file(self):
+        ''' Flush and close the open file. '''
+        if self.file_object is None:
+            return
+        if self.encoder is not None:
+            self.write_data(self.encoder.end_chunk())
+            self.encoder = None
+        self.flush(self.fsync != 'never')
+        self.file_object.close()
+        self.file_object = None
+        self.index.close()
+        self.index = None
+
+
+    def flush(self, sync=False):
+        ''' Flush the written data to the operating system, and to disk if sync is True. '''
+        self.file_object.flush()
+        self.index.flush()
+        self.unflushed_bytes = 0
+        self.flush_deadline = None
+        self.flushes += 1
+        if sync:
+            os.fsync(self.file_object.fileno())
+            self.fsyncs += 1
+
+
+    def open_file(self, filepath):
+        ''' Open filepath for appending, this handle is kept until rotation or stop.
+        A header is written to a new or empty binary or compressed recording. '''
+        self.filepath = filepath
+        self.file_object = open(filepath, 'ab')
+        self.file_bytes = self.file_object.tell()
+        if self.record_format == 'binary':
+            self.truncate_partial_record()
+        if self.record_format != 'text' and self.file_bytes == 0:
+            if self.record_format == 'binary':
+                binary_recording.write_header(self.file_object)
+            else:
+                compressed_recording.write_header(self.file_object)
+            self.file_bytes = self.file_object.tell()
+            self.file_object.flush()
+        self.file_start = time.monotonic()
+        self.unflushed_bytes = 0
+        self.flush_deadline = None
+        # loading the index also extends it if the file was written without one
+        self.index = recording_index.RecordingIndex(filepath, self.index_stride)
+        if self.record_format in compressed_recording.CODECS:
+            self.encoder = compressed_recording.ChunkEncoder(self.record_format, first_scan=self.index.num_scans)
+
+
+    def put(self, block, host_time=None):
+        ''' Queue a block of scans for writing, without waiting. A block is dropped if the queue is full.
+        host_time is the time.time() the block arrived, now by default. '''
+        # dropped scans are counted as queued too, so the backlog is queued - written - dropped
+        self.scans_queued += len(block)
+        try:
+            self.queue.put_nowait((block, time.time() if host_time is None else host_time))
+        except queue.Full:
+            self.blocks_dropped += 1
+            self.scans_dropped += len(block)
+
+
+    def rotate_if_due(self):
+        ''' Close the file and start a new one if it has reached max_bytes or max_seconds. '''
+        if (self.max_bytes and self.file_bytes >= self.max_bytes) or \
+                (self.max_seconds and time.monotonic() - self.file_start >= self.max_seconds):
+            self.close_file()
+            self.part += 1
+            self.open_file(self.create_filepath(self.part))
+            logging.info(f'recording rotated to {self.filepath}')
+
+
+    def run(self):
+        ''' Writer thread: write queued blocks, flush in batches, stop at a None block. '''
+        while True:
+            timeout = None if self.flush_deadline is None else max(0, self.flush_deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # no new data before the flush deadline
+                if self.encoder is not None:
+                    self.write_data(self.encoder.end_chunk())
+                self.flush(self.fsync == 'flush')
+                continue
+            if item is None:
+                break
+            block, host_time = item
+            try:
+                self.rotate_if_due()
+                self.write_block(block, host_time)
+            except OSError as e:
+                logging.error(f'recorder write error: {e}')
+                self.blocks_dropped += 1
+                self.scans_dropped += len(block)
+        self.close_file()
+
+
+    def start(self, filepath):
+        ''' Open filepath and start the writer thread. '''
+        if self.thread is not None:
+            return
+        self.open_file(filepath)
+        self.thread = threading.Thread(target=self.run, name='recorder', daemon=True)
+        self.thread.start()
+
+
+    def stats(self):
+        ''' Return a dictionary of the write backlog, drops and write counters. '''
+        return {'backlog_blocks': self.queue.qsize(), 'backlog_scans': self.scans_queued - self.scans_written - self.scans_dropped,
+            'blocks_dropped': self.blocks_dropped, 'scans_dropped': self.scans_dropped,
+            'scans_written': self.scans_written, 'bytes_written': self.bytes_written, 'flushes': self.flushes,
+            'fsyncs': self.fsyncs, 'files': self.part + 1, 'filepath': self.filepath}
+
+
+    def stop(self):
+        ''' Write the queued blocks, close the file and end the writer thread. '''
+        if self.thread is None:
+            return
+        # wait for space, so that the stop is not dropped
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+
+    def truncate_partial_record(self):
+        ''' Remove a partial record, e.g. from a crash during a write, from the end of the open binary recording,
+        so that appended records stay aligned. A partial header is removed too. '''
+        if self.file_bytes < binary_recording.HEADER_SIZE:
+            whole_bytes = 0
+        else:
+            whole_bytes = self.file_bytes - (self.file_bytes - binary_recording.HEADER_SIZE) % binary_recording.RECORD_SIZE
+        if whole_bytes == self.file_bytes:
+            return
+        logging.warning(f'removed {self.file_bytes - whole_bytes} bytes of a partial record from {self.filepath}')
+        self.file_object.truncate(whole_bytes)
+        self.file_object.seek(whole_bytes)
+        self.file_bytes = whole_bytes
+
+
+    def write_block(self, block, host_time):
+        ''' Write <block>, a block of scans, one acc_data_structure per line, as binary records
+        or into compressed chunks, and add it to the index. '''
+        if self.record_format == 'binary':
+            data = binary_recording.encode_block(block)
+            offsets = self.file_bytes + np.arange(len(block)) * binary_recording.RECORD_SIZE
+        elif self.encoder is not None:
+            # only completed chunks are written, the offset of a scan is the offset of its chunk
+            chunks, chunk_numbers = self.encoder.add(block)
+            data = b''.join(chunks)
+            chunk_offsets = self.file_bytes + np.cumsum([0] + [len(chunk) for chunk in chunks])
+            offsets = chunk_offsets[chunk_numbers]
+        else:
+            lines = [RECORD_LINE.format(*scan) for scan in block.tolist()]
+            data = ''.join(lines).encode()
+            # lines are ascii, so the length in characters is the length in bytes
+            line_ends = np.cumsum([len(line) for line in lines])
+            offsets = self.file_bytes + np.concatenate(([0], line_ends[:-1]))
+        self.write_data(data)
+        self.scans_written += len(block)
+        self.index.add_block(block['millis'], offsets, self.file_bytes, host_time)
+        if self.unflushed_bytes >= self.flush_bytes:
+            self.flush(self.fsync == 'flush')
+        # scans still in a compressed chunk are written at the deadline too
+        pending = self.encoder is not None and self.encoder.num_pending
+        if self.flush_deadline is None and (self.unflushed_bytes or pending):
+            self.flush_deadline = time.monotonic() + self.flush_interval
+
+
+    def write_data(self, data):
+        ''' Write data, bytes, to the open file. '''
+        self.file_object.write(data)
+        self.bytes_written += len(data)
+        self.file_bytes += len(data)
+        self.unflushed_bytes += len(data)
 
 
 if __name__ == '__main__':
-  files = Files()
\ No newline at end of file
+  files = Files(queue.Queue())
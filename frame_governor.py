@@ -0,0 +1,98 @@
+'''
+Adaptive frame pacing for the graph timer.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Replaces the fixed UPDATE_MS graph timer interval. After each timer tick, update is
+given how long the tick took, how long it was since the previous tick started, the
+sensor sample rate and whether the display is idle (paused or minimised).
+It returns the timer interval in ms to use next and keeps the reason for it.
+
+Reasons, in order of precedence:
+idle - paused or minimised, refresh at idle_fps
+falling behind - ticks arrive later than requested, so painting or reading data is
+    using up the event loop, the frame rate is cut by BACK_OFF
+render cost - the time taken by a tick would use more than render_budget of the frame period
+sensor rate - no faster than new samples arrive
+max fps - limited by max_fps
+
+The frame rate rises by at most RECOVER per tick, so a slow frame does not cause oscillation.
+The result is always between min_fps and max_fps, except when idle.
+When any idle state ends, unpaused or shown again, the governor is reset to max_fps.
+
+@author: matthew oppenheim
+last update: 2025_05_15
+'''
+
+BACK_OFF = 0.8 # frame rate multiplier when ticks are late
+IDLE_FPS = 1
+LATE_FACTOR = 1.5 # a tick is late if the time since the previous tick is more than this times the interval
+MAX_FPS = 60
+MIN_FPS = 5
+RECOVER = 1.1 # maximum frame rate increase per tick
+RENDER_BUDGET = 0.5 # fraction of the frame period that a tick may take
+SMOOTHING = 0.2 # weight of the newest render time in the smoothed render time
+
+
+class FrameGovernor():
+    ''' Choose the graph timer interval from the render cost, tick lateness and sensor rate. '''
+
+    def __init__(self, min_fps=MIN_FPS, max_fps=MAX_FPS, idle_fps=IDLE_FPS, render_budget=RENDER_BUDGET):
+        if not 0 < min_fps <= max_fps:
+            raise ValueError(f'need 0 < min_fps <= max_fps, not {min_fps}, {max_fps}')
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.idle_fps = idle_fps
+        self.render_budget = render_budget
+        self.reset()
+
+
+    @property
+    def interval_ms(self):
+        ''' Timer interval in ms for the current frame rate. '''
+        return max(1, round(1000 / self.fps))
+
+
+    def reset(self):
+        ''' Start again at max_fps, e.g. when the display is unpaused. Return the timer interval in ms. '''
+        self.fps = self.max_fps
+        self.reason = 'max fps'
+        self.render_time = None # smoothed time taken by a tick in s
+        return self.interval_ms
+
+
+    def stats(self):
+        return {'fps': self.fps, 'interval_ms': self.interval_ms, 'reason': self.reason,
+            'render_time_ms': 1000*self.render_time if self.render_time is not None else None}
+
+
+    def update(self, render_time, tick_interval=None, sample_rate=None, idle=False):
+        ''' Return the next timer interval in ms.
+        render_time - time in s taken by the last tick
+        tick_interval - time in s between the start of the last two ticks, None for the first tick
+        sample_rate - sensor samples per s, None if not known
+        idle - True if paused or minimised '''
+        if idle:
+            self.fps = self.idle_fps
+            self.reason = 'idle'
+            return self.interval_ms
+        was_idle = self.reason == 'idle'
+        if was_idle:
+            # the render time measured before going idle is out of date
+            self.reset()
+        if self.render_time is None:
+            self.render_time = render_time
+        else:
+            self.render_time += SMOOTHING * (render_time - self.render_time)
+        fps, reason = self.max_fps, 'max fps'
+        if sample_rate and sample_rate < fps:
+            fps, reason = sample_rate, 'sensor rate'
+        if self.render_time > 0 and self.render_budget / self.render_time < fps:
+            fps, reason = self.render_budget / self.render_time, 'render cost'
+        # coming back from idle, the last tick was expected to be late
+        if not was_idle and tick_interval and tick_interval > LATE_FACTOR / self.fps:
+            fps, reason = min(fps, self.fps * BACK_OFF), 'falling behind'
+        elif fps > self.fps * RECOVER:
+            fps = self.fps * RECOVER
+        self.fps = min(max(fps, self.min_fps), self.max_fps)
+        self.reason = reason
+        return self.interval_ms
@@ -13,12 +13,15 @@ to compensate for gimbal lock:
 Roll  = atan2( Y,   sign* sqrt(Z*Z+ miu*X*X));
 sign  = 1 if accZ>0, -1 otherwise 
 miu = 0.001
+
+abs, pitch, roll and yaw take scalars or numpy arrays.
+features() calculates all four for a block of scans in one pass, used by update_buffer.
 '''
 
 MIU = 0.001
 
+import latency
 import logging
-import math
 import numpy as np
 
 # as this class does not run in the main thread, __ini__ definition of logging does not work
@@ -28,17 +31,41 @@ logging.basicConfig(level=logging.DEBUG, format='%(message)s')
 ROLLING_WINDOW_LENGTH = 8 
 
 class IMU_calcs():
+
+    FEATURE_HEADERS = ['acc_abs', 'pitch', 'roll', 'yaw'] # buffer columns set by update_buffer, in features() order
+
     def __init__(self, rolling_window_length = ROLLING_WINDOW_LENGTH):
         self.rolling_window_length = rolling_window_length
         pass
     
     @staticmethod
     def abs(x, y, z):
-        ''' Calculate absolute value of x, y, z. '''
-        abs = math.sqrt(x**2+y**2+z**2)
+        ''' Calculate absolute value of x, y, z. Takes scalars or arrays. '''
+        abs = np.sqrt(x**2+y**2+z**2)
         return abs
 
 
+    @staticmethod
+    def features(x, y, z):
+        ''' Return a (4, number of scans) array of abs, pitch, roll and yaw for blocks of x, y, z values.
+        The squares are shared between the features and the three angles use one arctan2 call,
+        so the numpy call overhead is paid once per block. '''
+        xyz = np.array((x, y, z), dtype=float)
+        shape = xyz.shape[1:]
+        xyz = xyz.reshape(3, -1)
+        squares = xyz*xyz
+        x2, y2, z2 = squares
+        features = np.empty((4, xyz.shape[1]))
+        np.sqrt(squares.sum(axis=0), out=features[0])
+        denominators = np.array((y2 + z2, z2 + MIU*x2, x2 + z2))
+        np.sqrt(denominators, out=denominators)
+        denominators[1] *= IMU_calcs.roll_sign(xyz[2])
+        xyz[0] *= -1 # numerators are -x, y, z
+        np.arctan2(xyz, denominators, out=features[1:])
+        np.degrees(features[1:], out=features[1:])
+        return features.reshape((4,) + shape)
+
+
     @staticmethod
     def pitch(x, y, z):
         ''' Uses accelerometer values to return pitch. '''
@@ -53,39 +80,43 @@ class IMU_calcs():
 
     @staticmethod
     def roll(x, y, z):
-        ''' Uses accelerometer values to return roll. '''
-        if z>0:
-            sign = -1
-        else:
-            sign = 1
-        roll = np.arctan2(y,sign*np.sqrt(z**2+MIU*x**2))*180/np.pi
+        ''' Uses accelerometer values to return roll. Takes scalars or arrays. '''
+        roll = np.arctan2(y, IMU_calcs.roll_sign(z)*np.sqrt(z**2+MIU*x**2))*180/np.pi
         return roll
 
 
+    @staticmethod
+    def roll_sign(z):
+        ''' Gimbal lock compensation sign for roll, -1 if z>0, 1 otherwise, without branching.
+        0.0 - z is +0.0 for z=0, so copysign gives 1 at z=0. '''
+        return np.copysign(1.0, 0.0 - np.asarray(z, dtype=float))
+
+
     @staticmethod
     def yaw(x, y, z):
         ''' Uses accelerometer values to return yaw. '''
         # yaw = 180 * atan (accelerationZ/sqrt(accelerationX*accelerationX + accelerationZ*accelerationZ))/M_PI;
-        yaw = 180 * np.arctan(z/np.sqrt(x**2 + z**2))/np.pi;
+        # arctan2 gives the same angle, as the denominator is not negative, without dividing by 0 when x=z=0
+        yaw = 180 * np.arctan2(z, np.sqrt(x**2 + z**2))/np.pi;
         return yaw 
 
 
+    def update_buffer(self, buffer, num_scans=1):
+        ''' Update the newest num_scans scans in a RingBuffer with absolute acceleration, pitch, roll and yaw. '''
+        x = buffer.latest('acc_x', num_scans)
+        y = buffer.latest('acc_y', num_scans)
+        z = buffer.latest('acc_z', num_scans)
+        buffer.set_latest_columns(self.FEATURE_HEADERS, self.features(x, y, z))
+        latency.record('features')
+        return buffer
+
+
     def update_df(self, df):
         # update df containing x,y,z accelerometer data with pitch, roll, yaw, absolute acceleration
-        # extract x,y,z from dataframe
-        x = df['acc_x'].tolist()[0]
-        y = df['acc_y'].tolist()[0]
-        z = df['acc_z'].tolist()[0]
-        # pitch = self.pitch(x, y, z)
-        # roll = self.roll(x, y, z)
-        # yaw = self.yaw(x, y, z)
-        acc_abs = self.abs(x, y, z)
+        # extract x,y,z of the first row from dataframe
+        x, y, z = df.loc[0, ['acc_x', 'acc_y', 'acc_z']]
+        acc_abs, pitch, roll, yaw = self.features(x, y, z)
         # update first row of pitch, roll, yaw, acc_abs dataframe columns
-        # df.loc[0,'pitch'] = pitch
-        # df.loc[0,'roll'] = roll
-        # df.loc[0,'yaw'] = yaw
-        df.loc[0,'acc_abs'] = acc_abs
+        df.loc[0, self.FEATURE_HEADERS] = [acc_abs, pitch, roll, yaw]
         logging.debug(f'acc_y:{y:.2f} abs:{acc_abs:.2f}')
         return df
-
-
@@ -0,0 +1,183 @@
+'''
+Per stage latency, from serial bytes arriving to the graph update that first shows them.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The serial reader, or the replay, calls mark_arrival when a chunk of bytes is read.
+Each later stage calls record(stage), which adds the time since that arrival to a
+streaming histogram for the stage. Scans are timestamped a block at a time, so the
+cost is paid once per read, not once per scan. The arrival time is kept per thread,
+as the parse, dataframe and features stages run on the thread that read the bytes.
+
+Stages:
+parse - scans parsed or decoded, before publishing
+dataframe - scans added to the ring buffer
+features - IMU_calcs columns updated
+render - the graph timer has set the curve data, for the oldest scan not yet plotted
+
+Histograms use fixed log spaced bins, BINS_PER_DECADE per decade from MIN_LATENCY to
+MAX_LATENCY, so memory is fixed and percentiles are accurate to about 12%.
+
+Disabled by default. When disabled every function returns straight away.
+
+Use:
+latency.enable()
+latency.summary() - one line of p50/p95/p99 for each stage, for the textedit
+latency.dump() - dictionary of the same numbers, for headless runs
+
+@author: matthew oppenheim
+last update: 2025_05_13
+'''
+import math
+import threading
+import time
+
+BINS_PER_DECADE = 20
+MAX_LATENCY = 100 # s, longer latencies are counted in the last bin
+MIN_LATENCY = 1e-6 # s, shorter latencies are counted in the first bin
+PERCENTILES = (50, 95, 99)
+STAGES = ['parse', 'dataframe', 'features', 'render']
+
+enabled = False
+histograms = {}
+pending_lock = threading.Lock()
+pending_arrival = None # arrival time of the oldest scan published but not yet rendered
+thread_data = threading.local() # arrival time of the chunk being processed on this thread
+
+
+class LatencyHistogram():
+    ''' Streaming histogram of latencies in s with log spaced bins. '''
+
+    NUM_BINS = math.ceil(math.log10(MAX_LATENCY/MIN_LATENCY) * BINS_PER_DECADE) + 1
+
+    def __init__(self):
+        self.reset()
+
+
+    def add(self, latency):
+        ''' Add one latency in s. '''
+        if latency > MIN_LATENCY:
+            index = min(int(math.log10(latency/MIN_LATENCY) * BINS_PER_DECADE) + 1, self.NUM_BINS - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+
+    def percentile(self, percent):
+        ''' Return the latency in s below which percent of the latencies fall, None if empty.
+        The geometric centre of the bin holding the percentile is returned. '''
+        if not self.count:
+            return None
+        target = percent / 100 * self.count
+        cumulative = 0
+        for index, bin_count in enumerate(self.counts):
+            cumulative += bin_count
+            if cumulative >= target and bin_count:
+                break
+        if index == 0:
+            return MIN_LATENCY
+        return min(MIN_LATENCY * 10**((index - 0.5) / BINS_PER_DECADE), self.max)
+
+
+    def reset(self):
+        self.counts = [0] * self.NUM_BINS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def stats(self):
+        ''' Return a dictionary of count, mean, max and percentiles in ms. '''
+        stats = {'count': self.count,
+            'mean_ms': 1000*self.total/self.count if self.count else None,
+            'max_ms': 1000*self.max if self.count else None}
+        for percent in PERCENTILES:
+            value = self.percentile(percent)
+            stats[f'p{percent}_ms'] = 1000*value if value is not None else None
+        return stats
+
+
+def arrival_time():
+    ''' Return the arrival time of the chunk being processed on this thread, None if not marked. '''
+    return getattr(thread_data, 'arrival', None)
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def dump():
+    ''' Return a dictionary of latency stats for each stage. '''
+    return {stage: histogram.stats() for stage, histogram in histograms.items()}
+
+
+def enable():
+    ''' Start recording latencies, clears any earlier results. '''
+    global enabled
+    reset()
+    enabled = True
+
+
+def mark_arrival(arrival=None):
+    ''' Record that a chunk of bytes has arrived on this thread, at time.monotonic() or arrival. '''
+    if not enabled:
+        return
+    thread_data.arrival = time.monotonic() if arrival is None else arrival
+
+
+def published(arrival=None):
+    ''' Record that scans from this thread's chunk, or from arrival, are ready to plot.
+    The oldest published arrival is kept until rendered is called. '''
+    global pending_arrival
+    if not enabled:
+        return
+    if arrival is None:
+        arrival = arrival_time()
+        if arrival is None:
+            return
+    with pending_lock:
+        if pending_arrival is None or arrival < pending_arrival:
+            pending_arrival = arrival
+
+
+def record(stage):
+    ''' Add the time since this thread's arrival mark to the histogram for stage. '''
+    if not enabled:
+        return
+    arrival = getattr(thread_data, 'arrival', None)
+    if arrival is not None:
+        histograms[stage].add(time.monotonic() - arrival)
+
+
+def rendered():
+    ''' Record the render latency of the oldest scan published since the last render. '''
+    global pending_arrival
+    if not enabled:
+        return
+    with pending_lock:
+        arrival, pending_arrival = pending_arrival, None
+    if arrival is not None:
+        histograms['render'].add(time.monotonic() - arrival)
+
+
+def reset():
+    ''' Clear all of the histograms. '''
+    global histograms, pending_arrival
+    histograms = {stage: LatencyHistogram() for stage in STAGES}
+    pending_arrival = None
+
+
+def summary():
+    ''' Return one line per stage with the p50/p95/p99 latency in ms, for display. '''
+    lines = []
+    for stage, stats in dump().items():
+        if stats['count']:
+            percentiles = '/'.join(f"{stats[f'p{percent}_ms']:.1f}" for percent in PERCENTILES)
+            lines.append(f'{stage} p50/p95/p99 ms: {percentiles}')
+    return '\n'.join(lines)
+
+
+reset()
@@ -0,0 +1,267 @@
+'''
+Synthetic T-Watch load generator on a pseudo terminal pair.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Replaces running socat by hand. LoadGenerator opens its own pty pair and writes
+T-Watch debug log lines, or binary frames, see binary_protocol.py, to the master side.
+The real Serial_Connect reads the slave side, LoadGenerator.port, as it would a watch.
+
+The accelerometer values are those in slow_swing_handshake_data.txt, repeated.
+millis comes from the generator's clock, counter increments and wraps as an int16.
+
+rate - scans per s, e.g. 50 to 5000
+jitter - standard deviation in s of the time each write is sent, around its due time
+burst - scans sent together in one write, as USB transfers batch them
+split - probability that a write is sent in two parts, SPLIT_PAUSE apart, splitting a line or frame
+corrupt - probability that a scan has one of its bytes replaced with a random byte
+
+Writes are due at absolute times from the start, so the rate does not drift. If the reader
+falls behind, the pty buffer fills, writes wait and the due scans are sent together.
+The master side is not blocking, so a writer waiting for a stalled reader can still be stopped.
+stats() gives the scans and bytes sent, the achieved rate and how far behind the writer fell.
+
+Measure the highest rate the app keeps up with, from the scripts directory:
+python load_generator.py --rate 2000 --protocol binary --duration 10
+python main.py --load 2000 --load-protocol binary
+
+@author: matthew oppenheim
+last update: 2025_05_24
+'''
+import argparse
+import binary_protocol
+import logging
+import numpy as np
+import os
+import select
+import threading
+import time
+import tty
+from replay_data import TEST_FILE, format_log_lines, read_recording
+
+BURST = 1 # scans in one write
+MAX_WRITE_SCANS = 4096 # scans in one write at most, when catching up
+RATE = 1000 # scans per s
+SPLIT_PAUSE = 1e-3 # s between the two parts of a split write
+WRITE_POLL = 0.1 # s to wait for space in the pty buffer before checking for a stop
+
+
+class LoadGenerator():
+    ''' Write synthetic T-Watch scans to a pty at a set rate, from a writer thread. '''
+
+    def __init__(self, rate=RATE, protocol='text', jitter=0.0, burst=BURST, split=0.0, corrupt=0.0,
+            seed=None, file_path=TEST_FILE):
+        if protocol not in ('text', 'binary'):
+            raise ValueError(f"protocol must be 'text' or 'binary', not {protocol}")
+        if rate <= 0 or burst < 1:
+            raise ValueError(f'need rate > 0 and burst >= 1, not {rate}, {burst}')
+        self.rate = rate
+        self.protocol = protocol
+        self.jitter = jitter
+        self.burst = burst
+        self.split = split
+        self.corrupt = corrupt
+        self.random = np.random.default_rng(seed)
+        self.recorded = read_recording(file_path)
+        # the slave side is kept open, so that writes do not fail before a reader opens the port
+        self.master, self.slave = os.openpty()
+        # raw, so that there is no echo and newlines are not translated
+        tty.setraw(self.slave)
+        # not blocking, so that a writer waiting for a reader that is behind can be stopped
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.thread = None
+        self.running = False
+        self.start_time = None
+        self.stop_time = None
+        self.scans_sent = 0
+        self.bytes_sent = 0
+        self.writes = 0
+        self.splits = 0
+        self.scans_corrupted = 0
+        self.max_lag = 0.0 # longest time in s a write was sent after it was due
+        logging.info(f'load generator port: {self.port}')
+
+
+    def close(self):
+        ''' Stop writing and close the pty pair. '''
+        self.stop()
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+    def encode(self, scans):
+        ''' Return scans as bytes in self.protocol, with corrupt bytes added. '''
+        if self.protocol == 'binary':
+            previous_millis = self.last_millis if self.scans_sent else None
+            data = bytearray(binary_protocol.pack_frames(scans, previous_millis))
+        else:
+            data = bytearray(format_log_lines(scans).encode())
+        self.last_millis = int(scans['millis'][-1])
+        if self.corrupt:
+            num_corrupt = int(self.random.binomial(len(scans), self.corrupt))
+            for position in self.random.integers(0, len(data), num_corrupt):
+                data[position] = int(self.random.integers(0, 256))
+            self.scans_corrupted += num_corrupt
+        return bytes(data)
+
+
+    def make_scans(self, first_scan, num_scans):
+        ''' Return num_scans scans of ads.acc_scan_dtype, numbered from first_scan. '''
+        numbers = np.arange(first_scan, first_scan + num_scans)
+        scans = self.recorded[numbers % len(self.recorded)].copy()
+        scans['millis'] = numbers * 1000 // self.rate
+        # wraps as the int16 counter in a binary frame does
+        scans['counter'] = (numbers + 2**15) % 2**16 - 2**15
+        return scans
+
+
+    def run(self, duration=None):
+        ''' Write scans until stopped, or for duration s. '''
+        self.start_time = time.perf_counter()
+        total_scans = None if duration is None else int(duration * self.rate)
+        write_number = 0 # number of the next write, each is of self.burst scans
+        deadline = self.write_deadline(write_number)
+        while self.running and (total_scans is None or self.scans_sent < total_scans):
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.max_lag = max(self.max_lag, time.perf_counter() - deadline)
+            # writes that are due as well are sent with this one
+            num_writes = 1
+            while num_writes * self.burst < MAX_WRITE_SCANS:
+                deadline = self.write_deadline(write_number + num_writes)
+                if deadline > time.perf_counter():
+                    break
+                num_writes += 1
+            num_scans = num_writes * self.burst
+            if total_scans is not None:
+                num_scans = min(num_scans, total_scans - self.scans_sent)
+            self.write(self.encode(self.make_scans(self.scans_sent, num_scans)))
+            self.scans_sent += num_scans
+            write_number += num_writes
+        self.stop_time = time.perf_counter()
+        self.running = False
+
+
+    def start(self, duration=None):
+        ''' Start the writer thread, writing for duration s, or until stopped. '''
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(duration,), name='load generator', daemon=True)
+        self.thread.start()
+
+
+    def stats(self):
+        ''' Return a dictionary of scans, bytes and writes sent, the achieved rate and the longest lag in ms. '''
+        end_time = self.stop_time or time.perf_counter()
+        elapsed = end_time - self.start_time if self.start_time else 0
+        return {'scans_sent': self.scans_sent, 'bytes_sent': self.bytes_sent, 'writes': self.writes,
+            'splits': self.splits, 'scans_corrupted': self.scans_corrupted,
+            'scans_per_s': self.scans_sent/elapsed if elapsed else 0.0, 'max_lag_ms': 1000*self.max_lag}
+
+
+    def stop(self):
+        ''' Stop the writer thread after the current write. '''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+    def wait(self):
+        ''' Wait for a writer thread started with a duration to finish. '''
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+    def write(self, data):
+        ''' Write data to the pty, in two parts if it is split. '''
+        parts = [data]
+        if self.split and len(data) > 1 and self.random.random() < self.split:
+            position = int(self.random.integers(1, len(data)))
+            parts = [data[:position], data[position:]]
+            self.splits += 1
+        for number, part in enumerate(parts):
+            if number:
+                time.sleep(SPLIT_PAUSE)
+            view = memoryview(part)
+            while view:
+                # waits while the pty buffer is full, i.e. the reader is behind
+                if not select.select([], [self.master], [], WRITE_POLL)[1]:
+                    if not self.running:
+                        return
+                    continue
+                written = os.write(self.master, view)
+                view = view[written:]
+                self.bytes_sent += written
+            self.writes += 1
+
+
+    def write_deadline(self, write_number):
+        ''' Return the time.perf_counter() at which write write_number is due. '''
+        # due when the last scan in the write has been measured
+        deadline = self.start_time + ((write_number + 1) * self.burst - 1) / self.rate
+        if self.jitter:
+            deadline += self.random.normal(0, self.jitter)
+        return deadline
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='drive Serial_Connect from a synthetic T-Watch on a pty')
+    arg_parser.add_argument('--rate', type=float, default=RATE, help='scans per s')
+    arg_parser.add_argument('--protocol', choices=['text', 'binary'], default='text')
+    arg_parser.add_argument('--duration', type=float, default=10, help='time in s to generate scans for')
+    arg_parser.add_argument('--jitter-ms', type=float, default=0, help='standard deviation of write times in ms')
+    arg_parser.add_argument('--burst', type=int, default=BURST, help='scans in one write')
+    arg_parser.add_argument('--split', type=float, default=0, help='probability a write is split in two')
+    arg_parser.add_argument('--corrupt', type=float, default=0, help='probability a scan has a corrupt byte')
+    arg_parser.add_argument('--process', action='store_true',
+        help='update a DataFrame and IMU_calcs, as main.py does, and print the transport latency')
+    arg_parser.add_argument('--drain', type=float, default=1, help='time in s to wait for the reader after the end')
+    args = arg_parser.parse_args()
+    # imported here so that the generator can be used without the reader
+    import block_dispatcher
+    import dispatcher_signals as ds
+    from serial_connection import Serial_Connect
+    received = {'scans': 0, 'counter_gaps': 0, 'last_counter': None}
+
+    def count_scans(message):
+        counters = message['counter'].astype(np.int64)
+        if received['last_counter'] is not None:
+            counters = np.concatenate(([received['last_counter']], counters))
+        received['counter_gaps'] += int(np.count_nonzero((np.diff(counters) - 1) % 2**16))
+        received['last_counter'] = int(message['counter'][-1]) if len(message) else received['last_counter']
+        received['scans'] += len(message)
+
+    block_dispatcher.connect(count_scans, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+    if args.process:
+        from dataframe import DataFrame
+        from imu_calcs import IMU_calcs
+        dataframe = DataFrame()
+        imu = IMU_calcs()
+
+        def process_scans(message):
+            dataframe.update_dataframe(message)
+            imu.update_buffer(dataframe.buffer, len(message))
+            dataframe.publish_snapshot()
+
+        block_dispatcher.connect(process_scans, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+    generator = LoadGenerator(args.rate, args.protocol, args.jitter_ms / 1000, args.burst, args.split, args.corrupt)
+    reader = Serial_Connect(serial_port=generator.port)
+    reader.start()
+    generator.start(args.duration)
+    generator.wait()
+    time.sleep(args.drain)
+    stats = generator.stats()
+    print(stats)
+    print(f"received {received['scans']} of {stats['scans_sent']} scans, "
+        f"{received['scans'] / args.duration:.0f} scans/s, {received['counter_gaps']} counter gaps")
+    if args.process:
+        print(dataframe.clock.summary())
+    reader.stop()
+    generator.close()
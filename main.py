@@ -7,7 +7,7 @@ this into another class and instantiate it from main.
 Connect with the T-Watch using a USB cable.
 The connection creates a serial port: /dev/ACM* (linux) or /dev/ttyUSB* (windows)
 Dependencies:
-  PyDispatcher, pyserial, pyqtgraph, numpy, scikit, PySide6, pyopengl, pyzmq
+  pyserial, pyqtgraph, numpy, scikit, PySide6, pyopengl, pyzmq
 @author: matthew oppenheim
 last date of update: 2025_04_29
 
@@ -17,22 +17,31 @@ TO DO: Add data save and replay
 #import accelerometer_data_structure as ads
 # import imu_calcs
 import accelerometer_data_structure as ads
+from acquisition_process import AcquisitionProcess
+import argparse
+import block_dispatcher
+import dataframe
 from dataframe import DataFrame
 import dispatcher_signals as ds
+from curve_tracker import CurveTracker, RenderCounter
+import files
 from files import Files # save data to file
+import frame_governor
+from frame_governor import FrameGovernor
 from imu_calcs import IMU_calcs
+import latency
 import logging
-import math # math.sqrt math.isnan used
+from multi_device import MultiDevice
 import numpy as np # np.clip used
 import pandas as pd
 import PySide6
-from pydispatch import dispatcher
 from pyqtgraph.Qt import QtGui, QtCore, QtWidgets
 import pyqtgraph as pg
 import queue # for inter-thread communiction
 from replay_data import ReplayData
+from resampler import Resampler
 # from gesture import Gesture
-from serial_connection import Serial_Connect
+from serial_connection import Serial_Connect, find_serial_ports
 # from shake_recognition import Shake_Recognition
 import sys
 import threading
@@ -42,10 +51,9 @@ import utilities
 # display will have limits +/- AMPLITUDE
 # AMPLITUDE = 2
 
-UPDATE_MS = 100 # how fast to update graph in ms
-
 class Handshake():
 
+    LARGE_WINDOW = 2000 # windows longer than this are drawn without antialiasing and with thin pens
     LOG_UPDATE_INTERVAL = 1 # time in s inbetween writing data to textedit box
     MAX_ACC = 512 # max value to plot for accelerometer axis
     MIN_ABS = 400 # min value for absolute acceleration
@@ -53,30 +61,70 @@ class Handshake():
     MAX_ROLL = 180 # roll varies from +180 to -180
     MAX_PITCH = 90 # pitch varies from +90 to -90
     MAX_YAW = 90 # yaw varies from +180 to -180
-    SENSOR_TIME_SAMPLES = 200 # how many samples to average over to find sensor update frequence
     WIN_X = 300 # graph size in x
     WIN_Y = 500 # graph size in y
+    DEVICE_COLOURS = ('blue', 'red', 'green', 'magenta', 'black') # pens of overlaid watches
+    LAYOUTS = ('side', 'overlay') # plots of several watches side by side, or overlaid
+    # title, column, y range and pen of each plot
+    PLOTS = (('acc_x', 'acc_x', (-MAX_ACC, MAX_ACC), 'acc'), ('acc_y', 'acc_y', (-MAX_ACC, MAX_ACC), 'acc'),
+        ('acc_z', 'acc_z', (-MAX_ACC, MAX_ACC), 'acc'),
+        # pitch, roll, yaw calculated in imu_calcs.py
+        ('pitch', 'pitch', (-MAX_PITCH, MAX_PITCH), 'feature'), ('roll', 'roll', (-MAX_ROLL, MAX_ROLL), 'feature'),
+        ('yaw', 'yaw', (-MAX_YAW, MAX_YAW), 'feature'),
+        # data created by processing accelerometer data, absolute value of all 3 axis
+        ('abs', 'acc_abs', (MIN_ABS, MAX_ABS), 'feature'),
+        # how much current value exceeds mean in a window preceding the current value
+        ('y_exceeded_mean_abs', 'y_exceeded_mean', (0, MAX_ABS), 'focus'))
 
-    def __init__(self):
-
-        # set up a dispatcher to receive data from the sensor data parser
-        dispatcher.connect(self.dispatcher_receive_data,signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+    def __init__(self, multiprocess=False, replay_file=None, replay_speed=1.0, max_rows=DataFrame.MAX_DATAFRAME_ROWS,
+            min_fps=frame_governor.MIN_FPS, max_fps=frame_governor.MAX_FPS, record_format='text', serial_port=None,
+            serial_ports=None, layout='side', resample_rate=None):
+        ''' With more than one of serial_ports, each watch is read and plotted, laid out as layout.
+        With resample_rate, the features and plots use scans resampled to resample_rate scans per s. '''
 
-        # ---- setup dataframe that stores sensor and filtered data
-        self.dataframe = DataFrame()
-        self.df = None # dataframe with data to plot is retrieved using dataframe_handler
-        # ----- Set up the serial connection and run in a thread
-        # create the serial port connection, do not instantiate this from the main class
-        # or it blocks the program
-        serial_connection_thread = threading.Thread(target=Serial_Connect)
-        serial_connection_thread.start()
-        self.last_graph_update = time.time() # used to measure the graph update frequency, independent of sensor data frequency
-        self.last_textedit_update = time.time() # used to limit update rate of textedit box
-        self.queue_out = queue.Queue(maxsize=1) # for inter-thread communication
-        self.file_thread = threading.Thread(target=Files, args=(self.queue_out,)) # starts in a thread
-        self.file_thread.start() # start the thread
-        self.time_list = [0] * self.SENSOR_TIME_SAMPLES # empty list of time stamps to calculate graph update rate
         self.imu = IMU_calcs()
+        # rolling statistics are kept for the dataframe and imu_calcs window lengths
+        rolling_windows = (dataframe.ROLLING_WINDOW_LENGTH, self.imu.rolling_window_length)
+        self.plot_columns = None # columns of the first watch's snapshot last plotted
+        self.max_rows = max_rows # number of scans in the plotted window
+        self.acquisition = None # worker process in multi-process mode
+        self.devices = None # MultiDevice when several watches are read
+        if layout not in self.LAYOUTS:
+            raise ValueError(f'layout must be one of {self.LAYOUTS}, not {layout}')
+        self.layout = layout
+        if multiprocess and replay_file:
+            raise ValueError('replay is not supported in multi-process mode')
+        if serial_ports and len(serial_ports) == 1:
+            serial_port = serial_ports[0]
+        if serial_ports and len(serial_ports) > 1:
+            if multiprocess or replay_file:
+                raise ValueError('several watches can not be read in multi-process or replay mode')
+            # each watch has its own parser, dataframe and recorder, all read on one loop thread
+            self.devices = MultiDevice(serial_ports, max_rows=max_rows, rolling_windows=rolling_windows,
+                record_format=record_format, resample_rate=resample_rate)
+            self.devices.start()
+            self.snapshots = [device.snapshot for device in self.devices]
+            self.device_names = [device.name for device in self.devices]
+        elif multiprocess:
+            # serial reading, parsing, processing and recording run in a worker process
+            # the snapshots to plot are read from shared memory
+            self.acquisition = AcquisitionProcess(serial_port, max_rows=max_rows, rolling_windows=rolling_windows,
+                record_format=record_format, resample_rate=resample_rate)
+            self.snapshot = self.acquisition
+        else:
+            self.start_acquisition_threads(rolling_windows, replay_file, replay_speed, record_format, serial_port,
+                resample_rate)
+        if not self.devices:
+            self.snapshots = [self.snapshot]
+            self.device_names = ['']
+        self.plot_generations = [None] * len(self.snapshots) # generation of each snapshot last plotted
+        self.plot_ages = [None] * len(self.snapshots) # ms from the newest plotted scan of each snapshot to its plot
+        self.last_textedit_update = time.time() # used to limit update rate of textedit box
+        self.render_counter = RenderCounter() # redraws and skipped ticks, to calculate graph update rate
+        self.governor = FrameGovernor(min_fps, max_fps) # sets the graph timer interval
+        self.timer = None # graph timer, created by start_timer
+        self.last_tick_start = None # used to find how late timer ticks are
+        self.sensor_rate = None # sensor samples per s, updated every LOG_UPDATE_INTERVAL
         self.play = True # should the graph scroll, for play/pause button
         self.record = False # should the data be saved to file
         # ----- Set up the graphs
@@ -87,57 +135,41 @@ class Handshake():
 
 
     def create_graphs(self):
-        ''' Create the graphs. '''
+        ''' Create the graphs, a column of plots for each watch side by side, or one column with the watches overlaid. '''
         pg.setConfigOption('background', 'w')
-        acc_pen = pg.mkPen(color='blue', width=3)
-        focus_pen = pg.mkPen(color='orange', width=3)
-        pen = pg.mkPen(color='black', width=3)
+        # antialiasing and wide pens cost too much for long windows
+        large_window = self.max_rows > self.LARGE_WINDOW
+        pen_width = 1 if large_window else 3
+        pens = {'acc': pg.mkPen(color='blue', width=pen_width), 'focus': pg.mkPen(color='orange', width=pen_width),
+            'feature': pg.mkPen(color='black', width=pen_width)}
         self.win = pg.GraphicsLayoutWidget(show=True, title='T-Watch accelerometer data')
         self.win.setWindowTitle('T-Watch accelerometer data')
-        self.win.resize(self.WIN_X,self.WIN_Y)
-        pg.setConfigOptions(antialias=True)
-        self.p_xacc = self.win.addPlot(title='acc_x')
-        self.win.nextRow()
-        self.p_yacc = self.win.addPlot(title='acc_y')
-        self.win.nextRow()
-        self.p_zacc = self.win.addPlot(title='acc_z')
-        self.win.nextRow()
-        ''' pitch, roll, yaw not in use
-        self.p_pitch = self.win.addPlot(title='pitch')
-        self.win.nextRow()
-        self.p_roll = self.win.addPlot(title='roll')
-        self.win.nextRow()
-        self.p_yaw = self.win.addPlot(title='yaw')
-        self.win.nextRow()
-        '''
-        # data created by processing accelerometer data
-        self.p_abs = self.win.addPlot(title='abs') # absolute value of all 3 axis
-        self.win.nextRow()
-        # how much current value exceeds mean in a window preceding the current value
-        self.p_y_exceeded_mean = self.win.addPlot(title='y_exceeded_mean_abs')
-        # accelerometer axis graphs
-        self.p_xacc.setYRange(-self.MAX_ACC,self.MAX_ACC)
-        self.p_yacc.setYRange(-self.MAX_ACC,self.MAX_ACC)
-        self.p_zacc.setYRange(-self.MAX_ACC,self.MAX_ACC)
-        ''' pitch, roll, yaw not in use
-        # pitch, roll, yaw calculated in imu_calcs.py
-        self.p_pitch.setYRange(-self.MAX_PITCH,self.MAX_PITCH)
-        self.p_roll.setYRange(-self.MAX_ROLL,self.MAX_ROLL)
-        self.p_yaw.setYRange(-self.MAX_YAW,self.MAX_YAW)
-        '''
-        self.p_abs.setYRange(self.MIN_ABS,self.MAX_ABS)
-        self.p_y_exceeded_mean.setYRange(0,self.MAX_ABS)
-        # assign graph line names
-        self.curve_xacc = self.p_xacc.plot(pen=acc_pen)
-        self.curve_yacc = self.p_yacc.plot(pen=acc_pen)
-        self.curve_zacc = self.p_zacc.plot(pen=acc_pen)
-        ''' pitch, roll, yaw not in use
-        self.curve_pitch = self.p_pitch.plot(pen=pen)
-        self.curve_roll = self.p_roll.plot(pen=pen)
-        self.curve_yaw = self.p_yaw.plot(pen=pen)
-        '''
-        self.curve_abs = self.p_abs.plot(pen=pen)
-        self.curve_y_exceeded_mean = self.p_y_exceeded_mean.plot(pen=focus_pen)
+        self.num_columns = len(self.snapshots) if self.layout == 'side' else 1 # columns of plots
+        self.win.resize(self.WIN_X * self.num_columns, self.WIN_Y)
+        pg.setConfigOptions(antialias=not large_window)
+        # one list of curve trackers for each snapshot, curves are only redrawn for a new generation
+        self.curve_trackers = [[] for snapshot in self.snapshots]
+        for row, (title, column, y_range, pen_name) in enumerate(self.PLOTS):
+            if row:
+                self.win.nextRow()
+            plots = [self.win.addPlot(title=title if self.num_columns == 1 else f'{title} {name}')
+                for name in self.device_names[:self.num_columns]]
+            for plot in plots:
+                plot.setYRange(*y_range)
+                # only draw the visible part of long windows, reduced to the min and max of each pixel column
+                plot.setClipToView(True)
+                plot.setDownsampling(auto=True, mode='peak')
+            for number in range(len(self.snapshots)):
+                if self.layout == 'side':
+                    plot, pen = plots[number], pens[pen_name]
+                else:
+                    plot, pen = plots[0], pg.mkPen(color=self.DEVICE_COLOURS[number % len(self.DEVICE_COLOURS)],
+                        width=pen_width)
+                curve = plot.plot(pen=pen, name=self.device_names[number])
+                # several watches are plotted against the host time in s, lined up by their clock offsets
+                x_column = 'host_ms' if self.devices else None
+                self.curve_trackers[number].append(CurveTracker(curve, column, self.max_rows, x_column=x_column,
+                    x_origin=self.devices.start_ms if self.devices else 0.0, x_scale=1e-3))
 
 
     def create_buttons(self):
@@ -150,7 +182,7 @@ class Handshake():
         pause_button_proxy.setWidget(self.pause_button)
         self.pause_button_update_appearance()
         self.win.nextRow()
-        self.win.addItem(pause_button_proxy)
+        self.win.addItem(pause_button_proxy, colspan=self.num_columns)
         # create save button to save data to file
         save_button_proxy = QtWidgets.QGraphicsProxyWidget()
         self.save_button = QtWidgets.QPushButton('save/don\'t save')
@@ -158,7 +190,7 @@ class Handshake():
         save_button_proxy.setWidget(self.save_button)
         self.save_button_update_appearance()
         self.win.nextRow()
-        self.win.addItem(save_button_proxy)
+        self.win.addItem(save_button_proxy, colspan=self.num_columns)
 
 
     def create_textbox(self):
@@ -169,16 +201,18 @@ class Handshake():
         self.textedit.setReadOnly(True)
         textedit_proxy = QtWidgets.QGraphicsProxyWidget()
         textedit_proxy.setWidget(self.textedit)
-        self.win.addItem(textedit_proxy)
+        self.win.addItem(textedit_proxy, colspan=self.num_columns)
 
 
     # must use keyword 'message' in dispatcher setup
     def dispatcher_receive_data(self, message):
         ''' Received data from dispatcher set up in serial_connection.  '''
-        # message is a acc_data structured tuple with data for a single accelerometer x,y,z scan
-        self.df = self.dataframe.update_dataframe(message)
-        # update sensor columns to self.df
-        self.df = self.imu.update_df(self.df)
+        # message is a numpy structured array with a block of accelerometer x,y,z scans
+        self.dataframe.update_dataframe(message)
+        # update sensor columns of the newest scans in self.buffer
+        self.imu.update_buffer(self.buffer, len(message))
+        # hand a consistent copy of the plotted columns to the graph thread
+        self.dataframe.publish_snapshot()
         # for debugging:
         self.log_df()
 
@@ -189,46 +223,59 @@ class Handshake():
         # write periodically or the display is swamped
         if (now_time - self.last_textedit_update) > self.LOG_UPDATE_INTERVAL:
             # write graph update rate to self.textedit
-            graph_update_frequency = self.graph_update_rate()
+            graph_rates = self.graph_update_rate(now_time - self.last_textedit_update)
             sensor_update_frequency = self.sensor_update_rate()
+            self.sensor_rate = sensor_update_frequency
             try:
-                self.log_textedit(f'graph fy: {graph_update_frequency:5.2f} sensor fy:{sensor_update_frequency:5.2f}')
+                self.log_textedit(f"graph redraws: {graph_rates['redraws']:5.2f} skipped: {graph_rates['skipped']:5.2f} "
+                    f"sensor fy:{sensor_update_frequency:5.2f}")
             except TypeError as e: # no sensor data causes a typerror
                 pass
+            self.log_textedit(f'refresh: {self.governor.fps:5.2f} fps, {self.governor.reason}')
+            self.log_clocks()
+            if latency.enabled:
+                self.log_textedit(latency.summary())
             self.last_textedit_update = now_time
 
 
-    def graph_update_rate(self):
-        ''' Calculate graph refresh frequency. '''
+    def graph_update_rate(self, interval):
+        ''' Return a dictionary of timer tick, redraw and skipped tick rates over the last interval in s,
+        then restart the count. '''
         # This is independent of the sensor data.
-        update_frequency = None
-        self.time_list = self.time_list[1:]
-        cleaned_time_list = [x for x in self.time_list if x != 0 ] # remove 0s from time_list
-        if len(cleaned_time_list)>1:
-            try:
-                update_frequency = (len(cleaned_time_list)-1)/(cleaned_time_list[-1] - cleaned_time_list[0])
-            except ZeroDivisionError as e:
-                return None
-        return update_frequency
+        rates = self.render_counter.rates(interval)
+        self.render_counter.reset_interval()
+        return rates
+
+
+    def log_clocks(self):
+        ''' Write the age of the newest plotted scans, and the clock estimate and transport latency of each watch
+        read in this process, to self.textedit. '''
+        ages = [age for age in self.plot_ages if age is not None]
+        if ages:
+            # from the host time of the scan, so it includes the transport, processing and graph timer delays
+            self.log_textedit(f'plotted scan age: {max(ages):.0f} ms')
+        if self.devices:
+            for device in self.devices:
+                self.log_textedit(f'{device.name} {device.dataframe.clock.summary()}')
+        elif not self.acquisition:
+            self.log_textedit(self.dataframe.clock.summary())
 
 
     def log_df(self):
-        ''' Log df values for row 0 '''
-        acc_x = self.df.loc[0,'acc_x']
-        acc_y = self.df.loc[0,'acc_y']
-        acc_z = self.df.loc[0,'acc_z']
-        ''' pitch, roll, yaw not in use
-        pitch = self.df.loc[0,'pitch']
-        roll = self.df.loc[0,'roll']
-        yaw = self.df.loc[0,'yaw']
-        '''
-        acc_abs = self.df.loc[0,'acc_abs']
-        millis = self.df.loc[0,'millis']
-        counter = self.df.loc[0,'counter']
-        y_exceeded_mean = self.df.loc[17, 'y_exceeded_mean']
+        ''' Log buffer values for the newest scan '''
+        acc_x = self.buffer.latest('acc_x')[0]
+        acc_y = self.buffer.latest('acc_y')[0]
+        acc_z = self.buffer.latest('acc_z')[0]
+        pitch = self.buffer.latest('pitch')[0]
+        roll = self.buffer.latest('roll')[0]
+        yaw = self.buffer.latest('yaw')[0]
+        acc_abs = self.buffer.latest('acc_abs')[0]
+        millis = self.buffer.latest('millis')[0]
+        counter = self.buffer.latest('counter')[0]
+        y_exceeded_mean = self.buffer.latest('y_exceeded_mean')[0]
         #logging.debug(f'acc_x:{acc_x:7.2f} acc_y:{acc_y:7.2f} acc_z:{acc_z:7.2f} pitch:{pitch:7.2f} roll:{roll:7.2f} yaw:{yaw:7.2f} abs:{acc_abs:7.2f}, millis:{millis:12.0f}, counter:{counter:8.0f}')
         # logging.debug(f'acc_x:{acc_x:7.2f} acc_y:{acc_y:7.2f} acc_z:{acc_z:7.2f} abs:{acc_abs:7.2f}, millis:{millis:12.0f}, counter:{counter:8.0f}')
-        logging.debug(f'acc_x:{acc_x:7.2f} acc_y:{acc_y:7.2f} acc_z:{acc_z:7.2f} abs:{acc_abs:7.2f}, y_exceeded_main:{y_exceeded_mean:7.2f}')
+        logging.debug(f'acc_x:{acc_x:7.2f} acc_y:{acc_y:7.2f} acc_z:{acc_z:7.2f} pitch:{pitch:7.2f} roll:{roll:7.2f} yaw:{yaw:7.2f} abs:{acc_abs:7.2f}, y_exceeded_main:{y_exceeded_mean:7.2f}')
 
 
     def log_textedit(self, text):
@@ -241,6 +288,9 @@ class Handshake():
     def pause_button_clicked(self):
         ''' Toggle play/pause button and self.play. '''
         self.play = not(self.play)
+        if self.play and self.timer:
+            # leave the idle refresh rate straight away
+            self.timer.setInterval(self.governor.reset())
         self.pause_button_update_appearance()
         logging.debug(f'play-pause button: {self.play}')
 
@@ -258,7 +308,12 @@ class Handshake():
     def save_button_clicked(self):
         ''' Toogle save button and self.save. '''
         self.record = not(self.record) # toggle recording on or off
-        self.queue_out.put(self.record) # send self.record to thread running file handler
+        if self.acquisition:
+            self.acquisition.send_control('record', self.record) # send self.record to the worker process
+        elif self.devices:
+            self.devices.record(self.record) # each watch is recorded to its own file
+        else:
+            self.queue_out.put(self.record) # send self.record to thread running file handler
         self.save_button_update_appearance()
         logging.debug(f'record button: {self.record}')
         self.log_textedit(f'recording to file: {self.record}')
@@ -276,59 +331,110 @@ class Handshake():
 
     def sensor_update_rate(self):
         ''' Calculate the sensor update frequency. '''
-        # find first and last none NaN indices
+        # only the valid part of the millis column of the last plotted snapshot is used
         update_frequency = 0
-        try:
-            millis_list = self.df['millis'].tolist()
-        except TypeError as e:  # no data causes a Typerror
-            return
-        cleaned_millis_list = [x for x in millis_list if not math.isnan(x)]
-        if len(cleaned_millis_list)>1:
+        if self.plot_columns is None:
+            return None
+        millis = self.plot_columns['millis']
+        millis = millis[~np.isnan(millis)]
+        if len(millis)>1:
             try:
-                update_frequency = 1000*(len(cleaned_millis_list)-1)/(cleaned_millis_list[0] - cleaned_millis_list[-1])
+                update_frequency = 1000*(len(millis)-1)/(millis[-1] - millis[0])
             except ZeroDivisionError as e:
                 return None
         return update_frequency
 
 
+    def start_acquisition_threads(self, rolling_windows, replay_file=None, replay_speed=1.0, record_format='text',
+            serial_port=None, resample_rate=None):
+        ''' Set up the dataframe, serial connection and file threads in this process.
+        If replay_file is set, the recording is replayed instead of reading the serial port.
+        serial_port is found by Serial_Connect if it is None. '''
+        # set up a dispatcher to receive blocks of data from the sensor data parser, or from the resampler
+        self.resampler = Resampler(resample_rate, sender=ds.PARSER_SENDER) if resample_rate else None
+        signal = ds.RESAMPLED_SIGNAL if resample_rate else ds.PARSER_SIGNAL
+        block_dispatcher.connect(self.dispatcher_receive_data, signal=signal, sender=ds.PARSER_SENDER)
+        # ---- setup dataframe that stores sensor and filtered data
+        self.dataframe = DataFrame(self.max_rows, rolling_windows=rolling_windows)
+        self.buffer = self.dataframe.buffer # ring buffer, only used on the serial thread
+        self.snapshot = self.dataframe.snapshot # consistent copies of the columns to plot
+        # ----- Set up the serial connection, read by its event loop in a thread
+        self.serial_connection = None
+        if replay_file:
+            self.replay = ReplayData(replay_file, speed=replay_speed, loop=True)
+            threading.Thread(target=self.replay.run, daemon=True).start()
+        else:
+            self.serial_connection = Serial_Connect(serial_port=serial_port)
+            self.serial_connection.start()
+        self.queue_out = queue.Queue(maxsize=1) # for inter-thread communication
+        self.file_thread = threading.Thread(target=Files, args=(self.queue_out,),
+            kwargs={'record_format': record_format}) # starts in a thread
+        self.file_thread.start() # start the thread
+
+
+    def start_timer(self):
+        ''' Create and start the graph timer, its interval is then set by self.governor. '''
+        self.timer = pg.QtCore.QTimer()
+        self.timer.timeout.connect(self.timer_timout)
+        # timer units are milliseconds
+        self.timer.start(self.governor.interval_ms)
+
+
+    def stop(self):
+        ''' Stop the worker process in multi-process mode, the watches, or the file thread, so that recordings
+        are closed. '''
+        if self.acquisition:
+            self.acquisition.stop()
+        elif self.devices:
+            self.devices.stop()
+        else:
+            if self.serial_connection:
+                self.serial_connection.stop()
+            self.queue_out.put('stop')
+            self.file_thread.join()
+
+
     def timer_timout(self):
         ''' Triggered by QTimer timeout. '''
-        self.update_line_graphs()
-        # append now_time to self.time_list to calculate update rate
-        now_time = time.time()
-        # append new time to time_list then roll the list down
-        self.time_list.append(now_time)
+        tick_start = time.perf_counter()
+        tick_interval = tick_start - self.last_tick_start if self.last_tick_start else None
+        self.last_tick_start = tick_start
+        curves_redrawn = self.update_line_graphs()
+        # count redraws and skipped ticks to calculate update rate
+        self.render_counter.add_tick(curves_redrawn)
         self.display_update_rates() # display graph and sensor update rates
+        # set the next timer interval from how long this tick took and how late it was
+        idle = not self.play or self.win.isMinimized() or not self.win.isVisible()
+        interval = self.governor.update(time.perf_counter() - tick_start, tick_interval, self.sensor_rate, idle)
+        if self.timer and interval != self.timer.interval():
+            self.timer.setInterval(interval)
 
 
     def update_line_graphs(self):
-        ''' Update all of the accelerometer and other line graphs. '''
+        ''' Update the accelerometer and other line graphs whose data has changed.
+        Return the number of curves redrawn. '''
         # check that the play/pause button is set to play
         if not self.play:
-            return
-        try:
-            acc_x = self.df['acc_x'].to_numpy()
-            acc_y = self.df['acc_y'].to_numpy()
-            acc_z = self.df['acc_z'].to_numpy()
-            ''' pitch, roll, yaw not in use
-            pitch = self.df['pitch'].to_numpy()
-            roll = self.df['roll'].to_numpy()
-            yaw = self.df['yaw'].to_numpy()
-            '''
-            abs = self.df['acc_abs'].to_numpy()
-            y_exceeded_mean = self.df['y_exceeded_mean'].to_numpy()
-            self.curve_xacc.setData(acc_x)
-            self.curve_yacc.setData(acc_y)
-            self.curve_zacc.setData(acc_z)
-            ''' pitch, roll, yaw not in use
-            self.curve_pitch.setData(pitch)
-            self.curve_yaw.setData(yaw)
-            self.curve_roll.setData(roll)
-            '''
-            self.curve_abs.setData(abs)
-            self.curve_y_exceeded_mean.setData(y_exceeded_mean)
-        except TypeError as e:
-            logging.debug('no data to update')
+            return 0
+        curves_redrawn = 0
+        for number, snapshot in enumerate(self.snapshots):
+            # columns all come from the same update, oldest scan first, no copy is made
+            generation, columns = snapshot.acquire(self.plot_generations[number])
+            if columns is None:
+                # nothing new to plot from this watch
+                continue
+            self.plot_generations[number] = generation
+            if number == 0:
+                self.plot_columns = columns
+            if not np.isnan(columns['host_ms'][-1]):
+                self.plot_ages[number] = 1000*time.time() - columns['host_ms'][-1]
+            try:
+                for curve_tracker in self.curve_trackers[number]:
+                    curves_redrawn += curve_tracker.update(columns, generation)
+                latency.rendered()
+            except TypeError as e:
+                logging.debug('no data to update')
+        return curves_redrawn
 
 
 
@@ -340,11 +446,62 @@ class Handshake():
 
 
 if __name__ == '__main__' :
-    handshake = Handshake()
-
-    timer = pg.QtCore.QTimer()
-    timer.timeout.connect(handshake.timer_timout)
-
-    # timer units are milliseconds. timer.start(0) to go as fast as practical.
-    timer.start(UPDATE_MS) # timer timeout in ms
+    arg_parser = argparse.ArgumentParser(description='graph T-Watch accelerometer data')
+    arg_parser.add_argument('--multiprocess', action='store_true',
+        help='read and process data in a separate process, the GUI process only plots')
+    arg_parser.add_argument('--replay', metavar='FILE', help='replay a recording instead of reading the serial port')
+    arg_parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 0 for as fast as possible')
+    arg_parser.add_argument('--rows', type=int, default=DataFrame.MAX_DATAFRAME_ROWS,
+        help='number of scans in the plotted window, e.g. 10000')
+    arg_parser.add_argument('--min-fps', type=float, default=frame_governor.MIN_FPS, help='lowest graph refresh rate')
+    arg_parser.add_argument('--max-fps', type=float, default=frame_governor.MAX_FPS, help='highest graph refresh rate')
+    arg_parser.add_argument('--record-format', choices=files.RECORD_FORMATS, default='text',
+        help='format of recordings made with the save button, see binary_recording.py and compressed_recording.py')
+    arg_parser.add_argument('--latency', action='store_true',
+        help='show per stage latency from serial read to graph update in the textedit')
+    arg_parser.add_argument('--port', help='serial port to read, found automatically by default')
+    arg_parser.add_argument('--ports', nargs='+', metavar='PORT', help='serial ports of several watches to read')
+    arg_parser.add_argument('--watches', type=int, default=1,
+        help='number of watches to read, their ports are found automatically unless --ports is given')
+    arg_parser.add_argument('--layout', choices=Handshake.LAYOUTS, default='side',
+        help='plot several watches side by side, or overlaid on one set of plots')
+    arg_parser.add_argument('--resample', type=float, metavar='RATE',
+        help='process and plot scans resampled to RATE scans/s, recordings stay raw, see resampler.py')
+    arg_parser.add_argument('--load', type=float, metavar='RATE',
+        help='read a synthetic T-Watch sending RATE scans/s on a pty, see load_generator.py')
+    arg_parser.add_argument('--load-protocol', choices=['text', 'binary'], default='text')
+    args = arg_parser.parse_args()
+    if args.replay and args.multiprocess:
+        # the worker process only reads the serial port
+        arg_parser.error('--replay is not supported with --multiprocess')
+    if (args.ports or args.watches > 1) and (args.replay or args.multiprocess):
+        arg_parser.error('several watches are not supported with --replay or --multiprocess')
+    load_generators = []
+    if args.load:
+        # imported here as it needs a posix pty
+        from load_generator import LoadGenerator
+        load_generators = [LoadGenerator(args.load, args.load_protocol) for number in range(args.watches)]
+        for load_generator in load_generators:
+            load_generator.start()
+        args.ports = [load_generator.port for load_generator in load_generators]
+    elif args.watches > 1 and not args.ports:
+        args.ports = find_serial_ports()[:args.watches]
+        if len(args.ports) < args.watches:
+            arg_parser.error(f'found {len(args.ports)} serial ports for {args.watches} watches: {args.ports}')
+    if args.latency:
+        # enabled before the acquisition threads or process start
+        latency.enable()
+    handshake = Handshake(multiprocess=args.multiprocess, replay_file=args.replay, replay_speed=args.speed,
+        max_rows=args.rows, min_fps=args.min_fps, max_fps=args.max_fps, record_format=args.record_format,
+        serial_port=args.port, serial_ports=args.ports, layout=args.layout, resample_rate=args.resample)
+    # the graph refresh rate is set by handshake.governor
+    handshake.start_timer()
     pg.exec()
+    handshake.stop()
+    if args.latency:
+        print(latency.dump())
+    if handshake.devices:
+        print(handshake.devices.stats())
+    for load_generator in load_generators:
+        print(load_generator.stats())
+        load_generator.close()
@@ -0,0 +1,131 @@
+'''
+Read several T-Watches at once, e.g. one on each wrist of two people shaking hands.
+Part of the handshake project: mattoppenheim.com/handshake
+
+MultiDevice opens a Device for each serial port. Each Device has its own Serial_Connect,
+parser, DataFrame, IMU_calcs and file recorder, so the watches do not share any state.
+Each parser publishes from its own sender, 'parser_sender watch0', 'parser_sender watch1' ...
+All of the ports are read by one AcquisitionLoop thread, see acquisition_loop.py, which
+only wakes when one of them has data, so the cost grows with the data read, not with
+the number of watches.
+
+Each watch counts millis from when it was switched on, so millis from different watches
+can not be compared. Each DataFrame's clock_sync.ClockEstimator tracks the offset and drift
+of its watch's clock against the host clock, and stores the host time of each scan in the
+host_ms column. Plotted against host_ms, the watches share one time axis.
+
+stats() gives each watch's scans, blocks, clock estimate and parser counters.
+
+@author: matthew oppenheim
+last update: 2025_05_24
+'''
+from acquisition_loop import AcquisitionLoop
+import block_dispatcher
+from dataframe import DataFrame
+import dispatcher_signals as ds
+from files import Files
+from imu_calcs import IMU_calcs
+import queue
+from resampler import Resampler
+from serial_connection import Serial_Connect
+import threading
+import time
+
+
+class Device():
+    ''' One watch: its Serial_Connect and parser, DataFrame, IMU_calcs and recorder. '''
+
+    def __init__(self, name, serial_port, loop, max_rows=DataFrame.MAX_DATAFRAME_ROWS, rolling_windows=None,
+            record_format='text', save_dir=None, resample_rate=None):
+        self.name = name
+        self.sender = f'{ds.PARSER_SENDER} {name}'
+        self.imu = IMU_calcs()
+        windows = rolling_windows or (self.imu.rolling_window_length,)
+        self.dataframe = DataFrame(max_rows, rolling_windows=windows)
+        self.snapshot = self.dataframe.snapshot # consistent copies of the columns to plot
+        self.scans = 0
+        self.blocks = 0
+        # with resample_rate, the dataframe gets scans resampled to resample_rate scans per s
+        self.resampler = Resampler(resample_rate, sender=self.sender) if resample_rate else None
+        self.signal = ds.RESAMPLED_SIGNAL if resample_rate else ds.PARSER_SIGNAL
+        block_dispatcher.connect(self.receive_data, signal=self.signal, sender=self.sender)
+        # each watch is recorded to its own file, named with self.name
+        self.files_queue = queue.Queue(maxsize=1)
+        self.file_thread = threading.Thread(target=Files, args=(self.files_queue,),
+            kwargs={'save_dir': save_dir, 'record_format': record_format, 'sender': self.sender, 'device': name},
+            daemon=True)
+        self.file_thread.start()
+        self.serial_connection = Serial_Connect(serial_port=serial_port, loop=loop, sender=self.sender)
+
+
+    def receive_data(self, message):
+        ''' Update the DataFrame and features with a block of scans from this watch. '''
+        self.dataframe.update_dataframe(message)
+        self.imu.update_buffer(self.dataframe.buffer, len(message))
+        self.dataframe.publish_snapshot()
+        self.scans += len(message)
+        self.blocks += 1
+
+
+    def stats(self):
+        ''' Return a dictionary of scans and blocks received, the clock estimate and the parser counters. '''
+        stats = {'scans': self.scans, 'blocks': self.blocks, 'clock': self.dataframe.clock.stats()}
+        stats.update(self.serial_connection.parser.stats())
+        if self.resampler:
+            stats['resampler'] = self.resampler.stats()
+        return stats
+
+
+    def stop(self):
+        ''' Stop reading, and close the recording. '''
+        self.serial_connection.stop()
+        block_dispatcher.disconnect(self.receive_data, self.signal)
+        if self.resampler:
+            self.resampler.stop()
+        self.files_queue.put('stop')
+        self.file_thread.join()
+
+
+class MultiDevice():
+    ''' Read a Device for each serial port on one AcquisitionLoop thread. '''
+
+    def __init__(self, serial_ports, max_rows=DataFrame.MAX_DATAFRAME_ROWS, rolling_windows=None, record_format='text',
+            save_dir=None, resample_rate=None):
+        if len(set(serial_ports)) != len(serial_ports):
+            raise ValueError(f'each watch needs its own serial port, not {serial_ports}')
+        self.loop = AcquisitionLoop()
+        self.devices = [Device(f'watch{number}', serial_port, self.loop, max_rows, rolling_windows, record_format,
+            save_dir, resample_rate) for number, serial_port in enumerate(serial_ports)]
+        self.start_ms = 1000*time.time() # origin of the shared time axis
+
+
+    def __iter__(self):
+        return iter(self.devices)
+
+
+    def __len__(self):
+        return len(self.devices)
+
+
+    def record(self, value):
+        ''' Start, True, or stop, False, recording every watch. '''
+        for device in self.devices:
+            device.files_queue.put(value)
+
+
+    def start(self):
+        ''' Start reading every watch on the loop thread. '''
+        self.loop.start()
+
+
+    def stats(self):
+        ''' Return a dictionary of each watch's stats, by name. '''
+        return {device.name: device.stats() for device in self.devices}
+
+
+    def stop(self):
+        ''' Stop reading, close the recordings and end the loop thread. '''
+        self.loop.stop()
+        for device in self.devices:
+            device.stop()
+        self.loop.close()
@@ -6,27 +6,38 @@ Sensor data example:
 
 [DEBUG] accelerometer.cpp L.39 log_acc : ST m:  10041 c:  57 x:  228 y:  270 z:  -369 EN
 
-Parses data into a named tuple 'acc_data_structure'.
+Parses data into a numpy structured array of ads.acc_scan_dtype.
 Details are in accelerometer_data_structure.py.
 
-Publishes this structure.
+Publishes each block of parsed scans using block_dispatcher.
+
+parse_batch parses a chunk holding many scans into a numpy structured array
+in one pass, using a single compiled regex. See benchmarks/bench_parser.py.
 
 Originally written for partial scans from wireless coms which needed assembling.
 Assembles fragments of scans and handles multiple scans.
+Received data is framed in place by a StreamFramer, partial scans are carried
+across reads. Frames that fail to parse and gaps in the scan counter are counted,
+so that parser drops can be told apart from radio or USB drops.
 
-last update: 2025_04_14
+last update: 2025_05_06
 
 @author: matthew oppenheim
 
 '''
 import accelerometer_data_structure as ads
+import block_dispatcher
 import dispatcher_signals as ds
+import latency
 import logging
-from pydispatch import dispatcher
+import numpy as np
 import re
+from stream_framer import StreamFramer
 import time
 import utilities
 
+COUNTER_MODULUS = 2**16 # the watch counter is an int16 and wraps
+
 
 class Parse_accelerometer_data():
     ''' Parse accelerometer data '''
@@ -43,25 +54,44 @@ class Parse_accelerometer_data():
     REGEX_acc_x = r'(.*\s*x:)(\s*)(?P<acc_x>.[0-9]+)'
     REGEX_acc_y = r'(.*\s*y:)(\s*)(?P<acc_y>.[0-9]+)'
     REGEX_acc_z = r'(.*\s*z:)(\s*)(?P<acc_z>.[0-9]+)'
+    # single regex used by parse_batch, captures the fields of a complete scan between ST and EN
+    REGEX_SCAN = rb'ST(\s+m:\s*-?\d+\s+c:\s*-?\d+\s+x:\s*-?\d+\s+y:\s*-?\d+\s+z:\s*-?\d+\s+)EN'
+    SCAN_PATTERN = re.compile(REGEX_SCAN)
+    # field labels removed from the captured scans, leaving only the numbers
+    FIELD_LABELS = b'mcxyz:'
 
-    def __init__(self, delta=100000):
+    def __init__(self, delta=100000, sender=ds.PARSER_SENDER):
         # delta is the time between scans
         self.time_delta = delta
-        # self.partial_scan is used to store incomplete fragments of scans to be added to
-        # the start of subsequent scans
-        self.partial_scan = None
+        # blocks are published from sender, one per watch when several are read at once
+        self.sender = sender
+        # the framer stores incomplete fragments of scans until the rest of the scan arrives
+        self.framer = StreamFramer(self.START_MARKER.encode(), self.END_MARKER.encode())
+        self.last_counter = None # counter of the last parsed scan
+        self.frames_lost = 0 # scans missing from the counter sequence
+        self.frames_malformed = 0 # framed scans that could not be parsed
+        self.scans_out_of_range = 0 # scans dropped as a value did not fit its field
+        self.scans_parsed = 0
         self.acc_scan = ads.acc_data_structure
         # ---- identifiers to mark start and end of sensor data reading
         # accelerometer data headers
         self.num_data_fields = len(ads.acc_data_headers)
 
 
-    def check_counter(self, counter):
-        ''' check the counter has incremented correctly '''
-        counter_delta = int(counter)-self.old_counter
-        # counter_delta will be 2^16 when the counter rolls over
-        if counter_delta != 1 or counter_delta !=2^16 :
-            logging.error('*** counter delta is {}'.format(counter_delta))
+    def check_counters(self, counters):
+        ''' Count scans missing from the incrementing counters of a batch of parsed scans. '''
+        if len(counters) == 0:
+            return
+        counters = counters.astype(np.int64)
+        previous = counters[0] - 1 if self.last_counter is None else self.last_counter
+        # modular, so that scans lost across the counter wrap are counted
+        deltas = np.diff(counters, prepend=previous) % COUNTER_MODULUS
+        # a delta of more than half the modulus is a counter going backwards, i.e. a watch reset, not a loss
+        gaps = deltas[(deltas > 1) & (deltas < COUNTER_MODULUS // 2)]
+        if len(gaps):
+            self.frames_lost += int(gaps.sum() - len(gaps))
+            logging.debug(f'*** counter gaps: {gaps.tolist()}')
+        self.last_counter = int(counters[-1])
 
 
     def check_delta(self, delta):
@@ -81,8 +111,8 @@ class Parse_accelerometer_data():
 
 
     def dispatcher_send_data(self, data):
-        ''' Publish data '''
-        dispatcher.send(signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER, message=data)
+        ''' Publish data, a block of scans '''
+        block_dispatcher.send(signal=ds.PARSER_SIGNAL, sender=self.sender, message=data)
 
 
     def extract_single_scan(self, multi_scans, START_MARKER, END_MARKER):
@@ -98,31 +128,54 @@ class Parse_accelerometer_data():
         return multi_scans, single_scan
 
 
-    def parse_new_data(self, new_data, START_MARKER=START_MARKER, END_MARKER=END_MARKER):
-        ''' Parse all of the received data which may contain multiple scans or fragments.
-        Send complete scans as acc_data_structure's to the dispatcher. '''
-        remaining_data = None # to store data after a single_scan is removed from it
-        # new_data = new_data.decode()
-        if not self.check_valid_data(new_data):
+    def parse_batch(self, data, start=0, end=None):
+        ''' Parse all complete scans in <data> to a numpy structured array of ads.acc_scan_dtype.
+        <data> is str, bytes or bytearray, only data[start:end] is parsed, without copying it.
+        Incomplete or corrupt scans are ignored. Scans with a value too big for its field, e.g. an
+        acceleration outside int16 from a corrupt digit, are dropped and counted in scans_out_of_range. '''
+        if isinstance(data, str):
+            data = data.encode(errors='replace')
+        if end is None:
+            end = len(data)
+        scans = self.SCAN_PATTERN.findall(data, start, end)
+        parsed = np.zeros(len(scans), dtype=ads.acc_scan_dtype)
+        if not scans:
+            return parsed
+        # join the captured fields, strip the labels and convert all of the numbers in one call
+        numbers = b''.join(scans).translate(None, self.FIELD_LABELS).split()
+        values = np.array(numbers, dtype=np.int64).reshape(-1, self.num_data_fields)
+        # astype would wrap values that do not fit silently
+        in_range = np.ones(len(values), dtype=bool)
+        for index, header in enumerate(ads.acc_data_headers):
+            limits = np.iinfo(ads.acc_scan_dtype[header])
+            in_range &= (values[:, index] >= limits.min) & (values[:, index] <= limits.max)
+        if not in_range.all():
+            self.scans_out_of_range += int(np.count_nonzero(~in_range))
+            logging.debug(f'*** scans out of range: {values[~in_range].tolist()}')
+            values = values[in_range]
+            parsed = parsed[:len(values)]
+        for index, header in enumerate(ads.acc_data_headers):
+            parsed[header] = values[:, index]
+        return parsed
+
+
+    def parse_new_data(self, new_data):
+        ''' Parse all of the received data, str or bytes, which may contain multiple scans or fragments.
+        Send complete scans as a block to the dispatcher.
+        Returns the parsed scans as a numpy structured array. '''
+        self.framer.feed(new_data)
+        # any partial scan left over stays in the framer until the rest of it is received
+        span = self.framer.take_complete()
+        if span is None:
             return None
-        # if the previous scan contained the start of a partial scan
-        if self.partial_scan:
-            # tack the partial start of the scan onto the start of the most recent scan
-            new_data=str(self.partial_scan+new_data)
-        while True:
-            # Repeatedly extract, parse and convert single_scans to acc_data_structure
-            # until no data or a partial scan is left.
-            try:
-                # the returned new_data has single_scan removed from it
-                new_data, single_scan = self.extract_single_scan(new_data, self.START_MARKER, self.END_MARKER)
-                acc_data_structure = self.parse_single_scan(single_scan)
-                # publish the new accelerometer_data_structure using pydispatcher
-                self.dispatcher_send_data(acc_data_structure)
-            except ValueError:
-                # if only a partial scan is left, a ValueError is raised
-                # any partial scan left over will be tacked onto the start of the next received scan
-                self.partial_scan=remaining_data
-                break
+        start, end = span
+        parsed = self.parse_batch(self.framer.buffer, start, end)
+        # every start marker in the span should have produced a scan
+        frames_started = self.framer.buffer.count(self.framer.start_marker, start, end)
+        if len(parsed) < frames_started:
+            self.frames_malformed += frames_started - len(parsed)
+        self.publish_scans(parsed)
+        return parsed
 
 
 # t_watch data parser
@@ -150,5 +203,28 @@ class Parse_accelerometer_data():
         # publish scan_numpy_row using dispatcher
         return acc_data_structure
 
+
+    def publish_scans(self, parsed):
+        ''' Check the counters of parsed scans, then publish them as one block.
+        Used for scans parsed from text and for scans decoded from binary frames. '''
+        if len(parsed) == 0:
+            return
+        self.check_counters(parsed['counter'])
+        self.scans_parsed += len(parsed)
+        latency.record('parse')
+        # publish the block of scans using block_dispatcher
+        self.dispatcher_send_data(parsed)
+
+
+    def stats(self):
+        ''' Return a dictionary of parser and framer counters.
+        Scans missing from the counter sequence that were not malformed frames were lost
+        before they reached the parser, on the radio or USB link. '''
+        stats = self.framer.stats()
+        stats.update({'scans_parsed': self.scans_parsed, 'frames_lost': self.frames_lost,
+            'frames_malformed': self.frames_malformed, 'scans_out_of_range': self.scans_out_of_range,
+            'link_drops': max(0, self.frames_lost - self.frames_malformed - self.framer.frames_dropped_partial)})
+        return stats
+
 if __name__ == '__main__':
     parse = Parse_accelerometer_data()
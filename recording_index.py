@@ -0,0 +1,329 @@
+'''
+Time index for recordings, for seeking to a moment in a long recording without reading it from the start.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The index is a sidecar file, the recording's file name with INDEX_EXTENSION added.
+It holds one entry for every STRIDE scans: the scan number, the byte offset of the scan
+in the recording, its device millis and its host time.time().
+
+The Recorder in files.py adds entries as it writes, with the host time of each block's arrival.
+For an older recording, or one whose index is missing or out of date, the index is
+built or extended when a RecordingIndex is created, and saved for next time.
+Rebuilt host times are estimated from the millis, anchored to the last entry with a
+host time, the binary or compressed recording start time, or the text file's modification time.
+In a compressed recording, see compressed_recording.py, an entry's offset is that of the chunk holding the scan.
+
+Seeking uses np.searchsorted on the entries, so it is O(log n) and reads at most one
+stride of scans from the recording. Millis and host time are assumed to increase through
+a recording, as they do unless the watch is restarted part way through.
+
+Index file, little endian: magic b'HSIDX\x00\r\n', uint16 version, 2 spare bytes,
+uint32 stride, then entries of INDEX_DTYPE.
+
+Use:
+index = RecordingIndex('2025_05_18:14:00:00_handshake_data.hsr')
+scans = index.read_time_range(start_time, end_time)
+scans = index.read_millis_range(start_millis, end_millis)
+
+@author: matthew oppenheim
+last update: 2025_05_19
+'''
+import binary_recording
+import compressed_recording
+import logging
+import numpy as np
+import os
+import re
+import struct
+
+INDEX_DTYPE = np.dtype([('scan', '<i8'), ('offset', '<i8'), ('millis', '<i8'), ('host_time', '<f8')])
+INDEX_EXTENSION = '.idx'
+INDEX_HEADER_FORMAT = '<8sH2xI'
+INDEX_HEADER_SIZE = struct.calcsize(INDEX_HEADER_FORMAT)
+INDEX_MAGIC = b'HSIDX\x00\r\n'
+INDEX_VERSION = 1
+MILLIS_PATTERN = re.compile(rb"millis='?\s*(-?\d+)")
+READ_CHUNK_BYTES = 1 << 20 # bytes of a text recording read at a time
+STRIDE = 1024 # scans between index entries
+
+
+class RecordingIndex():
+    ''' Index of a text, binary or compressed recording made by files.py. '''
+
+    def __init__(self, recording_path, stride=STRIDE):
+        self.recording_path = str(recording_path)
+        self.index_path = self.recording_path + INDEX_EXTENSION
+        self.stride = stride
+        self.binary = os.path.getsize(self.recording_path) > 0 and \
+            binary_recording.is_binary_recording(self.recording_path)
+        self.compressed = os.path.getsize(self.recording_path) > 0 and \
+            compressed_recording.is_compressed_recording(self.recording_path)
+        self.entries = np.zeros(0, dtype=INDEX_DTYPE)
+        self.index_file = None # kept open to append entries
+        self.num_scans = 0 # scans in the recording covered by the index
+        self.end_offset = 0 # byte offset after the last complete scan
+        self.load()
+        self.update()
+
+
+    def add_block(self, millis, offsets, end_offset, host_time):
+        ''' Add the entries for a block of scans just written to the recording.
+        millis and offsets are arrays with the millis and byte offset of each scan in the block,
+        end_offset is the byte offset after the block, host_time the time.time() the last scan arrived. '''
+        first_entry = -(-self.num_scans // self.stride) * self.stride - self.num_scans
+        positions = np.arange(first_entry, len(millis), self.stride)
+        if len(positions):
+            entries = np.zeros(len(positions), dtype=INDEX_DTYPE)
+            entries['scan'] = self.num_scans + positions
+            entries['offset'] = np.asarray(offsets)[positions]
+            entries['millis'] = np.asarray(millis)[positions]
+            entries['host_time'] = host_time - (millis[-1] - entries['millis']) / 1000
+            self.append_entries(entries)
+        self.num_scans += len(millis)
+        self.end_offset = end_offset
+
+
+    def append_entries(self, entries):
+        ''' Add entries to self.entries and to the index file. '''
+        self.entries = np.concatenate((self.entries, entries))
+        try:
+            if self.index_file is None:
+                new_file = not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0
+                self.index_file = open(self.index_path, 'ab')
+                if new_file:
+                    self.index_file.write(struct.pack(INDEX_HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION, self.stride))
+            self.index_file.write(entries.tobytes())
+        except OSError as e:
+            # e.g. a read only directory, the index is still used from memory
+            logging.debug(f'could not write index {self.index_path}: {e}')
+
+
+    def close(self):
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+
+    def estimate_host_times(self, new_entries):
+        ''' Fill in the host times of entries found by reading the recording. '''
+        if len(self.entries):
+            anchor_time, anchor_millis = self.entries['host_time'][-1], self.entries['millis'][-1]
+        elif self.binary or self.compressed:
+            anchor_time, anchor_millis = self.start_time, new_entries['millis'][0]
+        else:
+            # the text file was last written when its last scan arrived
+            anchor_time, anchor_millis = os.path.getmtime(self.recording_path), self.last_millis
+        new_entries['host_time'] = anchor_time + (new_entries['millis'] - anchor_millis) / 1000
+
+
+    def flush(self):
+        if self.index_file is not None:
+            self.index_file.flush()
+
+
+    def load(self):
+        ''' Read the index file, keeping the entries that match the recording.
+        An index file that can not be used is replaced. '''
+        entries = np.zeros(0, dtype=INDEX_DTYPE)
+        try:
+            with open(self.index_path, 'rb') as file_object:
+                magic, version, stride = struct.unpack(INDEX_HEADER_FORMAT, file_object.read(INDEX_HEADER_SIZE))
+                data = file_object.read()
+            if magic == INDEX_MAGIC and version == INDEX_VERSION and stride == self.stride:
+                entries = np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)
+        except (OSError, struct.error):
+            pass
+        # keep entries up to the first one that does not fit the recording, e.g. written before a crash
+        valid = (entries['scan'] == np.arange(len(entries)) * self.stride) & \
+            (entries['offset'] < os.path.getsize(self.recording_path))
+        num_valid = len(entries) if valid.all() else int(np.argmin(valid))
+        if num_valid < len(entries) or (len(entries) == 0 and os.path.exists(self.index_path)):
+            self.rewrite(entries[:num_valid])
+        self.entries = entries[:num_valid].copy()
+
+
+    def millis_at_host_time(self, host_time):
+        ''' Return the device millis at host_time, from the nearest index entry at or before it. '''
+        entry = self.entries[self.seek_position(self.entries['host_time'], host_time)]
+        return int(entry['millis'] + round((host_time - entry['host_time']) * 1000))
+
+
+    def read_millis_range(self, start_millis=None, end_millis=None):
+        ''' Return the scans with start_millis <= millis < end_millis as an array of ads.acc_scan_dtype.
+        None means from the start or to the end of the recording. '''
+        if self.binary:
+            scans = binary_recording.BinaryRecording(self.recording_path).scans[:self.num_scans]
+            start = 0 if start_millis is None else self.scan_position(scans, start_millis)
+            end = len(scans) if end_millis is None else self.scan_position(scans, end_millis)
+            return np.array(scans[start:end])
+        offset = None
+        if start_millis is not None and len(self.entries):
+            offset = int(self.entries[self.seek_position(self.entries['millis'], start_millis)]['offset'])
+        if self.compressed:
+            recorded_blocks = compressed_recording.read_chunks(self.recording_path, offset)
+        else:
+            recorded_blocks = read_text_scans(self.recording_path, offset or 0)
+        blocks = []
+        for scans in recorded_blocks:
+            if start_millis is not None:
+                scans = scans[scans['millis'] >= start_millis]
+            if end_millis is not None and len(scans) and scans['millis'][-1] >= end_millis:
+                blocks.append(scans[scans['millis'] < end_millis])
+                break
+            blocks.append(scans)
+        # imported here as replay_data imports this module
+        from replay_data import values_to_scans
+        return np.concatenate(blocks) if blocks else values_to_scans([])
+
+
+    def read_time_range(self, start_time=None, end_time=None):
+        ''' Return the scans recorded between host times start_time and end_time, from time.time().
+        None means from the start or to the end of the recording. '''
+        if not len(self.entries):
+            return self.read_millis_range()
+        start_millis = None if start_time is None else self.millis_at_host_time(start_time)
+        end_millis = None if end_time is None else self.millis_at_host_time(end_time)
+        return self.read_millis_range(start_millis, end_millis)
+
+
+    def rewrite(self, entries):
+        ''' Replace the index file with entries. '''
+        try:
+            with open(self.index_path, 'wb') as file_object:
+                file_object.write(struct.pack(INDEX_HEADER_FORMAT, INDEX_MAGIC, INDEX_VERSION, self.stride))
+                file_object.write(entries.tobytes())
+        except OSError as e:
+            logging.debug(f'could not write index {self.index_path}: {e}')
+
+
+    def scan_position(self, scans, millis):
+        ''' Return the position of the first scan in a memory mapped binary recording with millis >= millis.
+        Only the stride of scans after the nearest index entry is read. '''
+        position = self.seek_position(self.entries['millis'], millis)
+        start = int(self.entries['scan'][position]) if len(self.entries) else 0
+        end = int(self.entries['scan'][position+1]) + 1 if position + 1 < len(self.entries) else len(scans)
+        return start + int(np.searchsorted(np.array(scans['millis'][start:end]), millis))
+
+
+    @staticmethod
+    def seek_position(values, value):
+        ''' Return the position of the last entry in values at or before value, 0 if there is none. '''
+        return max(int(np.searchsorted(values, value, side='right')) - 1, 0)
+
+
+    def update(self):
+        ''' Extend the index to the end of the recording, e.g. for an old recording or one still being written. '''
+        if self.binary:
+            new_entries = self.update_binary()
+        elif self.compressed:
+            new_entries = self.update_compressed()
+        else:
+            new_entries = self.update_text()
+        if len(new_entries):
+            self.estimate_host_times(new_entries)
+            self.append_entries(new_entries)
+            self.flush()
+
+
+    def update_binary(self):
+        ''' Return the new entries for a binary recording, from its memory map. '''
+        recording = binary_recording.BinaryRecording(self.recording_path)
+        self.start_time = recording.start_time
+        header_size = recording.header['header_size']
+        self.num_scans = len(recording)
+        self.end_offset = header_size + self.num_scans * binary_recording.RECORD_SIZE
+        positions = np.arange(len(self.entries) * self.stride, self.num_scans, self.stride)
+        entries = np.zeros(len(positions), dtype=INDEX_DTYPE)
+        entries['scan'] = positions
+        entries['offset'] = header_size + positions * binary_recording.RECORD_SIZE
+        entries['millis'] = recording.scans['millis'][positions]
+        return entries
+
+
+    def update_compressed(self):
+        ''' Return the new entries for a compressed recording, read from the chunk holding the last entry.
+        Only the chunks holding new entries are decompressed. '''
+        with open(self.recording_path, 'rb') as file_object:
+            header = compressed_recording.read_header(file_object)
+        self.start_time = header['start_time']
+        self.end_offset = header['header_size']
+        offset = int(self.entries['offset'][-1]) if len(self.entries) else None
+        new_entries = []
+        for chunk_offset, first_scan, num_scans, codec, payload in \
+                compressed_recording.read_chunk_records(self.recording_path, offset):
+            positions = np.arange(-(-first_scan // self.stride) * self.stride, first_scan + num_scans, self.stride)
+            positions = positions[positions >= len(self.entries) * self.stride]
+            if len(positions):
+                millis = compressed_recording.decode_chunk(codec, num_scans, payload)['millis']
+                new_entries.extend((position, chunk_offset, millis[position - first_scan], np.nan)
+                    for position in positions)
+            self.num_scans = first_scan + num_scans
+            self.end_offset = chunk_offset + compressed_recording.CHUNK_HEADER_SIZE + len(payload)
+        return np.array(new_entries, dtype=INDEX_DTYPE)
+
+
+    def update_text(self):
+        ''' Return the new entries for a text recording, read from the last entry to the end of the file.
+        Every non empty line is a scan, only the lines at index entries are parsed. '''
+        if len(self.entries):
+            scan, offset = int(self.entries['scan'][-1]), int(self.entries['offset'][-1])
+        else:
+            scan, offset = 0, 0
+        self.last_millis = None
+        new_entries = []
+        with open(self.recording_path, 'rb') as file_object:
+            file_object.seek(offset)
+            remainder = b''
+            chunk_offset = offset # byte offset of the start of remainder
+            while True:
+                data = file_object.read(READ_CHUNK_BYTES)
+                if not data:
+                    break
+                text = remainder + data
+                ends = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord('\n'))
+                if not len(ends):
+                    remainder = text
+                    continue
+                starts = np.concatenate(([0], ends[:-1] + 1))
+                non_empty = ends > starts
+                starts = starts[non_empty]
+                scans = scan + np.arange(len(starts))
+                for position in np.flatnonzero(scans % self.stride == 0):
+                    if scans[position] >= len(self.entries) * self.stride:
+                        start = int(starts[position])
+                        new_entries.append((scans[position], chunk_offset + start,
+                            line_millis(text[start:text.index(b'\n', start)]), np.nan))
+                if len(starts):
+                    self.last_millis = line_millis(text[int(starts[-1]):int(ends[-1])])
+                scan += len(starts)
+                remainder = text[ends[-1] + 1:]
+                chunk_offset += int(ends[-1]) + 1
+        self.num_scans = scan
+        self.end_offset = chunk_offset
+        return np.array(new_entries, dtype=INDEX_DTYPE)
+
+
+def line_millis(line):
+    ''' Return the millis in a recorded text line, as bytes. '''
+    match = MILLIS_PATTERN.search(line)
+    return int(match.group(1)) if match else 0
+
+
+def read_text_scans(file_path, offset=0):
+    ''' Yield arrays of ads.acc_scan_dtype read from a text recording, starting at byte offset. '''
+    # imported here as replay_data imports this module
+    from replay_data import RECORDED_SCAN_PATTERN, values_to_scans
+    with open(file_path, 'rb') as file_object:
+        file_object.seek(offset)
+        remainder = ''
+        while True:
+            data = file_object.read(READ_CHUNK_BYTES)
+            at_end = not data
+            text = remainder + data.decode()
+            last_line_end = len(text) if at_end else text.rfind('\n') + 1
+            remainder = text[last_line_end:]
+            values = RECORDED_SCAN_PATTERN.findall(text, 0, last_line_end)
+            if values:
+                yield values_to_scans(values)
+            if at_end:
+                break
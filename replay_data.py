@@ -1,152 +1,248 @@
 '''
-Replay saved data through a virtual port.
+Replay saved data through the live pipeline, without a serial port or a QApplication.
 Created on 26 May 2016
 
 @author: matthew oppenheim
-replays accelerometer data from a .txt file
-file data format:
-counter delta acc_x acc_y acc_z
-uses the delta to set the time for the next line of data to be sent
-output:
-b'START 76649 10001 -0.3162842 0.4382324 -0.9157715 END\r\n'
- To set up a connected pair of serial ports:
-socat -d -d pty,raw,echo=0,link=/tmp/ttyV0 pty,raw,echo=0,link=/tmp/ttyV1
- Set SERIAL_PORT to be one of the /tmp/ttyV<x> pair created.
- The data will be o/p on the other.
-To monitor o/p: gtkterm -p /tmp/ttyV1
-
-To do:
-pack data
-option to loop file when it gets to the end
+replays accelerometer data recorded by files.py, e.g. slow_swing_handshake_data.txt
+file data format, one scan per line:
+acc_scan(millis='416470', counter='4824', acc_x='-410', acc_y='301', acc_z=' 6')
+the quotes are optional, newer recordings are written without them
+binary recordings, see binary_recording.py, and compressed recordings, see compressed_recording.py,
+are also replayed. A compressed recording is decompressed a chunk at a time as it is replayed.
+
+Scans are injected either straight into the publish stage, as blocks of scans sent
+with block_dispatcher, or into the parser, as T-Watch debug log lines.
+
+Pacing uses the recorded millis:
+speed=1 replays in real time, speed=N replays N times faster,
+speed=0 replays as fast as possible, for load testing.
+Blocks are sent at absolute deadlines by a ReplayScheduler, see replay_scheduler.py, so the
+timing does not drift. Blocks cover block_ms of recorded time, block_ms=0 sends each scan
+at its own recorded time. stats() includes the scheduler's timing error stats.
+--latency prints the per stage latency stats from latency.py at the end.
+--process also updates a DataFrame and IMU_calcs with the replayed scans, as main.py does.
+--start and --end replay part of a recording, between two clock times, e.g. --start 14:02:10 --end 14:02:20.
+The recording's time index, see recording_index.py, is used to seek to the start without reading
+the recording up to it. Times are on the day the recording started.
+
+Headless use, from the scripts directory:
+python replay_data.py slow_swing_handshake_data.txt --speed 10
+
+last update: 2025_05_20
 '''
 
+import accelerometer_data_structure as ads
+import argparse
+import binary_recording
+import clock_sync
+import compressed_recording
+import datetime
+import latency
+import logging
 import numpy as np
 import os
-import accelerometer_data_structure as ads
-import serial_connection
-from pyqtgraph.Qt import QtCore, QtGui
+from parse_accelerometer_data import Parse_accelerometer_data
+import re
+from recording_index import RecordingIndex
+from replay_scheduler import ReplayScheduler
 import time
-import utilities as utilities
-from serial.serialutil import SerialException
-import struct
-import sys
-
-BAUD = 115200
-PACKER = ads.PACKER
-SERIAL_PORT = '/tmp/ttyV0'
-TEST_FILE = '/home/matthew/documents/infolab2/projects/hand_gesture/gui_data/2016_05_24_testing_Beaumont/Jack_hand/jack_2.txt'
-# frequency to transmit data in Hz
-TRANSMIT_FREQ = 2
+
+BLOCK_MS = 20 # recorded time in ms covered by one injected block
+FAST_BLOCK_SCANS = 64 # scans in one injected block when replaying as fast as possible
+LOG_LINE = '[DEBUG] accelerometer.cpp L.39 log_acc : ST m:  {} c:  {} x:  {} y:  {} z:  {} EN\r\n'
+REGEX_RECORDED_SCAN = (r"acc_scan\(millis='?\s*(-?\d+)'?, counter='?\s*(-?\d+)'?, acc_x='?\s*(-?\d+)'?, "
+    r"acc_y='?\s*(-?\d+)'?, acc_z='?\s*(-?\d+)'?\)")
+RECORDED_SCAN_PATTERN = re.compile(REGEX_RECORDED_SCAN)
+TEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slow_swing_handshake_data.txt')
+
 
 class ReplayData():
-    ''' replay saved data through a virtual serial port '''
-    def __init__(self, input_file):
-        self.app = QtGui.QApplication([])
-        self.frequency = TRANSMIT_FREQ
-        print('instigated replay_data')
-        self.input_file = TEST_FILE
-        self.initialise_generator(self.input_file)
-        #self.check_skipped(self.data_file_object)
-        self.acc_structure = ads.acc_data_structure
-        self.delta = 0
-        self.serial_connection = serial_utilities.serial_connect(SERIAL_PORT, BAUD)
-        if not self.serial_connection:
-            utilities.exit_code('no serial connection')
-        self.last_time = time()
-        self.interval = 1
-        self.counter = 1
-        timer = QtCore.QTimer()
-        timer.timeout.connect(lambda: self.timeout_handler(timer))
-        # timer units are milliseconds. timer.start(0) to go as fast as practical.
-        timer.start(1000/self.frequency)
-        if (sys.flags.interactive != 1) or not hasattr(QtCore, 'PYQT_'):
-            QtGui.QApplication.instance().exec_()
-
-    def calc_frequency(self, delta):
-        ''' update the transmission frequency '''
-        frequency = 1000000/delta
-        return frequency
-
-    def check_skipped(self, in_file):
-        ''' see if any counts are missing '''
-        counter = 0
-        old_counter = 0
-        for line in in_file:
-            old_counter = counter
-            counter, delta, acc_x, acc_y, acc_z = (float(d) for d in line.split())
-            counter = int(counter)
-            delta = int(delta)
-            count_increment = counter-old_counter
-            if count_increment !=1:
-                print('skipped {} counts at {}'.format(count_increment, counter))
-
-    def file_generator(self, file_object):
-        ''' creates a generator to return each line of the file '''
-        for line in file_object:
-            yield line
-        file_object.close()
-        print('end of file')
-
-    def get_scan(self):
-        ''' get next scan and assign types hhfff'''
-        try:
-            single_scan = next(self.data_file_generator).split()
-        except StopIteration as e:
-            print('file end reached')
-            self.initialise_generator(self.input_file)
-            return
-        single_scan[0:2] = [int(x) for x in single_scan[0:2]]
-        single_scan[2:5] = [float(x) for x in single_scan[2:5]]
-        return single_scan
-    
-    def initialise_generator(self, input_file):
-        ''' open data file as a generator '''
-        print('reading from: {}'.format(input_file))
-        self.data_file_object = self.open_file(input_file)
-        self.data_file_generator = self.file_generator(self.data_file_object)
-        
-    def scan_to_ads_format(self, single_scan):
-        ''' adds start and end identifiers to a scan '''
-        single_scan.insert(0,ads.SCAN_START)
-        single_scan.append(ads.SCAN_END)
-        return single_scan
-
-    def open_file(self, file_path):
-        ''' return a file object '''
-        try:
-            open_file = open(file_path, 'r')
-        except Exception as e:
-            print('error opening {}:/n{}'.format(file_path, e))
-            sys.exit()
-        return open_file
-
-    def pack_scan(self, scan_data):
-        ''' return packed scan_data '''
-        packed = struct.pack(PACKER, *scan_data)
-        return packed
-
-    def timeout_handler(self, timer):
-        ''' send data to the serial port and adjust timeout frequency '''
-        single_scan = self.get_scan()
-        try:
-            # convert to Acc_scan namedtuple
-            acc_scan = self.acc_structure(*single_scan)
-        except TypeError as e:
-            print('*** scan: {} error: {}'.format(single_scan, e))
-            return
-        # recover sampling frequency from the delta
-        delta_ms = int(acc_scan.delta)/1000
-        # set update frequency to the recorded data frequency
-        timer.setInterval(delta_ms)
-        if not single_scan:
-            print('*** no scan')
+    ''' Replay a recording into the parser or publish stage, paced from the recorded millis. '''
+
+    def __init__(self, input_file=TEST_FILE, speed=1.0, inject='publish', loop=False, block_ms=BLOCK_MS,
+            start_time=None, end_time=None, spin_ms=0):
+        ''' start_time and end_time are host time.time() values to replay between, None for the whole recording.
+        spin_ms is the time before each block's deadline that the scheduler polls for, 0 to only sleep. '''
+        if inject not in ('publish', 'parser'):
+            raise ValueError(f"inject must be 'publish' or 'parser', not {inject}")
+        self.input_file = input_file
+        self.speed = speed
+        self.inject = inject
+        self.loop = loop
+        self.block_ms = block_ms
+        self.parser = Parse_accelerometer_data()
+        self.streamed = start_time is None and end_time is None and \
+            compressed_recording.is_compressed_recording(input_file)
+        if self.streamed:
+            # decompressed as it is replayed, see scan_chunks
+            self.scans = None
+            logging.info(f'replaying {input_file}')
+        elif start_time is None and end_time is None:
+            self.scans = read_recording(input_file)
+        else:
+            self.scans = RecordingIndex(input_file).read_time_range(start_time, end_time)
+        if self.scans is not None:
+            logging.info(f'replaying {len(self.scans)} scans from {input_file}')
+        self.running = False
+        self.scans_sent = 0
+        self.blocks_sent = 0
+        self.start_time = None
+        self.scheduler = ReplayScheduler(speed, spin_time=spin_ms/1000) if speed else None
+
+
+    def block_boundaries(self, scans):
+        ''' Return the start index of each block of scans covering block_ms of recorded time,
+        or of each recorded millis if block_ms is 0. '''
+        if self.speed == 0:
+            return np.arange(0, len(scans), FAST_BLOCK_SCANS)
+        millis = scans['millis'] - scans['millis'][0]
+        block_numbers = millis // self.block_ms if self.block_ms else millis
+        return np.flatnonzero(np.diff(block_numbers, prepend=-1))
+
+
+    def inject_block(self, block):
+        ''' Send a block of scans into the pipeline. '''
+        latency.mark_arrival()
+        clock_sync.mark_arrival()
+        if self.inject == 'parser':
+            self.parser.parse_new_data(format_log_lines(block))
+        else:
+            self.parser.publish_scans(block)
+        self.scans_sent += len(block)
+        self.blocks_sent += 1
+
+
+    def replay_once(self):
+        ''' Replay the recording once, return False if stopped early. '''
+        started = False
+        for scans in self.scan_chunks():
+            if self.scheduler and not started:
+                self.scheduler.start(scans['millis'][0])
+            started = True
+            boundaries = self.block_boundaries(scans)
+            ends = np.append(boundaries[1:], len(scans))
+            block_millis = scans['millis'][boundaries]
+            block = 0
+            while block < len(boundaries):
+                if not self.running:
+                    return False
+                num_blocks = 1
+                if self.scheduler:
+                    self.scheduler.wait(int(block_millis[block]))
+                    # blocks that are already due as well are sent with this one, to catch up
+                    num_blocks = self.scheduler.take_due(block_millis[block:])
+                self.inject_block(scans[boundaries[block]:ends[block + num_blocks - 1]])
+                block += num_blocks
+        return True
+
+
+    def run(self):
+        ''' Replay the recording, repeat it if self.loop is set. '''
+        if not self.streamed and len(self.scans) == 0:
+            logging.error(f'no scans found in {self.input_file}')
             return
-        packed_scan = self.pack_scan(self.scan_to_ads_format(single_scan))
-        try:
-            serial_utilities.write(packed_scan, self.serial_connection)
-        except SerialException as e:
-            print('Could not open serial port, try\nsocat -d -d pty,raw,echo=0,link=/tmp/ttyV0 pty,raw,echo=0,link=/tmp/ttyV1')
-            utilities.exit_code('\n error message {}'.format(e))
+        self.running = True
+        self.start_time = time.monotonic()
+        while self.replay_once() and self.loop:
+            pass
+        self.running = False
+        logging.info('end of file')
+
+
+    def scan_chunks(self):
+        ''' Yield the scans to replay, a chunk at a time for a compressed recording, otherwise all at once. '''
+        if self.streamed:
+            yield from compressed_recording.read_chunks(self.input_file)
+        else:
+            yield self.scans
+
+
+    def stats(self):
+        ''' Return a dictionary of replay counters and the achieved scan rate. '''
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0
+        stats = {'scans_sent': self.scans_sent, 'blocks_sent': self.blocks_sent, 'elapsed_s': elapsed,
+            'scans_per_s': self.scans_sent/elapsed if elapsed else 0.0}
+        if self.scheduler:
+            stats['timing'] = self.scheduler.stats()
+        return stats
+
+
+    def stop(self):
+        ''' Stop replaying after the current block. '''
+        self.running = False
+
+
+def clock_time(clock, input_file):
+    ''' Return clock, a HH:MM:SS time on the day input_file was started, as a time.time() value. '''
+    index = RecordingIndex(input_file)
+    start_time = index.entries['host_time'][0] if len(index.entries) else os.path.getmtime(input_file)
+    day = datetime.datetime.fromtimestamp(start_time).date()
+    return datetime.datetime.combine(day, datetime.time.fromisoformat(clock)).timestamp()
+
+
+def format_log_lines(scans):
+    ''' Return scans, an array of ads.acc_scan_dtype, as T-Watch debug log lines. '''
+    return ''.join(LOG_LINE.format(*scan) for scan in scans.tolist())
+
+
+def read_recording(file_path):
+    ''' Return the scans in a recording made by files.py as an array of ads.acc_scan_dtype.
+    Binary recordings are memory mapped, not read. '''
+    if binary_recording.is_binary_recording(file_path):
+        return binary_recording.BinaryRecording(file_path).scans
+    if compressed_recording.is_compressed_recording(file_path):
+        return compressed_recording.read_recording(file_path)
+    with open(file_path) as file_object:
+        return values_to_scans(RECORDED_SCAN_PATTERN.findall(file_object.read()))
+
+
+def values_to_scans(values):
+    ''' Return values found by RECORDED_SCAN_PATTERN as an array of ads.acc_scan_dtype. '''
+    scans = np.zeros(len(values), dtype=ads.acc_scan_dtype)
+    if values:
+        values = np.array(values, dtype=np.int64)
+        for index, header in enumerate(ads.acc_data_headers):
+            scans[header] = values[:, index]
+    return scans
+
 
 if __name__ == '__main__':
-    replay_data = ReplayData(TEST_FILE)
+    arg_parser = argparse.ArgumentParser(description='replay a recording through the parser or publish stage')
+    arg_parser.add_argument('input_file', nargs='?', default=TEST_FILE)
+    arg_parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 0 for as fast as possible')
+    arg_parser.add_argument('--inject', choices=['publish', 'parser'], default='publish')
+    arg_parser.add_argument('--loop', action='store_true')
+    arg_parser.add_argument('--block-ms', type=int, default=BLOCK_MS,
+        help='recorded time in ms covered by one injected block, 0 sends each scan at its recorded time')
+    arg_parser.add_argument('--latency', action='store_true', help='print per stage latency stats at the end')
+    arg_parser.add_argument('--process', action='store_true', help='update a DataFrame and IMU_calcs, as main.py does')
+    arg_parser.add_argument('--start', help='clock time to replay from, HH:MM:SS')
+    arg_parser.add_argument('--end', help='clock time to replay to, HH:MM:SS')
+    arg_parser.add_argument('--spin-ms', type=float, default=0,
+        help='poll for this time in ms before each deadline, more accurate but keeps a core busy')
+    args = arg_parser.parse_args()
+    start_time = clock_time(args.start, args.input_file) if args.start else None
+    end_time = clock_time(args.end, args.input_file) if args.end else None
+    if args.latency:
+        latency.enable()
+    if args.process:
+        # imported here so that replaying into the parser only does not need the processing modules
+        import block_dispatcher
+        from dataframe import DataFrame
+        import dispatcher_signals as ds
+        from imu_calcs import IMU_calcs
+        dataframe = DataFrame()
+        imu = IMU_calcs()
+
+        def receive_data(message):
+            dataframe.update_dataframe(message)
+            imu.update_buffer(dataframe.buffer, len(message))
+            dataframe.publish_snapshot()
+
+        block_dispatcher.connect(receive_data, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+    replay_data = ReplayData(args.input_file, args.speed, args.inject, args.loop, block_ms=args.block_ms,
+        start_time=start_time, end_time=end_time, spin_ms=args.spin_ms)
+    replay_data.run()
+    print(replay_data.stats())
+    if args.latency:
+        print(latency.dump())
@@ -0,0 +1,118 @@
+'''
+Drift free replay pacing from recorded timestamps.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Each block of a replay is due at an absolute deadline: the replay start time plus the
+recorded time since the first scan, divided by the replay speed. Deadlines are worked out
+from the integer millis, not from when the previous block was sent, so sleep overshoot and
+the time taken to send a block do not add up over a long replay.
+
+wait sleeps until the deadline, less the smoothed amount time.sleep has overslept by, then
+sleeps again for whatever is left, so blocks are not sent early and no core is kept busy.
+Spinning is opt in: with spin_time set, wait stops sleeping spin_time before the deadline and
+polls time.perf_counter until it, for sub ms accuracy at the cost of a busy core. Polling calls
+time.sleep(0), so that the GIL is released for the graph thread.
+
+When the replay falls behind, e.g. the pipeline was busy, take_due returns all the blocks
+already due, up to max_burst, so they are sent as one burst to catch up.
+
+Recorded millis go backwards if the watch was reset during a recording. A burst never
+crosses the reset, and wait starts the replay clock again at the first block after it.
+
+stats() gives the number of blocks, how many were late by more than LATE_TIME, the bursts,
+the clock restarts and lateness percentiles from a latency.LatencyHistogram.
+
+@author: matthew oppenheim
+last update: 2025_05_22
+'''
+import latency
+import logging
+import numpy as np
+import time
+
+LATE_TIME = 1e-3 # s after its deadline for a block to count as late
+MAX_BURST = 50 # blocks sent together at most when catching up
+OVERSLEEP_SMOOTHING = 0.1 # weight of the newest time.sleep overshoot in the smoothed overshoot
+SPIN_TIME = 0.0 # s before a deadline to stop sleeping and poll, 0 to not poll
+
+
+class ReplayScheduler():
+    ''' Wait for absolute deadlines worked out from recorded millis, and keep timing error stats. '''
+
+    def __init__(self, speed=1.0, spin_time=SPIN_TIME, max_burst=MAX_BURST):
+        if speed <= 0:
+            raise ValueError(f'speed must be more than 0, not {speed}')
+        self.speed = speed
+        self.spin_time = spin_time
+        self.max_burst = max_burst
+        self.oversleep = 0.0 # smoothed time in s that time.sleep overran by
+        self.lateness = latency.LatencyHistogram()
+        self.start_time = None
+        self.first_millis = None
+        self.last_millis = None # millis of the last block taken
+        self.restarts = 0 # times the clock was started again as millis went backwards
+        self.blocks = 0
+        self.late = 0
+        self.bursts = 0
+        self.burst_blocks = 0
+
+
+    def deadline(self, millis):
+        ''' Return the time.perf_counter() at which the scan recorded at millis is due. '''
+        return self.start_time + (millis - self.first_millis) / 1000 / self.speed
+
+
+    def start(self, first_millis):
+        ''' Start the replay clock now, at the recorded first_millis. '''
+        self.start_time = time.perf_counter()
+        self.first_millis = int(first_millis)
+        self.last_millis = None
+
+
+    def stats(self):
+        ''' Return a dictionary of block, late and burst counts, lateness in ms and the sleep overshoot. '''
+        return {'blocks': self.blocks, 'late': self.late, 'bursts': self.bursts, 'burst_blocks': self.burst_blocks,
+            'restarts': self.restarts, 'lateness': self.lateness.stats(), 'oversleep_ms': 1000*self.oversleep}
+
+
+    def take_due(self, block_millis):
+        ''' Return how many blocks, from the start of block_millis, the start millis of the blocks
+        still to send, are due now, at most max_burst. Their lateness is recorded.
+        Blocks after millis go backwards are not due until wait has restarted the clock. '''
+        now = time.perf_counter()
+        due_millis = self.first_millis + (now - self.start_time) * self.speed * 1000
+        # only max_burst blocks can be taken, so only they are looked at
+        block_millis = np.asarray(block_millis[:self.max_burst])
+        backwards = np.flatnonzero(np.diff(block_millis) < 0)
+        if len(backwards):
+            block_millis = block_millis[:backwards[0] + 1]
+        num_due = max(int(np.searchsorted(block_millis, due_millis, side='right')), 1)
+        self.last_millis = int(block_millis[num_due - 1])
+        lateness = now - self.deadline(np.asarray(block_millis[:num_due]))
+        for block_lateness in lateness.tolist():
+            self.lateness.add(max(block_lateness, 0.0))
+        self.blocks += num_due
+        self.late += int(np.count_nonzero(lateness > LATE_TIME))
+        if num_due > 1:
+            self.bursts += 1
+            self.burst_blocks += num_due
+        return num_due
+
+
+    def wait(self, millis):
+        ''' Wait until the scan recorded at millis is due.
+        If millis is before the last block taken, the recording went back in time, e.g. the watch was
+        reset, and the clock is started again at millis. '''
+        if self.last_millis is not None and millis < self.last_millis:
+            logging.info(f'replay millis went back from {self.last_millis} to {millis}, restarting the replay clock')
+            self.restarts += 1
+            self.start(millis)
+        deadline = self.deadline(millis)
+        sleep_time = deadline - time.perf_counter() - self.spin_time - self.oversleep
+        if sleep_time > 0:
+            wake_time = time.perf_counter() + sleep_time
+            time.sleep(sleep_time)
+            self.oversleep += OVERSLEEP_SMOOTHING * (time.perf_counter() - wake_time - self.oversleep)
+        while time.perf_counter() < deadline:
+            # without spin_time, sleep for what is left rather than polling
+            time.sleep(0 if self.spin_time else max(deadline - time.perf_counter(), 0))
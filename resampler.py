@@ -0,0 +1,145 @@
+'''
+Streaming resampler, from jittery watch timestamps onto a uniform rate grid.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The watch's millis step by 80, 81 and sometimes 88 ms, so a rolling window of a fixed
+number of scans covers a varying time, and spectra are biased. A Resampler interpolates
+each block of scans linearly onto grid times period_ms apart, with numpy, and keeps the
+last scan and the next grid time, so the grid carries on across blocks. A grid point is
+sent once a scan at or after it has arrived, so the delay is at most one scan interval.
+
+Grid points are not interpolated across a gap in the watch counter, i.e. dropped scans,
+as the missing data is not known. They are left out, the grid counter, which counts grid
+points, jumps over them, and the next grid point has its gap field set. When millis go
+backwards, e.g. the watch was reset, the grid starts again from the new millis.
+
+Blocks are numpy structured arrays of ads.resampled_scan_dtype: millis is the grid time,
+counter the grid point number, wrapping as the watch counter does, and the accelerometer
+values are floats.
+
+Downstream code picks raw or resampled data by the signal it connects to. A Resampler
+started with a sender resamples the blocks published on PARSER_SIGNAL by that sender, and
+publishes them on RESAMPLED_SIGNAL from the same sender. Recordings stay raw.
+
+stats() gives the scans in and out, the grid points left out in gaps and the restarts.
+
+@author: matthew oppenheim
+last update: 2025_05_25
+'''
+import accelerometer_data_structure as ads
+import block_dispatcher
+import dispatcher_signals as ds
+import logging
+import math
+import numpy as np
+from parse_accelerometer_data import COUNTER_MODULUS
+
+VALUE_HEADERS = ['acc_x', 'acc_y', 'acc_z'] # interpolated fields
+
+
+class Resampler():
+    ''' Linearly interpolate blocks of scans onto a grid of rate scans per s, keeping state across blocks. '''
+
+    def __init__(self, rate, sender=None):
+        ''' If sender is given, resample the blocks it publishes and publish them on RESAMPLED_SIGNAL. '''
+        if rate <= 0:
+            raise ValueError(f'rate must be more than 0, not {rate}')
+        self.period_ms = 1000 / rate
+        self.sender = sender
+        self.last_scan = None # last scan received, the start of the first interval of the next block
+        self.next_time = None # millis of the next grid point
+        self.grid_number = 0 # number of the next grid point
+        self.gap = False # a grid point was left out, so the next one sent has gap set
+        self.scans_in = 0
+        self.scans_out = 0
+        self.gap_points = 0 # grid points left out as they fell in a counter gap
+        self.restarts = 0 # times the grid started again as millis went backwards
+        if sender is not None:
+            block_dispatcher.connect(self.receive_data, signal=ds.PARSER_SIGNAL, sender=sender)
+
+
+    def receive_data(self, message):
+        ''' Resample a block of scans published by the parser, and publish the grid points. '''
+        resampled = self.resample(message)
+        if len(resampled):
+            block_dispatcher.send(signal=ds.RESAMPLED_SIGNAL, sender=self.sender, message=resampled)
+
+
+    def resample(self, scans):
+        ''' Return the grid points up to the last of scans, a numpy structured array of ads.acc_scan_dtype,
+        as a numpy structured array of ads.resampled_scan_dtype. '''
+        self.scans_in += len(scans)
+        if not len(scans):
+            return np.zeros(0, dtype=ads.resampled_scan_dtype)
+        if self.last_scan is None:
+            self.next_time = float(scans['millis'][0])
+        else:
+            scans = np.concatenate((self.last_scan, scans))
+        millis = scans['millis'].astype(np.float64)
+        # each run of scans whose millis do not go backwards is resampled on its own grid
+        restarts = np.flatnonzero(np.diff(millis) < 0) + 1
+        starts = np.concatenate(([0], restarts))
+        ends = np.concatenate((restarts, [len(scans)]))
+        blocks = []
+        for start, end in zip(starts, ends):
+            if start:
+                logging.info(f'millis went back from {millis[start - 1]:.0f} to {millis[start]:.0f}, '
+                    'restarting the resampling grid')
+                self.restarts += 1
+                self.next_time = millis[start]
+                self.gap = True
+            blocks.append(self.resample_run(scans[start:end], millis[start:end]))
+        self.last_scan = scans[-1:].copy()
+        resampled = np.concatenate(blocks)
+        self.scans_out += len(resampled)
+        return resampled
+
+
+    def resample_run(self, scans, millis):
+        ''' Return the grid points from self.next_time up to the last of scans, whose millis do not go backwards. '''
+        if millis[-1] < self.next_time:
+            return np.zeros(0, dtype=ads.resampled_scan_dtype)
+        num_points = math.floor((millis[-1] - self.next_time) / self.period_ms) + 1
+        resampled = np.zeros(num_points, dtype=ads.resampled_scan_dtype)
+        resampled['millis'] = self.next_time + self.period_ms * np.arange(num_points)
+        # wraps as the int16 counter of the watch
+        grid_numbers = self.grid_number + np.arange(num_points)
+        resampled['counter'] = (grid_numbers + COUNTER_MODULUS // 2) % COUNTER_MODULUS - COUNTER_MODULUS // 2
+        self.next_time = resampled['millis'][-1] + self.period_ms
+        self.grid_number += num_points
+        if len(scans) == 1:
+            # a run of one scan, e.g. the first, has one grid point, on the scan
+            for header in VALUE_HEADERS:
+                resampled[header] = scans[header]
+            resampled['gap'] = self.gap
+            self.gap = False
+            return resampled
+        times = resampled['millis']
+        # interval i runs from scan i to scan i + 1, a grid point on scan i + 1 is at the end of interval i
+        intervals = np.clip(np.searchsorted(millis, times, side='left') - 1, 0, len(scans) - 2)
+        start_millis, end_millis = millis[intervals], millis[intervals + 1]
+        fraction = np.divide(times - start_millis, end_millis - start_millis, out=np.zeros(num_points),
+            where=end_millis > start_millis)
+        for header in VALUE_HEADERS:
+            values = scans[header].astype(np.float64)
+            resampled[header] = values[intervals] + fraction * (values[intervals + 1] - values[intervals])
+        # counters that are not consecutive, as in parse_accelerometer_data.check_counters, are a gap
+        steps = np.diff(scans['counter'].astype(np.int64)) % COUNTER_MODULUS
+        in_gap = (steps[intervals] != 1) & (fraction > 0) & (fraction < 1)
+        # the first grid point kept after points left out, in this run or an earlier block, is flagged
+        resampled['gap'] = np.concatenate(([self.gap], in_gap[:-1]))
+        self.gap = bool(in_gap[-1])
+        self.gap_points += int(np.count_nonzero(in_gap))
+        return resampled[~in_gap]
+
+
+    def stats(self):
+        ''' Return a dictionary of scans in and out, grid points left out in gaps and grid restarts. '''
+        return {'scans_in': self.scans_in, 'scans_out': self.scans_out, 'gap_points': self.gap_points,
+            'restarts': self.restarts, 'period_ms': self.period_ms}
+
+
+    def stop(self):
+        ''' Stop resampling the sender's blocks. '''
+        if self.sender is not None:
+            block_dispatcher.disconnect(self.receive_data, ds.PARSER_SIGNAL)
@@ -0,0 +1,144 @@
+'''
+Fixed capacity, column oriented ring buffer backed by numpy arrays.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Each column is stored twice, back to back, in an array of length 2*capacity.
+Every sample is written to both halves, so the most recent <capacity> samples
+are always available as one contiguous slice in chronological order, oldest first.
+Appending a sample is O(1) and reading a column is a view, not a copy.
+
+A pandas dataframe is only created when to_dataframe is called.
+
+@author: matthew oppenheim
+last update: 2025_05_02
+'''
+import numpy as np
+import pandas as pd
+
+
+class RingBuffer():
+    ''' Fixed capacity ring buffer with named float columns. '''
+
+    def __init__(self, col_names, capacity, fill_value=np.nan):
+        if capacity < 1:
+            raise ValueError(f'capacity must be at least 1, not {capacity}')
+        self.capacity = capacity
+        self.col_names = list(col_names)
+        self.col_index = {name: index for index, name in enumerate(self.col_names)}
+        self.fill_value = fill_value
+        # one row per column, each row holds two copies of the data
+        self.data = np.full((len(self.col_names), 2*capacity), fill_value, dtype=float)
+        self.write_index = 0 # where the next sample will be written
+        self.count = 0 # number of samples written since creation or clear
+
+
+    def __len__(self):
+        ''' Number of valid samples held, at most capacity. '''
+        return min(self.count, self.capacity)
+
+
+    def append(self, row):
+        ''' Append a single sample. <row> is a sequence of values in col_names order. '''
+        index = self.write_index
+        self.data[:, index] = row
+        self.data[:, index+self.capacity] = row
+        self.write_index = (index + 1) % self.capacity
+        self.count += 1
+
+
+    def clear(self):
+        ''' Remove all samples. '''
+        self.data.fill(self.fill_value)
+        self.write_index = 0
+        self.count = 0
+
+
+    def column(self, name, valid_only=False):
+        ''' Return a chronological view of column <name>, oldest sample first.
+        The full capacity is returned unless valid_only is True, so that plots start full size. '''
+        return self.view(valid_only)[self.col_index[name]]
+
+
+    def columns(self, names, valid_only=False):
+        ''' Return a dictionary of chronological views for the columns in <names>. '''
+        view = self.view(valid_only)
+        return {name: view[self.col_index[name]] for name in names}
+
+
+    def extend(self, block):
+        ''' Append a block of samples.
+        <block> is a 2D array shaped (number of columns, number of samples). '''
+        block = np.asarray(block, dtype=float)
+        num_samples = block.shape[1]
+        if num_samples == 0:
+            return
+        if num_samples > self.capacity:
+            # only the most recent samples survive, skip the ones that would be overwritten
+            self.count += num_samples - self.capacity
+            self.write_index = (self.write_index + num_samples - self.capacity) % self.capacity
+            block = block[:, -self.capacity:]
+            num_samples = self.capacity
+        start = self.write_index
+        first_part = min(num_samples, self.capacity - start)
+        # write to the first copy, wrapping around at capacity
+        self.data[:, start:start+first_part] = block[:, :first_part]
+        self.data[:, :num_samples-first_part] = block[:, first_part:]
+        # write to the second copy
+        self.data[:, start+self.capacity:start+self.capacity+first_part] = block[:, :first_part]
+        self.data[:, self.capacity:self.capacity+num_samples-first_part] = block[:, first_part:]
+        self.write_index = (start + num_samples) % self.capacity
+        self.count += num_samples
+
+
+    def latest(self, name, num_samples=1):
+        ''' Return a view of the most recent <num_samples> values of column <name>, at most capacity. '''
+        num_samples = min(num_samples, self.capacity)
+        end = self.write_index + self.capacity
+        return self.data[self.col_index[name], end-num_samples:end]
+
+
+    def set_latest(self, name, values):
+        ''' Overwrite the most recent value(s) of column <name>.
+        A scalar overwrites the newest sample, an array overwrites the newest len(values) samples. '''
+        col = self.col_index[name]
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 0:
+            index = (self.write_index - 1) % self.capacity
+            self.data[col, index] = values
+            self.data[col, index+self.capacity] = values
+            return
+        num_samples = min(len(values), self.capacity)
+        indices = (self.write_index - num_samples + np.arange(num_samples)) % self.capacity
+        self.data[col, indices] = values[-num_samples:]
+        self.data[col, indices+self.capacity] = values[-num_samples:]
+
+
+    def set_latest_columns(self, names, block):
+        ''' Overwrite the newest block.shape[1] values of the columns in <names>.
+        <block> is a 2D array shaped (len(names), number of samples).
+        Uses slices, not index arrays, so the cost is a few copies per block. '''
+        block = np.asarray(block, dtype=float)
+        num_samples = min(block.shape[1], self.capacity)
+        end = self.write_index + self.capacity
+        start = end - num_samples
+        # the newest samples are contiguous in the second copy, [start, end)
+        # the part of that slice in the second half is mirrored to the first half, and vice versa
+        split = max(start, self.capacity)
+        for name, values in zip(names, block[:, -num_samples:]):
+            column = self.data[self.col_index[name]]
+            column[start:end] = values
+            column[split-self.capacity:end-self.capacity] = values[split-start:]
+            column[start+self.capacity:split+self.capacity] = values[:split-start]
+
+
+    def to_dataframe(self, valid_only=True):
+        ''' Return a pandas dataframe of the buffer, oldest sample first. Creates a copy. '''
+        view = self.view(valid_only)
+        return pd.DataFrame(view.T.copy(), columns=self.col_names)
+
+
+    def view(self, valid_only=False):
+        ''' Return a (number of columns, samples) view in chronological order, oldest first. '''
+        end = self.write_index + self.capacity
+        start = end - len(self) if valid_only else self.write_index
+        return self.data[:, start:end]
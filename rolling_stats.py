@@ -0,0 +1,130 @@
+'''
+Incremental rolling statistics for streaming sensor data.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Rolling mean, variance, min and max are updated one sample at a time.
+Mean and variance use running sums, min and max use monotonic deques,
+so the cost of a new sample does not depend on how much data is stored.
+
+Several window lengths can be tracked at once from the same sample history,
+e.g. dataframe.ROLLING_WINDOW_LENGTH and imu_calcs.ROLLING_WINDOW_LENGTH.
+
+Statistics for a window are NaN until the window is full, the same as pandas rolling.
+
+@author: matthew oppenheim
+last update: 2025_05_03
+'''
+import collections
+import math
+import numpy as np
+
+
+class RollingStats():
+    ''' Rolling mean, variance, min and max for one or more window lengths. '''
+
+    # running sums are recalculated from the history this often, to stop float error building up
+    RESYNC_INTERVAL = 4096
+
+    def __init__(self, windows):
+        if isinstance(windows, int):
+            windows = [windows]
+        self.windows = sorted(set(windows))
+        if not self.windows or self.windows[0] < 1:
+            raise ValueError(f'window lengths must be at least 1, not {windows}')
+        self.history_length = self.windows[-1]
+        self.history = np.zeros(self.history_length) # last history_length samples
+        self.count = 0 # number of samples added
+        self.sums = dict.fromkeys(self.windows, 0.0)
+        self.sums_squared = dict.fromkeys(self.windows, 0.0)
+        # deques hold (sample number, value), front is the min or max of the window
+        self.min_deques = {window: collections.deque() for window in self.windows}
+        self.max_deques = {window: collections.deque() for window in self.windows}
+
+
+    def extend(self, values, window=None):
+        ''' Add a block of samples.
+        If <window> is given, return an array of the rolling mean after each sample. '''
+        means = np.empty(len(values)) if window is not None else None
+        for index, value in enumerate(values):
+            self.update(value)
+            if window is not None:
+                means[index] = self.mean(window)
+        return means
+
+
+    def max(self, window):
+        ''' Return the rolling maximum for <window>. '''
+        if self.count < window:
+            return math.nan
+        return self.max_deques[window][0][1]
+
+
+    def mean(self, window):
+        ''' Return the rolling mean for <window>. '''
+        if self.count < window:
+            return math.nan
+        return self.sums[window] / window
+
+
+    def min(self, window):
+        ''' Return the rolling minimum for <window>. '''
+        if self.count < window:
+            return math.nan
+        return self.min_deques[window][0][1]
+
+
+    def resync(self):
+        ''' Recalculate the running sums from the stored history. '''
+        for window in self.windows:
+            values = self.window_values(window)
+            self.sums[window] = float(values.sum())
+            self.sums_squared[window] = float((values*values).sum())
+
+
+    def update(self, value):
+        ''' Add a single sample. '''
+        value = float(value)
+        sample_number = self.count
+        history_index = sample_number % self.history_length
+        for window in self.windows:
+            if sample_number >= window:
+                # remove the sample that has left this window
+                leaving = self.history[(sample_number - window) % self.history_length]
+                self.sums[window] -= leaving
+                self.sums_squared[window] -= leaving*leaving
+            self.sums[window] += value
+            self.sums_squared[window] += value*value
+            oldest_kept = sample_number - window
+            min_deque = self.min_deques[window]
+            while min_deque and min_deque[-1][1] >= value:
+                min_deque.pop()
+            min_deque.append((sample_number, value))
+            if min_deque[0][0] <= oldest_kept:
+                min_deque.popleft()
+            max_deque = self.max_deques[window]
+            while max_deque and max_deque[-1][1] <= value:
+                max_deque.pop()
+            max_deque.append((sample_number, value))
+            if max_deque[0][0] <= oldest_kept:
+                max_deque.popleft()
+        self.history[history_index] = value
+        self.count += 1
+        if self.count % self.RESYNC_INTERVAL == 0:
+            self.resync()
+
+
+    def variance(self, window):
+        ''' Return the rolling sample variance (ddof=1) for <window>, as pandas rolling var. '''
+        if self.count < window or window < 2:
+            return math.nan
+        mean = self.sums[window] / window
+        variance = (self.sums_squared[window] - window*mean*mean) / (window - 1)
+        # rounding can make a zero variance slightly negative
+        return max(variance, 0.0)
+
+
+    def window_values(self, window):
+        ''' Return the samples currently in <window>, oldest first. '''
+        num_values = min(window, self.count)
+        indices = (self.count - num_values + np.arange(num_values)) % self.history_length
+        return self.history[indices]
@@ -3,18 +3,37 @@ Connect with the T-Watch using a USB cable.
 This creates a serial port: /dev/ACM* (linux) or /dev/ttyUSB* (windows)
 Unpack accelerometer data sent from T_Watch S3 running handshake firmware
 The unpacked data is sent to a parse.
-The parser published the parsed data using pydispatcher.
+The parser publishes blocks of parsed data using block_dispatcher.
+Reading is event driven: the port is registered with an AcquisitionLoop, see acquisition_loop.py,
+which wakes when bytes arrive. Everything waiting on the port is then read in one go, without
+blocking, and the whole chunk is handed to the parser. The parser carries partial scans across chunks.
+Several Serial_Connects, one per watch, can share one loop, and so one thread.
+Creating a Serial_Connect opens the port but does not read it: run() reads in the calling
+thread until stop(), start() reads in the loop's own thread. stop() returns straight away.
+Where the port has no file descriptor, e.g. on windows, it is polled by a loop timer.
+The watch can send text debug lines or binary frames, see binary_protocol.py.
+With protocol='auto' the first data received decides which one is used.
+A ThroughputCounter logs the read rate so that we can check the reader keeps up.
+After a read error, e.g. the watch was unplugged, the port is closed and reopened after
+a backoff, doubling up to MAX_ERROR_BACKOFF, so that a failing port does not spin a core.
+The backoff is a loop timer, not a sleep, so other ports on the loop carry on.
 @author: matthew oppenheim
 handshake project
-Last update: 2025_04_03
+Last update: 2025_05_22
 
 '''
 import accelerometer_data_structure as ads
+from acquisition_loop import AcquisitionLoop
+import binary_protocol
+import clock_sync
+import dispatcher_signals as ds
 import fnmatch
+import latency
 import logging
 import math
 import os
 import parse_accelerometer_data
+import re
 from struct import *
 import struct
 import serial
@@ -23,24 +42,120 @@ import time
 import utilities
 
 
+def find_serial_ports():
+    ''' Return the ports that T-Watches may be connected to, in port number order, [] if there are none.
+    /dev/ttyUSB<n> and /dev/ttyACM<n> ports are used if there are any. Otherwise simulated watches
+    on socat pty pairs, /tmp/ttyV0 to /tmp/ttyV1, /tmp/ttyV2 to /tmp/ttyV3 and so on, are used.
+    Data is written to the even numbered end of each pair, so the odd numbered ends are returned. '''
+    ttymodems = fnmatch.filter(os.listdir('/dev'), 'ttyUSB*') + fnmatch.filter(os.listdir('/dev'), 'ttyACM*')
+    if ttymodems:
+        return ['/dev/' + port for port in sorted(ttymodems, key=port_sort_key)]
+    # look for simulated data on /tmp/ttyV1
+    ttymodems = sorted(fnmatch.filter(os.listdir('/tmp'), 'ttyV*'), key=port_sort_key)
+    if ttymodems:
+        logging.info('*** using simulated data')
+    return ['/tmp/' + port for port in ttymodems if port_sort_key(port)[1] % 2]
+
+
+def port_sort_key(port):
+    ''' Sort ttyUSB10 after ttyUSB9, return (name, number). '''
+    match = re.match(r'(\D*)(\d*)$', port)
+    return match.group(1), int(match.group(2) or 0)
+
+
+class ThroughputCounter():
+    ''' Count bytes, lines and reads to find the serial read throughput. '''
+
+    REPORT_INTERVAL = 5 # time in s inbetween logging the throughput
+
+    def __init__(self, report_interval=REPORT_INTERVAL):
+        self.report_interval = report_interval
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.total_reads = 0
+        self.start_time = time.monotonic()
+        self.reset_interval()
+
+
+    def add(self, num_bytes, num_lines):
+        ''' Record a read of <num_bytes> holding <num_lines> complete lines. '''
+        self.interval_bytes += num_bytes
+        self.interval_lines += num_lines
+        self.interval_reads += 1
+        self.total_bytes += num_bytes
+        self.total_lines += num_lines
+        self.total_reads += 1
+
+
+    def log_if_due(self):
+        ''' Log the throughput every report_interval seconds. '''
+        if time.monotonic() - self.interval_start > self.report_interval:
+            rates = self.rates()
+            logging.info(f"serial read: {rates['lines_per_s']:7.1f} lines/s {rates['bytes_per_s']:8.0f} bytes/s "
+                f"{rates['reads_per_s']:6.1f} reads/s")
+            self.reset_interval()
+
+
+    def rates(self):
+        ''' Return a dictionary of read rates since the last interval reset. '''
+        elapsed = max(time.monotonic() - self.interval_start, 1e-9)
+        return {'bytes_per_s': self.interval_bytes/elapsed, 'lines_per_s': self.interval_lines/elapsed,
+            'reads_per_s': self.interval_reads/elapsed, 'total_bytes': self.total_bytes,
+            'total_lines': self.total_lines, 'total_reads': self.total_reads}
+
+
+    def reset_interval(self):
+        ''' Start a new measurement interval. '''
+        self.interval_start = time.monotonic()
+        self.interval_bytes = 0
+        self.interval_lines = 0
+        self.interval_reads = 0
+
+
 class Serial_Connect():
-    SLEEP_TIME = 0.02 # time to sleep inbetween getting data
+    SLEEP_TIME = 0.02 # time inbetween reading lines, only used in line read mode
+    POLL_TIME = 0.01 # time inbetween reads of a port without a file descriptor
+    READ_MODE = 'chunk' # 'chunk' reads all waiting data, 'line' reads one line every SLEEP_TIME
+    PROTOCOL = 'auto' # 'text', 'binary' or 'auto' to detect from the received data
+    MAX_DETECT_BYTES = 4096 # received bytes looked at before defaulting to text
     BAUD = 115200
+    ERROR_BACKOFF = 0.01 # time in s to wait before reopening the port after the first read error
+    MAX_ERROR_BACKOFF = 1.0 # longest time in s to wait after repeated read errors
+    LOG_INTERVAL = 1.0 # time in s inbetween checks that the throughput is due to be logged
 
-    def __init__(self, delta=100000, serial_port=None, baud=BAUD):
-        if not serial_port:
+    def __init__(self, delta=100000, serial_port=None, baud=BAUD, read_mode=READ_MODE, protocol=PROTOCOL,
+            connect=True, loop=None, sender=ds.PARSER_SENDER):
+        ''' Connect to serial_port and register it with loop, an AcquisitionLoop, a new one by default.
+        Nothing is read until the loop runs, see run and start. connect=False sets up the reader without a port.
+        Parsed blocks are published from sender, give each watch its own when several share a loop. '''
+        if not serial_port and connect:
             serial_port = self.find_serial_port()
         logging.debug('baud: {} port: {}'.format(baud, serial_port))
         headers = ads.acc_data_headers
         # instantiate the parser object
-        self.parser = parse_accelerometer_data.Parse_accelerometer_data()
+        self.parser = parse_accelerometer_data.Parse_accelerometer_data(sender=sender)
         # accelerometer sensor data will be stored in acc_scan named tuples
         self.acc_scan = ads.acc_data_structure
-        try:
-            serial_connection = self.serial_connect(serial_port, baud)
-        except AttributeError as e:
-            utilities.exit_code('no serial connection found, error code: \n{}'.format(e))
-        self.get_bytes(serial_connection)
+        self.read_mode = read_mode
+        self.protocol = protocol
+        self.detect_buffer = b'' # data held while the protocol is detected
+        self.binary_decoder = binary_protocol.BinaryFrameDecoder()
+        self.throughput = ThroughputCounter()
+        self.error_backoff = 0.0 # time in s to wait before reopening the port after the next read error
+        self.read_errors = 0
+        self.owns_loop = loop is None
+        self.loop = loop if loop is not None else AcquisitionLoop()
+        self.serial_connection = None
+        self.timers = [] # loop timers started by get_bytes
+        self.reading = False # True while the port is registered with the loop
+        self.reader = None # poll Timer, or None if the port's file descriptor is registered
+        self.reader_fd = None # file descriptor registered with the loop
+        if not connect:
+            return
+        self.serial_connection = self.serial_connect(serial_port, baud)
+        if self.serial_connection is None:
+            utilities.exit_code(f'no serial connection found on {serial_port}')
+        self.get_bytes(self.serial_connection)
 
 
     def check_counter(self, counter):
@@ -52,40 +167,116 @@ class Serial_Connect():
 
     def find_serial_port(self):
         ''' returns the port that the twatch  is connected to '''
-        # look for a twatch connected to a /dev/ttyUSB<n> port
-        ttyusbmodems = fnmatch.filter(os.listdir('/dev'), 'ttyUSB*')
-        # look for a twatch connected to a /dev/ttyACM<n> port
-        ttyacmmodems = fnmatch.filter(os.listdir('/dev'), 'ttyACM*')
-        ttymodems = ttyusbmodems + ttyacmmodems
-        twatch_port = False
-        if ttymodems:
-            twatch_port = '/dev/' + ttymodems[0]
-            logging.debug('twatch port is {}'.format(twatch_port))
-            return(twatch_port)
-        # look for simulated data on /tmp/ttyV1
-        ttymodems=fnmatch.filter(os.listdir('/tmp'), 'tty*')
-        if ttymodems:
-            twatch_port = '/tmp/'+ ttymodems[1]
-            logging.info('*** using simulated data')
-            logging.info('twatch port is {}'.format(twatch_port))
-            return(twatch_port)
-        if not twatch_port:
+        twatch_ports = find_serial_ports()
+        if not twatch_ports:
             utilities.exit_code('Error: no serial port connection found.')
+        logging.debug('twatch port is {}'.format(twatch_ports[0]))
+        return twatch_ports[0]
 
 
     def get_bytes(self, serial_connection):
-        '''Returns all waiting data from the open serial port.'''
-        while (1):
-            try:
-                # don't use inWaiting() as this causes multiple calls for blank lines
-                read_bytes = serial_connection.readline()
-            except (IndexError, serial.serialutil.SerialException) as e:
-                logging.debug(e)
+        '''Register the open serial port with the loop, which passes all data read to the parser.'''
+        # reads return straight away, the loop waits for data
+        serial_connection.timeout = 0
+        self.timers.append(self.loop.call_every(self.LOG_INTERVAL, self.throughput.log_if_due))
+        self.start_reading()
+
+
+    def get_lines(self):
+        '''Pass data read one line at a time from the open serial port to the parser, called every SLEEP_TIME.'''
+        read_bytes = b''
+        try:
+            # don't use inWaiting() as this causes multiple calls for blank lines
+            read_bytes = self.serial_connection.readline()
+        except (IndexError, serial.serialutil.SerialException) as e:
+            logging.debug(e)
+        if read_bytes:
+            latency.mark_arrival()
+            clock_sync.mark_arrival()
+            self.throughput.add(len(read_bytes), 1)
+            # parser will publish complete scans of parsed data using dispatcher, and keeps partial lines
+            self.parser.parse_new_data(read_bytes.decode(errors='replace'))
+
+
+    def detect_protocol(self, read_bytes):
+        ''' Hold received data until the protocol is known, then return all of the held data. '''
+        self.detect_buffer += read_bytes
+        protocol = binary_protocol.detect_protocol(self.detect_buffer)
+        if not protocol and len(self.detect_buffer) > self.MAX_DETECT_BYTES:
+            protocol = 'text'
+        if not protocol:
+            return b''
+        self.protocol = protocol
+        logging.info(f'detected {protocol} protocol')
+        read_bytes, self.detect_buffer = self.detect_buffer, b''
+        return read_bytes
+
+
+    def handle_chunk(self, read_bytes):
+        ''' Pass read_bytes to the parser or binary decoder, which keep any partial scan until the next chunk. '''
+        if self.protocol == 'auto':
+            read_bytes = self.detect_protocol(read_bytes)
+            if not read_bytes:
+                return
+        if self.protocol == 'binary':
+            self.throughput.add(len(read_bytes), len(read_bytes)//binary_protocol.FRAME_SIZE)
+            self.parser.publish_scans(self.binary_decoder.decode(read_bytes))
+            return
+        self.throughput.add(len(read_bytes), read_bytes.count(b'\n'))
+        # parser will publish complete scans of parsed data using dispatcher
+        self.parser.parse_new_data(read_bytes)
+
+
+    def read_chunk(self, serial_connection):
+        ''' Return everything waiting on the port, b'' if there is nothing.
+        Returns None after a read error, and doubles self.error_backoff. '''
+        try:
+            read_bytes = serial_connection.read(1)
             if read_bytes:
-                # parser will publish complete scans of parsed data using dispatcher
-                self.parser.parse_new_data(read_bytes.decode())
-            # without a sleep command, this thread will suck the cpu time and bottleneck the plotting
-            time.sleep(self.SLEEP_TIME)
+                waiting = serial_connection.in_waiting
+                if waiting:
+                    read_bytes += serial_connection.read(waiting)
+        except (IndexError, serial.serialutil.SerialException, OSError) as e:
+            logging.debug(e)
+            self.read_errors += 1
+            self.error_backoff = min(max(2*self.error_backoff, self.ERROR_BACKOFF), self.MAX_ERROR_BACKOFF)
+            return None
+        self.error_backoff = 0.0
+        return read_bytes
+
+
+    def read_ready(self):
+        ''' Called by the loop when the port is readable, or polled. Pass what was read to the parser. '''
+        read_bytes = self.read_chunk(self.serial_connection)
+        if read_bytes is None:
+            # without a pause, a port that keeps failing is always readable and spins the loop
+            self.stop_reading()
+            self.serial_connection.close()
+            logging.info(f'serial read error, reopening the port in {self.error_backoff} s')
+            self.timers.append(self.loop.call_later(self.error_backoff, self.reopen))
+            return
+        if read_bytes:
+            latency.mark_arrival()
+            clock_sync.mark_arrival()
+            self.handle_chunk(read_bytes)
+
+
+    def reopen(self):
+        ''' Reopen the port after a read error and read it again, or try again after a longer backoff. '''
+        try:
+            self.serial_connection.open()
+        except (serial.serialutil.SerialException, OSError) as e:
+            logging.debug(e)
+            self.error_backoff = min(2*self.error_backoff, self.MAX_ERROR_BACKOFF)
+            self.timers.append(self.loop.call_later(self.error_backoff, self.reopen))
+            return
+        logging.info(f'serial port {self.serial_connection.port} reopened')
+        self.start_reading()
+
+
+    def run(self):
+        ''' Read the port in the calling thread until stop is called. '''
+        self.loop.run()
 
 
     def serial_connect(self, serial_port, baud):
@@ -107,6 +298,48 @@ class Serial_Connect():
         serial_connection.flush()
 
 
+    def start(self):
+        ''' Read the port in the loop's own thread. '''
+        self.loop.start()
+
+
+    def start_reading(self):
+        ''' Register the port with the loop, by its file descriptor, or with a poll timer. '''
+        if self.read_mode == 'line':
+            self.reader = self.loop.call_every(self.SLEEP_TIME, self.get_lines)
+        elif hasattr(self.serial_connection, 'fileno'):
+            self.reader = None
+            self.reader_fd = self.serial_connection.fileno()
+            self.loop.add_reader(self.reader_fd, self.read_ready)
+        else:
+            self.reader = self.loop.call_every(self.POLL_TIME, self.read_ready)
+        self.reading = True
+
+
+    def stop(self):
+        ''' Stop reading and close the port. A loop that was passed in keeps running for its other readers. '''
+        self.stop_reading()
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
+        if self.owns_loop:
+            self.loop.close()
+        if self.serial_connection is not None:
+            self.serial_connection.close()
+
+
+    def stop_reading(self):
+        ''' Unregister the port from the loop. '''
+        if not self.reading:
+            return
+        if self.reader is not None:
+            self.reader.cancel()
+        else:
+            self.loop.remove_reader(self.reader_fd)
+        self.reading = False
+
+
 if __name__ == '__main__':
     t_watch = Serial_Connect()
+    t_watch.run()
 
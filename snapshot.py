@@ -0,0 +1,59 @@
+'''
+Generation counted snapshot handoff between the serial thread and the graph timer.
+Part of the handshake project: mattoppenheim.com/handshake
+
+The serial thread copies the columns to plot into a back buffer, then swaps it
+to the front and increments the generation, all under a lock held only for the swap.
+The graph timer acquires the front buffer in O(1). All columns in a snapshot come
+from the same update, and the timer can skip redrawing if the generation has not changed.
+
+Three buffers are used, not two, because the graph timer keeps using the buffer it
+acquired until its next acquire. The writer never writes to the front buffer or the
+buffer the reader holds, so the reader needs no copy and never sees a half written update.
+
+@author: matthew oppenheim
+last update: 2025_05_09
+'''
+import numpy as np
+import threading
+
+
+class SnapshotBuffer():
+    ''' Triple buffered, generation counted snapshots of named columns. '''
+
+    NUM_BUFFERS = 3
+
+    def __init__(self, col_names, length):
+        self.col_names = list(col_names)
+        self.length = length
+        self.buffers = [{name: np.full(length, np.nan) for name in self.col_names}
+            for _ in range(self.NUM_BUFFERS)]
+        self.lock = threading.Lock()
+        self.generation = 0 # generation of the front buffer, 0 until the first publish
+        self.front = 0 # index of the newest published buffer
+        self.back = 1 # index of the buffer the writer fills next
+        self.reading = None # index of the buffer held by the reader
+
+
+    def acquire(self, last_generation=None):
+        ''' Return (generation, columns) for the newest snapshot.
+        columns is None if the generation is still last_generation, i.e. nothing has changed.
+        The returned columns must not be changed and stay valid until the next acquire. '''
+        with self.lock:
+            if self.generation == last_generation:
+                return self.generation, None
+            self.reading = self.front
+            return self.generation, self.buffers[self.front]
+
+
+    def publish(self, columns):
+        ''' Copy columns, a dictionary of arrays of length self.length, into a new snapshot. '''
+        back = self.buffers[self.back]
+        for name in self.col_names:
+            np.copyto(back[name], columns[name])
+        with self.lock:
+            self.front = self.back
+            self.generation += 1
+            # the next back buffer is neither the new front nor the one being read
+            self.back = next(index for index in range(self.NUM_BUFFERS) if index not in (self.front, self.reading))
+        return self.generation
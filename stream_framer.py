@@ -0,0 +1,89 @@
+'''
+Incremental framer for a stream of start and end marked sensor scans.
+Part of the handshake project: mattoppenheim.com/handshake
+
+Received bytes are appended to one persistent bytearray. A read cursor marks the
+start of data that has not been framed yet. take_complete returns the span of the
+buffer holding every complete frame received so far, so the parser can work on
+the buffer in place, without slicing out and re-copying the remaining data.
+Partial frames stay in the buffer and are completed by the next feed.
+
+The buffer is compacted once the cursor has moved past COMPACT_SIZE bytes.
+
+Counters:
+frames_started - start markers seen in complete spans
+frames_dropped_partial - partial frames thrown away because no end marker arrived
+    within MAX_PARTIAL_LENGTH bytes, each counts as a resync
+
+@author: matthew oppenheim
+last update: 2025_05_06
+'''
+import logging
+
+
+class StreamFramer():
+    ''' Carry partial frames across reads and find spans of complete frames. '''
+
+    COMPACT_SIZE = 16384 # bytes consumed before the buffer is compacted
+    MAX_PARTIAL_LENGTH = 4096 # bytes waited for an end marker before resyncing
+
+    def __init__(self, start_marker=b'ST', end_marker=b'EN', max_partial_length=MAX_PARTIAL_LENGTH):
+        self.start_marker = start_marker
+        self.end_marker = end_marker
+        self.max_partial_length = max_partial_length
+        self.buffer = bytearray()
+        self.cursor = 0 # start of data not yet returned by take_complete
+        self.frames_started = 0
+        self.frames_dropped_partial = 0
+
+
+    def __len__(self):
+        ''' Number of bytes waiting to be framed. '''
+        return len(self.buffer) - self.cursor
+
+
+    def compact(self):
+        ''' Remove consumed data from the front of the buffer. '''
+        del self.buffer[:self.cursor]
+        self.cursor = 0
+
+
+    def feed(self, data):
+        ''' Add received data, str or bytes, to the buffer. '''
+        if isinstance(data, str):
+            data = data.encode(errors='replace')
+        if self.cursor >= self.COMPACT_SIZE:
+            self.compact()
+        self.buffer += data
+
+
+    def resync(self):
+        ''' Throw away a partial frame that has grown too long, keep anything from its last start marker. '''
+        last_start = self.buffer.rfind(self.start_marker, self.cursor + len(self.start_marker))
+        if last_start == -1:
+            # keep the last few bytes, they may hold the start of a split start marker
+            last_start = len(self.buffer) - len(self.start_marker) + 1
+        logging.debug(f'framer resync, dropped {last_start - self.cursor} bytes')
+        self.frames_dropped_partial += 1
+        self.cursor = max(last_start, self.cursor)
+
+
+    def stats(self):
+        ''' Return a dictionary of the framer counters. '''
+        return {'frames_started': self.frames_started, 'frames_dropped_partial': self.frames_dropped_partial,
+            'buffered_bytes': len(self)}
+
+
+    def take_complete(self):
+        ''' Return (start, end) indices of self.buffer holding all complete frames, or None.
+        The cursor is moved to end, so the span is only returned once. '''
+        last_end = self.buffer.rfind(self.end_marker, self.cursor)
+        if last_end == -1:
+            if len(self) > self.max_partial_length:
+                self.resync()
+            return None
+        start = self.cursor
+        end = last_end + len(self.end_marker)
+        self.cursor = end
+        self.frames_started += self.buffer.count(self.start_marker, start, end)
+        return start, end
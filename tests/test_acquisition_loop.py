@@ -0,0 +1,61 @@
+from acquisition_loop import AcquisitionLoop
+import os
+import threading
+import time
+
+
+def test_timers_run_in_order_and_repeat():
+  loop = AcquisitionLoop()
+  calls = []
+  loop.call_later(0.03, lambda: calls.append('later'))
+  ticks = loop.call_every(0.01, lambda: calls.append('tick'))
+  loop.call_later(0.055, loop.stop)
+  loop.run()
+  ticks.cancel()
+  assert calls.index('later') >= 2
+  assert 4 <= calls.count('tick') <= 6
+  assert loop.stats()['timers'] == 0
+  loop.close()
+
+
+def test_reader_is_called_when_data_arrives():
+  loop = AcquisitionLoop()
+  read_fd, write_fd = os.pipe()
+  received = []
+  def read():
+    received.append(os.read(read_fd, 100))
+    if b'end' in received[-1]:
+      loop.stop()
+  loop.add_reader(read_fd, read)
+  loop.start()
+  os.write(write_fd, b'abc')
+  os.write(write_fd, b'end')
+  loop.thread.join(2)
+  assert b''.join(received) == b'abcend'
+  assert loop.remove_reader(read_fd)
+  assert not loop.remove_reader(read_fd)
+  loop.close()
+  os.close(read_fd)
+  os.close(write_fd)
+
+
+def test_stop_from_another_thread_is_prompt():
+  loop = AcquisitionLoop()
+  loop.start()
+  time.sleep(0.05)
+  start = time.monotonic()
+  loop.stop()
+  assert time.monotonic() - start < 0.1
+  assert loop.thread is None
+  # nothing to wait for, so the loop only woke for the stop
+  assert loop.stats()['wakeups'] <= 2
+  loop.close()
+
+
+def test_failing_callback_does_not_end_the_loop():
+  loop = AcquisitionLoop()
+  loop.call_later(0, lambda: 1/0)
+  loop.call_later(0.01, loop.stop)
+  loop.run()
+  assert loop.stats()['errors'] == 1
+  loop.close()
@@ -0,0 +1,44 @@
+import accelerometer_data_structure as ads
+import binary_protocol
+import numpy as np
+import pytest
+
+
+def make_scans(num_scans, start_millis=1000):
+  scans = np.zeros(num_scans, dtype=ads.acc_scan_dtype)
+  scans['millis'] = start_millis + 80*np.arange(num_scans)
+  scans['counter'] = np.arange(num_scans)
+  scans['acc_x'] = np.arange(num_scans) - 200
+  scans['acc_y'] = 301
+  scans['acc_z'] = -6
+  return scans
+
+
+testdata1 = [1, 7, 20, 1000]
+
+@pytest.mark.parametrize("chunk_size", testdata1)
+def test_decode_round_trip(chunk_size):
+  scans = make_scans(50)
+  data = binary_protocol.pack_frames(scans, previous_millis=0)
+  decoder = binary_protocol.BinaryFrameDecoder()
+  decoded = np.concatenate([decoder.decode(data[i:i+chunk_size]) for i in range(0, len(data), chunk_size)])
+  assert np.array_equal(decoded, scans)
+  assert decoder.resyncs == 0
+
+
+def test_decode_resyncs_after_corruption():
+  scans = make_scans(10)
+  data = bytearray(binary_protocol.pack_frames(scans, previous_millis=0))
+  data[4*binary_protocol.FRAME_SIZE + binary_protocol.END_OFFSET] = ord('X') # corrupt frame 4
+  decoder = binary_protocol.BinaryFrameDecoder()
+  decoded = decoder.decode(b'junk' + bytes(data))
+  assert list(decoded['counter']) == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+  assert decoder.resyncs >= 2
+
+
+def test_detect_protocol():
+  text = b'[DEBUG] accelerometer.cpp L.39 log_acc : ST m:  10041 c:  57 x:  228 y:  270 z:  -369 EN\r\n'
+  binary = binary_protocol.pack_frames(make_scans(3))
+  assert binary_protocol.detect_protocol(text) == 'text'
+  assert binary_protocol.detect_protocol(b'\x00' + binary) == 'binary'
+  assert binary_protocol.detect_protocol(binary[:25]) is None
@@ -0,0 +1,30 @@
+import binary_recording
+from binary_recording import BinaryRecording, HEADER_SIZE, RECORD_SIZE
+import numpy as np
+import pytest
+from replay_data import TEST_FILE, read_recording
+
+
+def test_convert_text_recording(tmp_path, monkeypatch):
+  # small chunks, so that lines are split between chunks
+  monkeypatch.setattr(binary_recording, 'TEXT_CHUNK_BYTES', 100)
+  binary_path = binary_recording.convert_text_recording(TEST_FILE, str(tmp_path / 'test.hsr'))
+  recording = BinaryRecording(binary_path)
+  assert np.array_equal(recording.scans, read_recording(TEST_FILE))
+  assert recording.header['record_size'] == RECORD_SIZE
+
+
+def test_partial_last_record_is_ignored(tmp_path):
+  binary_path = binary_recording.convert_text_recording(TEST_FILE, str(tmp_path / 'test.hsr'))
+  with open(binary_path, 'ab') as file_object:
+    file_object.write(b'\x01\x02\x03')
+  assert len(BinaryRecording(binary_path)) == len(read_recording(TEST_FILE))
+
+
+def test_empty_and_invalid_files(tmp_path):
+  empty = tmp_path / 'empty.hsr'
+  with open(empty, 'wb') as file_object:
+    binary_recording.write_header(file_object)
+  assert len(BinaryRecording(empty)) == 0
+  with pytest.raises(ValueError):
+    BinaryRecording(TEST_FILE)
@@ -0,0 +1,57 @@
+import block_dispatcher
+import numpy as np
+import threading
+
+SIGNAL = 'test_signal'
+
+
+def test_direct_and_queued_receivers():
+  received = []
+  queued = []
+  done = threading.Event()
+
+  def receive(message):
+    received.append(message)
+
+  def receive_queued(message):
+    queued.append(message)
+    if len(queued) == 3:
+      done.set()
+
+  block_dispatcher.connect(receive, signal=SIGNAL, sender='a')
+  block_dispatcher.connect(receive_queued, signal=SIGNAL, queued=True)
+  for i in range(3):
+    block_dispatcher.send(signal=SIGNAL, sender='a', message=np.arange(i+1))
+  block_dispatcher.send(signal=SIGNAL, sender='b', message=np.arange(4))
+  assert done.wait(2)
+  assert [len(block) for block in received] == [1, 2, 3]
+  stats = {s['receiver']: s for s in block_dispatcher.stats() if s['signal'] == SIGNAL}
+  assert stats[receive.__qualname__]['samples_delivered'] == 6
+  block_dispatcher.disconnect(receive, SIGNAL)
+  block_dispatcher.disconnect(receive_queued, SIGNAL)
+  block_dispatcher.send(signal=SIGNAL, sender='a', message=np.arange(1))
+  assert len(received) == 3
+
+
+def test_full_queue_drops_blocks():
+  release = threading.Event()
+  receiver = block_dispatcher.connect(lambda message: release.wait(2), signal='slow', queued=True, maxsize=2)
+  for i in range(6):
+    block_dispatcher.send(signal='slow', sender='a', message=np.arange(1))
+  assert receiver.blocks_dropped >= 3
+  release.set()
+  block_dispatcher.disconnect(receiver.receiver, 'slow')
+
+
+def test_stop_does_not_block_on_a_full_queue():
+  release = threading.Event()
+  receiver = block_dispatcher.connect(lambda message: release.wait(2), signal='stuck', queued=True, maxsize=2)
+  for i in range(4):
+    block_dispatcher.send(signal='stuck', sender='a', message=np.arange(1))
+  stopper = threading.Thread(target=block_dispatcher.disconnect, args=(receiver.receiver, 'stuck'))
+  stopper.start()
+  stopper.join(1)
+  assert not stopper.is_alive()
+  release.set()
+  receiver.thread.join(2)
+  assert not receiver.thread.is_alive()
@@ -0,0 +1,62 @@
+import accelerometer_data_structure as ads
+import clock_sync
+from clock_sync import ClockEstimator
+from dataframe import DataFrame
+import numpy as np
+import pytest
+
+
+def make_blocks(num_blocks, drift_ppm, offset_ms=1.7e12, block_ms=80, seed=1):
+  ''' Return blocks of device millis, the host arrival time of each block and the true host time of each scan. '''
+  rng = np.random.default_rng(seed)
+  blocks, arrivals, true_host_ms = [], [], []
+  for number in range(num_blocks):
+    millis = number*block_ms + np.arange(0, block_ms, 20)
+    host_ms = offset_ms + millis * (1 + drift_ppm*1e-6)
+    # 1 ms fastest transport, most blocks take longer
+    arrivals.append(host_ms[-1] + 1 + rng.exponential(3))
+    blocks.append(millis)
+    true_host_ms.append(host_ms)
+  return blocks, arrivals, true_host_ms
+
+
+def test_offset_and_drift_from_smallest_deltas():
+  clock = ClockEstimator()
+  blocks, arrivals, true_host_ms = make_blocks(2000, drift_ppm=200)
+  for millis, arrival, host_ms in zip(blocks, arrivals, true_host_ms):
+    estimated = clock.update(millis, arrival)
+  stats = clock.stats()
+  assert stats['windows'] == clock.minima.maxlen
+  assert stats['drift_ppm'] == pytest.approx(200, abs=20)
+  # host times are early by the fastest transport, 1 ms
+  assert np.all(np.abs(host_ms + 1 - estimated) < 1)
+  assert stats['transport']['p50_ms'] == pytest.approx(np.log(2)*3, rel=0.3)
+  assert stats['jitter_ms'] == pytest.approx(3, rel=0.5)
+
+
+def test_restarts_when_the_watch_is_reset():
+  clock = ClockEstimator()
+  blocks, arrivals, true_host_ms = make_blocks(100, drift_ppm=0)
+  for millis, arrival in zip(blocks, arrivals):
+    clock.update(millis, arrival)
+  # the watch starts counting from 0 again, 10 s later
+  estimated = clock.update(blocks[0], arrivals[-1] + 10000)
+  assert clock.resets == 1
+  assert clock.stats()['windows'] == 0
+  assert estimated[-1] == pytest.approx(arrivals[-1] + 10000)
+
+
+def test_dataframe_host_ms_from_the_arrival_mark():
+  dataframe = DataFrame(10)
+  scans = np.zeros(4, dtype=ads.acc_scan_dtype)
+  scans['millis'] = [1000, 1020, 1040, 1060]
+  clock_sync.mark_arrival(5000.0)
+  dataframe.update_dataframe(scans)
+  assert clock_sync.arrival_ms() == 5000.0
+  del clock_sync.thread_data.arrival_ms
+  assert np.array_equal(dataframe.buffer.latest('host_ms', 4), [4940, 4960, 4980, 5000])
+
+
+def test_bad_windows_are_rejected():
+  with pytest.raises(ValueError):
+    ClockEstimator(window_ms=0)
@@ -0,0 +1,49 @@
+import binary_recording
+import compressed_recording
+from compressed_recording import ChunkEncoder, CODECS, read_chunks
+import numpy as np
+import pytest
+from replay_data import ReplayData, TEST_FILE, read_recording
+
+
+def test_zigzag_round_trip():
+  values = np.array([0, -1, 1, -2, 2, 2**62, -2**62], dtype=np.int64)
+  assert compressed_recording.zigzag(values)[:5].tolist() == [0, 1, 2, 3, 4]
+  assert np.array_equal(compressed_recording.unzigzag(compressed_recording.zigzag(values)), values)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_convert_recording(tmp_path, codec):
+  binary_path = binary_recording.convert_text_recording(TEST_FILE, str(tmp_path / 'test.hsr'))
+  for input_path in [TEST_FILE, binary_path]:
+    compressed_path = compressed_recording.convert_recording(input_path, str(tmp_path / 'test.hsz'), codec, chunk_scans=32)
+    assert np.array_equal(read_recording(compressed_path), read_recording(TEST_FILE))
+    assert len(list(read_chunks(compressed_path))) == 4
+
+
+def test_chunks_end_at_chunk_ms():
+  scans = read_recording(TEST_FILE)[:40]
+  scans['millis'] = np.arange(40) * 80
+  encoder = ChunkEncoder(chunk_ms=1000)
+  chunks, chunk_numbers = encoder.add(scans)
+  assert len(chunks) == 3 and np.bincount(chunk_numbers).tolist() == [13, 13, 13, 1]
+  assert encoder.first_scan == 39 and encoder.num_pending == 1
+
+
+def test_partial_last_chunk_is_ignored(tmp_path):
+  compressed_path = compressed_recording.convert_recording(TEST_FILE, str(tmp_path / 'test.hsz'))
+  with open(compressed_path, 'rb') as file_object:
+    data = file_object.read()
+  with open(compressed_path, 'ab') as file_object:
+    file_object.write(data[compressed_recording.HEADER_SIZE:-10])
+  assert np.array_equal(read_recording(compressed_path), read_recording(TEST_FILE))
+
+
+def test_replay_decompresses_as_it_goes(tmp_path):
+  compressed_path = compressed_recording.convert_recording(TEST_FILE, str(tmp_path / 'test.hsz'), 'zlib', 50)
+  replay = ReplayData(compressed_path, speed=0)
+  assert replay.scans is None
+  blocks = []
+  replay.inject_block = blocks.append
+  replay.run()
+  assert np.array_equal(np.concatenate(blocks), read_recording(TEST_FILE))
@@ -0,0 +1,64 @@
+from curve_tracker import CurveTracker, RenderCounter
+import numpy as np
+
+
+class FakeCurve():
+  def __init__(self):
+    self.calls = 0
+    self.visible = True
+    self.y = None
+
+  def isVisible(self):
+    return self.visible
+
+  def setData(self, x, y):
+    self.calls += 1
+    self.y = y
+
+
+def test_generation_already_drawn_is_not_redrawn():
+  curve = FakeCurve()
+  tracker = CurveTracker(curve, 'a', 4)
+  columns = {'a': np.array([np.nan, np.nan, 1., 2.])}
+  assert tracker.update(columns, 1)
+  assert not tracker.update(columns, 1)
+  assert tracker.update(columns, 2)
+  assert curve.calls == 2
+
+
+def test_curve_is_given_the_trackers_copy():
+  curve = FakeCurve()
+  tracker = CurveTracker(curve, 'a', 3)
+  column = np.array([1., 2., 3.])
+  tracker.update({'a': column}, 1)
+  assert curve.y is tracker.last_data
+  column[:] = 0 # the snapshot buffer is reused by the writer
+  assert curve.y.tolist() == [1., 2., 3.]
+
+
+def test_hidden_curve_is_drawn_when_shown():
+  curve = FakeCurve()
+  curve.visible = False
+  tracker = CurveTracker(curve, 'a', 3)
+  columns = {'a': np.full(3, np.nan)}
+  assert not tracker.update(columns, 1)
+  curve.visible = True
+  assert tracker.update(columns, 1)
+  assert curve.calls == 1
+
+
+def test_x_values_from_a_time_column():
+  curve = FakeCurve()
+  tracker = CurveTracker(curve, 'a', 3, x_column='host_ms', x_origin=1000., x_scale=1e-3)
+  tracker.update({'a': np.array([1., 2., 3.]), 'host_ms': np.array([1000., 1080., 1160.])}, 1)
+  assert np.allclose(tracker.x_values, [0, 0.08, 0.16])
+
+
+def test_render_counter_rates():
+  counter = RenderCounter()
+  for curves_redrawn in [8, 0, 0, 3]:
+    counter.add_tick(curves_redrawn)
+  rates = counter.rates(2)
+  assert rates == {'ticks': 2, 'redraws': 1, 'skipped': 1, 'curves': 5.5}
+  counter.reset_interval()
+  assert counter.rates(1)['ticks'] == 0
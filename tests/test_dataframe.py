@@ -0,0 +1,16 @@
+from dataframe import DataFrame, ROLLING_WINDOW_LENGTH
+import numpy as np
+from replay_data import TEST_FILE, read_recording
+
+
+def test_block_longer_than_the_buffer_updates_the_rolling_mean():
+  scans = read_recording(TEST_FILE)[:3*ROLLING_WINDOW_LENGTH]
+  dataframe = DataFrame(max_rows=ROLLING_WINDOW_LENGTH // 2)
+  dataframe.update_dataframe(scans)
+  acc_y = scans['acc_y'].astype(float)
+  assert dataframe.y_stats.count == len(scans)
+  expected = np.array([acc_y[end-ROLLING_WINDOW_LENGTH:end].mean()
+    for end in range(len(scans) - dataframe.buffer.capacity + 1, len(scans) + 1)])
+  assert np.allclose(dataframe.buffer.latest('y_rolling_mean', dataframe.buffer.capacity), expected)
+  assert np.allclose(dataframe.buffer.latest('y_exceeded_mean', dataframe.buffer.capacity),
+    2*np.abs(acc_y[-dataframe.buffer.capacity:] - expected))
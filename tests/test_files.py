@@ -0,0 +1,117 @@
+import accelerometer_data_structure as ads
+from files import Recorder
+import numpy as np
+import pytest
+from replay_data import read_recording
+import time
+
+
+def make_scans(num_scans):
+  scans = np.zeros(num_scans, dtype=ads.acc_scan_dtype)
+  scans['millis'] = np.arange(num_scans) * 80
+  scans['counter'] = np.arange(num_scans)
+  scans['acc_x'] = -np.arange(num_scans)
+  return scans
+
+
+def test_recording_reads_back(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.txt')
+  scans = make_scans(100)
+  recorder.start(tmp_path / 'part0.txt')
+  for block in np.array_split(scans, 7):
+    recorder.put(block)
+  recorder.stop()
+  assert np.array_equal(read_recording(tmp_path / 'part0.txt'), scans)
+  stats = recorder.stats()
+  assert stats['backlog_scans'] == 0 and stats['scans_written'] == 100 and stats['fsyncs'] == 1
+
+
+def test_rotation_by_size(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.txt', max_bytes=1000)
+  scans = make_scans(200)
+  recorder.start(tmp_path / 'part0.txt')
+  for block in np.array_split(scans, 20):
+    recorder.put(block)
+  recorder.stop()
+  files = sorted(tmp_path.glob('*.txt'), key=lambda path: int(path.stem[4:]))
+  assert len(files) == recorder.stats()['files'] > 1
+  assert np.array_equal(np.concatenate([read_recording(path) for path in files]), scans)
+
+
+def test_full_queue_drops_blocks(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.txt', queue_size=2)
+  # not started, so nothing is taken off the queue
+  for block in np.array_split(make_scans(40), 4):
+    recorder.put(block)
+  stats = recorder.stats()
+  assert stats['blocks_dropped'] == 2 and stats['scans_dropped'] == 20 and stats['backlog_scans'] == 20
+
+
+def test_write_errors_are_dropped_not_written(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.txt')
+  def write_block(block, host_time):
+    raise OSError('disk full')
+  recorder.write_block = write_block
+  recorder.start(tmp_path / 'part0.txt')
+  for block in np.array_split(make_scans(20), 2):
+    recorder.put(block)
+  recorder.stop()
+  stats = recorder.stats()
+  assert stats['scans_written'] == 0 and stats['scans_dropped'] == 20 and stats['backlog_scans'] == 0
+
+
+def test_fsync_policy_is_checked(tmp_path):
+  with pytest.raises(ValueError):
+    Recorder(lambda part: tmp_path / 'x.txt', fsync='always')
+
+
+def test_binary_recording_reads_back(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.hsr', record_format='binary')
+  scans = make_scans(100)
+  recorder.start(tmp_path / 'part0.hsr')
+  for block in np.array_split(scans, 7):
+    recorder.put(block)
+  recorder.stop()
+  assert np.array_equal(read_recording(tmp_path / 'part0.hsr'), scans)
+
+
+def test_binary_recording_appends_after_a_partial_record(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.hsr', record_format='binary')
+  scans = make_scans(20)
+  recorder.start(tmp_path / 'part0.hsr')
+  recorder.put(scans[:10])
+  recorder.stop()
+  with open(tmp_path / 'part0.hsr', 'ab') as file_object:
+    file_object.write(b'\x01\x02\x03') # a write cut short
+  recorder.start(tmp_path / 'part0.hsr')
+  recorder.put(scans[10:])
+  recorder.stop()
+  assert np.array_equal(read_recording(tmp_path / 'part0.hsr'), scans)
+
+
+def test_compressed_recording_reads_back(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.hsz', record_format='lzma')
+  scans = make_scans(100)
+  recorder.start(tmp_path / 'part0.hsz')
+  for block in np.array_split(scans, 7):
+    recorder.put(block)
+  recorder.stop()
+  # recording again appends to the same file
+  recorder.start(tmp_path / 'part0.hsz')
+  recorder.put(scans)
+  recorder.stop()
+  assert np.array_equal(read_recording(tmp_path / 'part0.hsz'), np.concatenate((scans, scans)))
+
+
+def test_compressed_chunk_is_written_at_the_flush_deadline(tmp_path):
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.hsz', record_format='pack', flush_interval=0.05)
+  scans = make_scans(100)
+  recorder.start(tmp_path / 'part0.hsz')
+  recorder.put(scans)
+  for attempt in range(100):
+    time.sleep(0.02)
+    if recorder.flushes:
+      break
+  # still recording, the chunk was ended by the deadline, not by the file closing
+  assert np.array_equal(read_recording(tmp_path / 'part0.hsz'), scans)
+  recorder.stop()
@@ -0,0 +1,44 @@
+from frame_governor import FrameGovernor
+import pytest
+
+testdata1 = [(0.001, None, 60, 'max fps'), (0.001, 20, 20, 'sensor rate'), (0.05, None, 10, 'render cost')]
+
+
+@pytest.mark.parametrize('render_time, sample_rate, expected_fps, reason', testdata1)
+def test_steady_state(render_time, sample_rate, expected_fps, reason):
+  governor = FrameGovernor(min_fps=5, max_fps=60)
+  for tick in range(100):
+    governor.update(render_time, 1/governor.fps, sample_rate)
+  assert governor.fps == pytest.approx(expected_fps)
+  assert governor.reason == reason
+
+
+def test_backs_off_when_ticks_are_late():
+  governor = FrameGovernor(min_fps=5, max_fps=60)
+  governor.update(0.001, 3/governor.fps)
+  assert governor.reason == 'falling behind'
+  assert governor.fps == pytest.approx(48)
+  for tick in range(100):
+    governor.update(0.001, 1)
+  assert governor.fps == 5
+
+
+def test_idle_then_reset():
+  governor = FrameGovernor(min_fps=5, max_fps=60, idle_fps=1)
+  assert governor.update(0.001, idle=True) == 1000
+  assert governor.reason == 'idle'
+  # the first tick after idle is late, this does not count as falling behind
+  governor.update(0.001, 1)
+  assert governor.reason != 'falling behind'
+  assert governor.reset() == 17
+
+
+def test_reset_when_shown_again():
+  governor = FrameGovernor(min_fps=5, max_fps=60, idle_fps=1)
+  for tick in range(20):
+    governor.update(0.05, 1/governor.fps)
+  assert governor.fps == pytest.approx(10)
+  governor.update(0.05, idle=True) # minimised
+  governor.update(0.001, 1)
+  assert governor.fps == 60
+  assert governor.render_time == 0.001
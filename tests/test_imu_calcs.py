@@ -1,4 +1,6 @@
 from imu_calcs import IMU_calcs
+import numpy as np
+from ring_buffer import RingBuffer
 import pytest
 testdata1 = [(2,2,2,3.46410)]
 
@@ -8,3 +10,32 @@ def test_abs(x,y,z, expected):
   #assert imu_calcs.abs(test_input) == pytest.approx(expected)
   assert imu_calcs.abs(x,y,z) != pytest.approx(3.14)
   assert imu_calcs.abs(x,y,z) == pytest.approx(expected)
+
+testdata2 = [(100, -200, 300), (100, -200, -300), (-50, 400, 0), (0, 0, 0)]
+
+@pytest.mark.parametrize("x,y,z", testdata2)
+def test_features_match_scalar_functions(x,y,z):
+  acc_abs, pitch, roll, yaw = IMU_calcs.features(np.array([x]), np.array([y]), np.array([z]))
+  assert acc_abs[0] == pytest.approx(IMU_calcs.abs(x,y,z))
+  assert pitch[0] == pytest.approx(IMU_calcs.pitch(x,y,z))
+  assert roll[0] == pytest.approx(IMU_calcs.roll(x,y,z))
+  assert yaw[0] == pytest.approx(IMU_calcs.yaw(x,y,z))
+
+
+def test_roll_sign_flips_with_z():
+  z = np.array([-1.0, 0.0, 1.0])
+  assert list(IMU_calcs.roll_sign(z)) == [1, 1, -1]
+  roll = IMU_calcs.roll(np.zeros(3), np.ones(3), z)
+  assert roll[0] == pytest.approx(IMU_calcs.roll(0, 1, -1))
+  assert roll[2] == pytest.approx(IMU_calcs.roll(0, 1, 1))
+
+
+def test_update_buffer_block():
+  buffer = RingBuffer(['acc_x', 'acc_y', 'acc_z', 'acc_abs', 'pitch', 'roll', 'yaw'], 8)
+  block = np.zeros((7, 4))
+  block[:3] = [[1, 2, 3, 4], [5, 6, 7, 8], [-9, 10, -11, 12]]
+  buffer.extend(block)
+  IMU_calcs().update_buffer(buffer, 4)
+  expected = IMU_calcs.features(block[0], block[1], block[2])
+  for name, values in zip(['acc_abs', 'pitch', 'roll', 'yaw'], expected):
+    assert np.allclose(buffer.latest(name, 4), values)
@@ -0,0 +1,54 @@
+import latency
+from latency import LatencyHistogram
+import numpy as np
+import pytest
+import time
+
+testdata1 = [50, 95, 99]
+
+
+@pytest.fixture
+def enabled():
+  latency.enable()
+  yield
+  latency.disable()
+  latency.reset()
+
+
+@pytest.mark.parametrize('percent', testdata1)
+def test_histogram_percentile(percent):
+  histogram = LatencyHistogram()
+  values = np.random.default_rng(1).lognormal(np.log(1e-3), 1, 10000)
+  for value in values:
+    histogram.add(value)
+  expected = np.percentile(values, percent)
+  assert histogram.percentile(percent) == pytest.approx(expected, rel=0.15)
+
+
+def test_disabled_records_nothing():
+  latency.disable()
+  latency.mark_arrival()
+  latency.record('parse')
+  latency.published()
+  latency.rendered()
+  assert all(stats['count'] == 0 for stats in latency.dump().values())
+
+
+def test_render_uses_oldest_published_arrival(enabled):
+  now = time.monotonic()
+  latency.published(now - 2)
+  latency.published(now - 1)
+  latency.rendered()
+  latency.rendered() # nothing new published
+  render = latency.dump()['render']
+  assert render['count'] == 1
+  assert render['max_ms'] >= 2000
+
+
+def test_stage_latency_from_arrival(enabled):
+  latency.mark_arrival(time.monotonic() - 0.01)
+  latency.record('parse')
+  parse = latency.dump()['parse']
+  assert parse['count'] == 1
+  assert parse['p50_ms'] == pytest.approx(10, rel=0.15)
+  assert 'parse' in latency.summary()
@@ -0,0 +1,64 @@
+from binary_protocol import BinaryFrameDecoder
+from load_generator import LoadGenerator
+import numpy as np
+import os
+from parse_accelerometer_data import Parse_accelerometer_data
+import pytest
+import select
+import time
+
+
+def read_all(generator, duration, timeout=0.2):
+  ''' Run the generator for duration s, reading its pty as it writes, return everything written. '''
+  generator.start(duration)
+  data = b''
+  while generator.running or select.select([generator.slave], [], [], 0)[0]:
+    if select.select([generator.slave], [], [], timeout)[0]:
+      data += os.read(generator.slave, 65536)
+  generator.wait()
+  return data
+
+
+def test_make_scans_counter_wraps():
+  generator = LoadGenerator(rate=500)
+  try:
+    scans = generator.make_scans(2**15 - 1, 3)
+  finally:
+    generator.close()
+  assert scans['counter'].tolist() == [2**15 - 1, -2**15, -2**15 + 1]
+  assert scans['millis'].tolist() == [65534, 65536, 65538]
+
+
+def test_stop_with_no_reader():
+  generator = LoadGenerator(rate=5000)
+  generator.start()
+  # nothing reads the pty, so the writer is soon waiting for space in its buffer
+  time.sleep(0.5)
+  start = time.monotonic()
+  generator.close()
+  assert time.monotonic() - start < 1
+
+
+@pytest.mark.parametrize('protocol', ['text', 'binary'])
+def test_scans_read_from_pty(protocol):
+  generator = LoadGenerator(rate=5000, protocol=protocol, burst=4, split=0.5, seed=1)
+  try:
+    data = read_all(generator, 0.1)
+  finally:
+    generator.close()
+  if protocol == 'binary':
+    scans = BinaryFrameDecoder().decode(data)
+  else:
+    scans = Parse_accelerometer_data().parse_batch(data + b'\n')
+  stats = generator.stats()
+  assert stats['scans_sent'] == len(scans) == 500 and stats['splits'] > 0
+  assert np.array_equal(scans['counter'], np.arange(500))
+
+
+def test_corruption_is_counted():
+  generator = LoadGenerator(rate=5000, corrupt=0.5, seed=2)
+  try:
+    read_all(generator, 0.05)
+  finally:
+    generator.close()
+  assert 0 < generator.stats()['scans_corrupted'] < 250
@@ -0,0 +1,64 @@
+from load_generator import LoadGenerator
+from multi_device import MultiDevice
+import numpy as np
+import pytest
+from replay_data import read_recording
+import serial_connection
+import time
+
+
+def wait_for(condition, timeout=2):
+  deadline = time.monotonic() + timeout
+  while not condition() and time.monotonic() < deadline:
+    time.sleep(0.01)
+
+
+def test_find_serial_ports_in_number_order(monkeypatch):
+  ports = {'/dev': ['ttyUSB10', 'ttyS0', 'ttyUSB2', 'ttyACM0'], '/tmp': ['ttyV1']}
+  monkeypatch.setattr(serial_connection.os, 'listdir', lambda path: ports[path])
+  assert serial_connection.find_serial_ports() == ['/dev/ttyACM0', '/dev/ttyUSB2', '/dev/ttyUSB10']
+
+
+def test_find_serial_ports_reads_the_odd_end_of_each_socat_pair(monkeypatch):
+  ports = {'/dev': ['ttyS0'], '/tmp': ['ttyV3', 'ttyV0', 'ttyV2', 'ttyV1', 'tmpfile']}
+  monkeypatch.setattr(serial_connection.os, 'listdir', lambda path: ports[path])
+  assert serial_connection.find_serial_ports() == ['/tmp/ttyV1', '/tmp/ttyV3']
+
+
+def test_each_watch_is_read_into_its_own_dataframe(tmp_path):
+  generators = [LoadGenerator(rate=rate, protocol='binary', seed=number)
+    for number, rate in enumerate((500, 1000))]
+  devices = MultiDevice([generator.port for generator in generators], max_rows=2000, save_dir=tmp_path)
+  devices.start()
+  try:
+    devices.record(True)
+    for generator in generators:
+      generator.start(0.5)
+    for generator in generators:
+      generator.wait()
+    wait_for(lambda: all(device.scans == generator.scans_sent for device, generator in zip(devices, generators)))
+    devices.record(False)
+  finally:
+    start = time.monotonic()
+    devices.stop()
+    stop_time = time.monotonic() - start
+    for generator in generators:
+      generator.close()
+  assert stop_time < 0.5
+  for device, generator in zip(devices, generators):
+    assert device.scans == generator.scans_sent
+    generation, columns = device.snapshot.acquire()
+    millis, host_ms = columns['millis'], columns['host_ms']
+    valid = ~np.isnan(millis)
+    # host_ms is millis moved onto the host clock, so both watches are near the start of the test
+    assert np.all(np.abs(host_ms[valid] - millis[valid] - device.dataframe.clock.offset(millis[valid])) < 50)
+    assert abs(host_ms[valid][-1] - 1000*time.time()) < 2000
+    recordings = list(tmp_path.glob(f'*_{device.name}_*.txt'))
+    assert len(recordings) == 1
+    assert len(read_recording(recordings[0])) == generator.scans_sent
+  assert set(devices.stats()) == {'watch0', 'watch1'}
+
+
+def test_the_same_port_twice_is_rejected():
+  with pytest.raises(ValueError):
+    MultiDevice(['/dev/ttyUSB0', '/dev/ttyUSB0'])
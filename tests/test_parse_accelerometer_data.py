@@ -0,0 +1,68 @@
+import accelerometer_data_structure as ads
+import numpy as np
+from parse_accelerometer_data import Parse_accelerometer_data
+import pytest
+
+LOG_LINE = '[DEBUG] accelerometer.cpp L.39 log_acc : ST m:  {} c:  {} x:  {} y:  {} z:  {} EN\r\n'
+testdata1 = [(10041, 57, 228, 270, -369), (416470, 4824, -410, 301, 6)]
+
+@pytest.mark.parametrize("scan", testdata1)
+def test_parse_batch_matches_single_scan(scan):
+  parser = Parse_accelerometer_data()
+  line = LOG_LINE.format(*scan)
+  parsed = parser.parse_batch(line)
+  single_scan = parser.extract_single_scan(line, parser.START_MARKER, parser.END_MARKER)[1]
+  expected = parser.parse_single_scan(single_scan)
+  assert parsed.dtype == ads.acc_scan_dtype
+  assert tuple(parsed[0]) == tuple(int(value) for value in expected)
+
+
+def test_parse_batch_skips_incomplete_scans():
+  parser = Parse_accelerometer_data()
+  data = (LOG_LINE.format(*testdata1[0]) + 'ST m: 12 c: 3 x:' + LOG_LINE.format(*testdata1[1])).encode()
+  parsed = parser.parse_batch(data)
+  assert [tuple(scan) for scan in parsed] == testdata1
+
+
+def test_parse_new_data_carries_partial_scans():
+  parser = Parse_accelerometer_data()
+  data = ''.join(LOG_LINE.format(1000+80*i, i, i, -i, 6) for i in range(20)).encode()
+  parsed = [parser.parse_new_data(data[i:i+7]) for i in range(0, len(data), 7)]
+  counters = [int(c) for block in parsed if block is not None for c in block['counter']]
+  assert counters == list(range(20))
+  assert parser.stats()['frames_lost'] == 0
+
+
+def test_parse_new_data_counts_lost_and_malformed_frames():
+  parser = Parse_accelerometer_data()
+  lines = [LOG_LINE.format(1000+80*i, i, i, -i, 6) for i in range(10)]
+  lines[3] = lines[3].replace('y:', 'y;') # corrupted in the parser's view
+  del lines[6] # never arrived
+  parser.parse_new_data(''.join(lines))
+  stats = parser.stats()
+  assert stats['scans_parsed'] == 8
+  assert stats['frames_malformed'] == 1
+  assert stats['frames_lost'] == 2
+  assert stats['link_drops'] == 1
+
+
+def test_parse_batch_drops_values_out_of_range():
+  parser = Parse_accelerometer_data()
+  lines = [LOG_LINE.format(1000+80*i, i, i, -i, 6) for i in range(4)]
+  lines[1] = LOG_LINE.format(1080, 1, 40000, -1, 6) # wraps to a negative int16
+  parsed = parser.parse_batch(''.join(lines))
+  assert parsed['counter'].tolist() == [0, 2, 3]
+  assert parser.stats()['scans_out_of_range'] == 1
+
+
+def test_check_counters_counts_gaps_across_the_wrap():
+  parser = Parse_accelerometer_data()
+  parser.check_counters(np.array([32766, 32767]))
+  parser.check_counters(np.array([-32767, -32766])) # -32768 lost at the wrap
+  assert parser.frames_lost == 1
+
+
+def test_check_counters_ignores_a_watch_reset():
+  parser = Parse_accelerometer_data()
+  parser.check_counters(np.array([5000, 5001, 0, 1])) # the watch was reset
+  assert parser.frames_lost == 0
@@ -0,0 +1,70 @@
+import binary_recording
+import compressed_recording
+from files import Recorder
+import numpy as np
+import pytest
+from recording_index import RecordingIndex
+import shutil
+from replay_data import ReplayData, TEST_FILE, read_recording
+
+testdata1 = ['text', 'binary', 'pack']
+
+
+def copy_recording(tmp_path, record_format):
+  if record_format == 'binary':
+    return binary_recording.convert_text_recording(TEST_FILE, str(tmp_path / 'test.hsr'))
+  if record_format == 'pack':
+    return compressed_recording.convert_recording(TEST_FILE, str(tmp_path / 'test.hsz'))
+  return shutil.copy(TEST_FILE, tmp_path / 'test.txt')
+
+
+@pytest.mark.parametrize('record_format', testdata1)
+def test_rebuilt_index_seeks(tmp_path, record_format):
+  path = copy_recording(tmp_path, record_format)
+  scans = read_recording(path)
+  index = RecordingIndex(path, stride=10)
+  assert index.num_scans == len(scans) and len(index.entries) == 13
+  millis = scans['millis']
+  assert np.array_equal(index.read_millis_range(millis[15], millis[47]), scans[15:47])
+  assert np.array_equal(index.read_millis_range(None, millis[3]), scans[:3])
+  host_times = index.entries['host_time']
+  assert np.array_equal(index.read_time_range(host_times[2], host_times[5]), scans[20:50])
+  # the saved index is loaded, not rebuilt
+  assert np.array_equal(RecordingIndex(path, stride=10).entries, index.entries)
+
+
+@pytest.mark.parametrize('record_format', testdata1)
+def test_index_written_while_recording(tmp_path, record_format):
+  scans = read_recording(TEST_FILE)
+  path = tmp_path / f'part0.{record_format}'
+  recorder = Recorder(lambda part: tmp_path / f'part{part}.{record_format}', record_format=record_format,
+    index_stride=10)
+  recorder.start(path)
+  for number, block in enumerate(np.array_split(scans, 9)):
+    recorder.put(block, host_time=1000.0 + number)
+  recorder.stop()
+  written = RecordingIndex(path, stride=10).entries
+  (tmp_path / f'part0.{record_format}.idx').unlink()
+  rebuilt = RecordingIndex(path, stride=10).entries
+  assert np.array_equal(written[['scan', 'offset', 'millis']], rebuilt[['scan', 'offset', 'millis']])
+  assert written['host_time'][0] == pytest.approx(1000.0 - (scans['millis'][13] - scans['millis'][0]) / 1000)
+
+
+def test_stale_index_is_extended(tmp_path):
+  path = copy_recording(tmp_path, 'text')
+  with open(path) as file_object:
+    lines = file_object.readlines()
+  with open(path, 'w') as file_object:
+    file_object.writelines(lines[:55])
+  assert RecordingIndex(path, stride=10).num_scans == 55
+  with open(path, 'a') as file_object:
+    file_object.writelines(lines[55:])
+  index = RecordingIndex(path, stride=10)
+  assert index.num_scans == len(lines) and list(index.entries['scan']) == list(range(0, 130, 10))
+
+
+def test_replay_time_range(tmp_path):
+  path = copy_recording(tmp_path, 'binary')
+  host_times = RecordingIndex(path, stride=10).entries['host_time']
+  replay_data = ReplayData(path, speed=0, start_time=host_times[3], end_time=host_times[6])
+  assert np.array_equal(replay_data.scans, read_recording(path)[30:60])
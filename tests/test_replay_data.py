@@ -0,0 +1,27 @@
+import block_dispatcher
+import dispatcher_signals as ds
+import numpy as np
+import pytest
+from replay_data import ReplayData, TEST_FILE, read_recording
+
+
+def test_read_recording_with_and_without_quotes(tmp_path):
+  recording = tmp_path / 'recording.txt'
+  recording.write_text("acc_scan(millis='416470', counter='4824', acc_x='-410', acc_y='301', acc_z=' 6')\n"
+    "acc_scan(millis=416550, counter=4825, acc_x=-414, acc_y=304, acc_z=6)\n")
+  scans = read_recording(recording)
+  assert scans.tolist() == [(416470, 4824, -410, 301, 6), (416550, 4825, -414, 304, 6)]
+
+
+@pytest.mark.parametrize("inject", ['publish', 'parser'])
+def test_replay_as_fast_as_possible(inject):
+  received = []
+  receive = lambda message: received.append(message)
+  block_dispatcher.connect(receive, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+  try:
+    replay = ReplayData(TEST_FILE, speed=0, inject=inject)
+    replay.run()
+  finally:
+    block_dispatcher.disconnect(receive, ds.PARSER_SIGNAL)
+  assert np.array_equal(np.concatenate(received), read_recording(TEST_FILE))
+  assert replay.parser.stats()['frames_lost'] == 0
@@ -0,0 +1,76 @@
+from files import RECORD_LINE
+import numpy as np
+import pytest
+from replay_data import ReplayData, TEST_FILE, read_recording
+from replay_scheduler import ReplayScheduler
+import time
+
+
+def test_deadlines_are_absolute():
+  scheduler = ReplayScheduler(speed=2)
+  scheduler.start(1000)
+  assert scheduler.deadline(1000) == scheduler.start_time
+  assert scheduler.deadline(3000) == pytest.approx(scheduler.start_time + 1.0)
+
+
+@pytest.mark.parametrize('spin_time', [0, 1e-3])
+def test_wait_is_not_early(spin_time):
+  scheduler = ReplayScheduler(spin_time=spin_time)
+  scheduler.start(0)
+  for millis in range(0, 50, 5):
+    scheduler.wait(millis)
+    assert time.perf_counter() >= scheduler.deadline(millis)
+    # how many are due depends on how long the test was held up, at least the waited for block is
+    assert scheduler.take_due(np.array([millis, millis + 5])) >= 1
+
+
+def test_catch_up_burst():
+  scheduler = ReplayScheduler(max_burst=4)
+  scheduler.start(0)
+  # as if the replay had been held up for 1 s
+  scheduler.start_time -= 1.0
+  block_millis = np.arange(0, 2000, 100)
+  assert scheduler.take_due(block_millis) == 4
+  assert scheduler.take_due(block_millis[4:]) == 4
+  stats = scheduler.stats()
+  assert stats['bursts'] == 2 and stats['burst_blocks'] == 8 and stats['late'] == 8
+
+
+def test_burst_stops_where_millis_go_backwards():
+  scheduler = ReplayScheduler()
+  scheduler.start(0)
+  scheduler.start_time -= 1.0
+  block_millis = np.array([0, 10, 20, 5, 15])
+  assert scheduler.take_due(block_millis) == 3
+  scheduler.wait(5)
+  assert scheduler.stats()['restarts'] == 1
+  assert scheduler.take_due(block_millis[3:]) == 1
+
+
+def test_replay_one_scan_at_a_time():
+  replay = ReplayData(TEST_FILE, speed=50, block_ms=0)
+  blocks = []
+  replay.inject_block = blocks.append
+  replay.running = True
+  replay.replay_once()
+  scans = read_recording(TEST_FILE)
+  assert np.array_equal(np.concatenate(blocks), scans)
+  assert replay.scheduler.stats()['blocks'] == len(np.unique(scans['millis']))
+
+
+def test_replay_restarts_the_clock_after_a_watch_reset(tmp_path):
+  scans = read_recording(TEST_FILE)[:20]
+  recording = tmp_path / 'reset.txt'
+  # the second copy starts again from the first millis, as after a watch reset
+  recording.write_text(''.join(RECORD_LINE.format(*scan) for scan in np.concatenate((scans, scans)).tolist()))
+  replay = ReplayData(recording, speed=50)
+  blocks = []
+  replay.inject_block = blocks.append
+  replay.running = True
+  start = time.perf_counter()
+  replay.replay_once()
+  assert np.array_equal(np.concatenate(blocks), np.concatenate((scans, scans)))
+  assert replay.scheduler.stats()['restarts'] == 1
+  # the second copy was paced, not sent as one late burst
+  recorded_time = 2 * (scans['millis'][-1] - scans['millis'][0]) / 1000 / 50
+  assert time.perf_counter() - start >= recorded_time
@@ -0,0 +1,83 @@
+import accelerometer_data_structure as ads
+import block_dispatcher
+import dispatcher_signals as ds
+import numpy as np
+import pytest
+from replay_data import TEST_FILE, read_recording
+from resampler import Resampler
+
+
+def make_scans(millis, counter=None):
+  scans = np.zeros(len(millis), dtype=ads.acc_scan_dtype)
+  scans['millis'] = millis
+  scans['counter'] = np.arange(len(millis)) if counter is None else counter
+  # a straight line is interpolated exactly
+  scans['acc_x'] = 2*np.asarray(millis) // 10
+  scans['acc_y'] = 100
+  scans['acc_z'] = -np.asarray(millis) // 10
+  return scans
+
+
+def test_jittery_scans_onto_a_uniform_grid():
+  scans = read_recording(TEST_FILE)
+  resampled = Resampler(12.5).resample(scans)
+  assert np.all(np.diff(resampled['millis']) == 80)
+  assert resampled['millis'][0] == scans['millis'][0]
+  assert resampled['millis'][-1] > scans['millis'][-1] - 80
+  assert np.all(np.diff(resampled['counter']) == 1)
+  assert not resampled['gap'].any()
+
+
+@pytest.mark.parametrize('num_blocks', [1, 7, 200])
+def test_state_is_kept_across_blocks(num_blocks):
+  millis = np.cumsum(np.random.default_rng(1).choice([80, 90, 110], 200))
+  scans = make_scans(millis)
+  whole = Resampler(25).resample(scans)
+  resampler = Resampler(25)
+  blocks = np.concatenate([resampler.resample(block) for block in np.array_split(scans, num_blocks)])
+  assert np.array_equal(blocks, whole)
+  assert np.allclose(whole['acc_x'], whole['millis'] / 5, atol=0.2)
+  assert np.allclose(whole['acc_z'], -whole['millis'] / 10, atol=0.2)
+
+
+def test_counter_gaps_are_not_interpolated_across():
+  millis = np.arange(20) * 80
+  keep = np.r_[0:8, 12:20] # 4 scans dropped
+  scans = make_scans(millis[keep], counter=keep)
+  resampler = Resampler(50)
+  resampled = resampler.resample(scans)
+  # no grid points between the last scan before the gap and the first after it
+  assert not np.any((resampled['millis'] > 7*80) & (resampled['millis'] < 12*80))
+  after_gap = resampled['millis'] == 12*80
+  assert resampled['gap'][after_gap].all() and np.count_nonzero(resampled['gap']) == 1
+  assert np.diff(resampled['counter'])[np.flatnonzero(after_gap)[0] - 1] == resampler.stats()['gap_points'] + 1
+  assert resampler.stats()['gap_points'] == 5*80 // 20 - 1
+
+
+def test_grid_restarts_when_millis_go_backwards():
+  scans = np.concatenate((make_scans(np.arange(10) * 80), make_scans(np.arange(10) * 80 + 5)))
+  resampler = Resampler(12.5)
+  resampled = resampler.resample(scans)
+  assert resampler.stats()['restarts'] == 1
+  assert np.array_equal(resampled['millis'][10:], np.arange(10) * 80 + 5)
+  assert np.flatnonzero(resampled['gap']).tolist() == [10]
+
+
+def test_resampled_blocks_are_published_from_the_parser_sender():
+  received = []
+  def receive(message):
+    received.append(message)
+  resampler = Resampler(12.5, sender=ds.PARSER_SENDER)
+  block_dispatcher.connect(receive, signal=ds.RESAMPLED_SIGNAL, sender=ds.PARSER_SENDER)
+  try:
+    block_dispatcher.send(signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER, message=make_scans(np.arange(5) * 80))
+  finally:
+    block_dispatcher.disconnect(receive, signal=ds.RESAMPLED_SIGNAL)
+    resampler.stop()
+  assert len(received) == 1 and received[0].dtype == ads.resampled_scan_dtype
+  assert len(received[0]) == 5
+
+
+def test_rate_must_be_positive():
+  with pytest.raises(ValueError):
+    Resampler(0)
@@ -0,0 +1,68 @@
+from ring_buffer import RingBuffer
+import numpy as np
+import pytest
+
+testdata1 = [(5, 3), (5, 5), (5, 12)]
+
+@pytest.mark.parametrize("capacity, num_samples", testdata1)
+def test_append_chronological(capacity, num_samples):
+  buffer = RingBuffer(['a', 'b'], capacity)
+  for i in range(num_samples):
+    buffer.append([i, 2*i])
+  expected = np.arange(max(0, num_samples-capacity), num_samples)
+  assert len(buffer) == min(capacity, num_samples)
+  assert np.array_equal(buffer.column('a', valid_only=True), expected)
+  assert np.array_equal(buffer.column('b', valid_only=True), 2*expected)
+  assert buffer.latest('a')[0] == num_samples - 1
+
+
+@pytest.mark.parametrize("capacity, num_samples", testdata1)
+def test_extend_matches_append(capacity, num_samples):
+  appended = RingBuffer(['a'], capacity)
+  extended = RingBuffer(['a'], capacity)
+  appended.append([-1])
+  extended.append([-1])
+  for i in range(num_samples):
+    appended.append([i])
+  extended.extend(np.arange(num_samples).reshape(1, -1))
+  assert np.array_equal(appended.view(), extended.view(), equal_nan=True)
+  assert appended.count == extended.count
+
+
+def test_column_is_view():
+  buffer = RingBuffer(['a'], 4)
+  buffer.extend([[1, 2, 3, 4, 5, 6]])
+  column = buffer.column('a')
+  assert np.shares_memory(column, buffer.data)
+  assert list(buffer.to_dataframe()['a']) == [3, 4, 5, 6]
+
+
+def test_shared_ring_buffer_attach():
+  from acquisition_process import SharedRingBuffer
+  owner = SharedRingBuffer(['a', 'b'], 4)
+  try:
+    writer = SharedRingBuffer(['a', 'b'], 4, name=owner.name)
+    writer.begin_write()
+    writer.extend([[1, 2, 3, 4, 5], [6, 7, 8, 9, 10]])
+    writer.end_write()
+    count, columns = owner.read_columns(['a', 'b'])
+    assert count == 5
+    assert list(columns['a']) == [2, 3, 4, 5]
+    assert list(columns['b']) == [7, 8, 9, 10]
+    writer.close()
+  finally:
+    owner.close()
+
+
+@pytest.mark.parametrize('num_appended', [3, 5, 9])
+def test_set_latest_columns_matches_set_latest(num_appended):
+  expected = RingBuffer(['a', 'b'], 4)
+  buffer = RingBuffer(['a', 'b'], 4)
+  for value in range(num_appended):
+    expected.append([value, 0])
+    buffer.append([value, 0])
+  block = np.array([[10., 11., 12.], [20., 21., 22.]])
+  expected.set_latest('a', block[0])
+  expected.set_latest('b', block[1])
+  buffer.set_latest_columns(['a', 'b'], block)
+  assert np.array_equal(buffer.data, expected.data, equal_nan=True)
@@ -0,0 +1,27 @@
+from rolling_stats import RollingStats
+import numpy as np
+import pandas as pd
+import pytest
+
+testdata1 = [(1,), (8,), (16,), (8, 16)]
+
+@pytest.mark.parametrize("windows", testdata1)
+def test_matches_pandas_rolling(windows):
+  values = np.random.default_rng(1).integers(-512, 512, 300).astype(float)
+  stats = RollingStats(windows)
+  rows = []
+  for value in values:
+    stats.update(value)
+    rows.append([(stats.mean(w), stats.variance(w), stats.min(w), stats.max(w)) for w in windows])
+  for index, window in enumerate(windows):
+    rolling = pd.Series(values).rolling(window)
+    expected = np.column_stack([rolling.mean(), rolling.var(), rolling.min(), rolling.max()])
+    result = np.array([row[index] for row in rows])
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_extend_returns_means():
+  stats = RollingStats([2, 4])
+  means = stats.extend([1, 2, 3, 4, 5], window=2)
+  assert np.allclose(means, [np.nan, 1.5, 2.5, 3.5, 4.5], equal_nan=True)
+  assert stats.mean(4) == pytest.approx(3.5)
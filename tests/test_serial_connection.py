@@ -0,0 +1,118 @@
+import binary_protocol
+import block_dispatcher
+import dispatcher_signals as ds
+from load_generator import LoadGenerator
+import numpy as np
+import pytest
+from replay_data import TEST_FILE, format_log_lines, read_recording
+import serial
+from serial_connection import Serial_Connect, ThroughputCounter
+import time
+
+
+class MockPort():
+  ''' Stands in for serial.Serial, returning the chunks it was given, or raising errors. '''
+
+  def __init__(self, chunks):
+    self.chunks = list(chunks)
+    self.pending = b''
+    self.timeout = None
+
+  @property
+  def in_waiting(self):
+    return len(self.pending)
+
+  def read(self, size=1):
+    if not self.pending and self.chunks:
+      chunk = self.chunks.pop(0)
+      if isinstance(chunk, Exception):
+        raise chunk
+      self.pending = chunk
+    read_bytes, self.pending = self.pending[:size], self.pending[size:]
+    return read_bytes
+
+
+@pytest.fixture
+def received():
+  blocks = []
+  def receive(message):
+    blocks.append(message)
+  block_dispatcher.connect(receive, signal=ds.PARSER_SIGNAL, sender=ds.PARSER_SENDER)
+  yield blocks
+  block_dispatcher.disconnect(receive, signal=ds.PARSER_SIGNAL)
+
+
+def read_all(reader, port):
+  while port.chunks or port.pending:
+    read_bytes = reader.read_chunk(port)
+    if read_bytes:
+      reader.handle_chunk(read_bytes)
+
+
+def test_throughput_counter_totals_and_interval():
+  counter = ThroughputCounter()
+  counter.add(100, 2)
+  counter.add(50, 1)
+  rates = counter.rates()
+  assert (rates['total_bytes'], rates['total_lines'], rates['total_reads']) == (150, 3, 2)
+  counter.reset_interval()
+  counter.add(10, 0)
+  assert counter.interval_bytes == 10
+  assert counter.rates()['total_bytes'] == 160
+
+
+def test_read_chunk_reads_everything_waiting():
+  reader = Serial_Connect(connect=False)
+  port = MockPort([b'abcdef'])
+  assert reader.read_chunk(port) == b'abcdef'
+  assert reader.read_chunk(port) == b''
+
+
+def test_read_chunk_backs_off_after_errors():
+  reader = Serial_Connect(connect=False)
+  port = MockPort([serial.SerialException('unplugged')] * 20 + [b'abc'])
+  backoffs = []
+  for _ in range(20):
+    assert reader.read_chunk(port) is None
+    backoffs.append(reader.error_backoff)
+  assert backoffs[0] == Serial_Connect.ERROR_BACKOFF
+  assert backoffs == sorted(backoffs)
+  assert backoffs[-1] == Serial_Connect.MAX_ERROR_BACKOFF
+  assert reader.read_errors == 20
+  assert reader.read_chunk(port) == b'abc'
+  assert reader.error_backoff == 0.0
+
+
+def test_reads_a_pty_from_the_loop_and_stops(received):
+  generator = LoadGenerator(rate=2000, protocol='binary', seed=1)
+  reader = Serial_Connect(serial_port=generator.port)
+  reader.start()
+  try:
+    generator.start(0.25)
+    generator.wait()
+    deadline = time.monotonic() + 2
+    while sum(len(block) for block in received) < generator.scans_sent and time.monotonic() < deadline:
+      time.sleep(0.01)
+  finally:
+    start = time.monotonic()
+    reader.stop()
+    stop_time = time.monotonic() - start
+    generator.close()
+  assert sum(len(block) for block in received) == generator.scans_sent
+  assert stop_time < 0.5
+  assert reader.loop.thread is None
+
+
+@pytest.mark.parametrize('protocol', ['text', 'binary'])
+def test_handle_chunk_detects_protocol_across_split_reads(protocol, received):
+  scans = read_recording(TEST_FILE)[:40]
+  if protocol == 'binary':
+    data = binary_protocol.pack_frames(scans)
+  else:
+    data = format_log_lines(scans).encode()
+  reader = Serial_Connect(connect=False)
+  read_all(reader, MockPort(data[i:i+5] for i in range(0, len(data), 5)))
+  assert reader.protocol == protocol
+  parsed = np.concatenate(received)
+  assert np.array_equal(parsed['counter'], scans['counter'])
+  assert reader.throughput.total_bytes == len(data)
@@ -0,0 +1,35 @@
+from snapshot import SnapshotBuffer
+import numpy as np
+import threading
+
+
+def test_acquire_skips_unchanged_generation():
+  snapshot = SnapshotBuffer(['a'], 4)
+  generation = snapshot.publish({'a': np.arange(4)})
+  assert snapshot.acquire()[0] == generation
+  assert snapshot.acquire(generation) == (generation, None)
+
+
+def test_reader_sees_consistent_columns():
+  snapshot = SnapshotBuffer(['a', 'b'], 1000)
+  stop = threading.Event()
+
+  def write():
+    value = 0
+    while not stop.is_set():
+      value += 1
+      snapshot.publish({'a': np.full(1000, value), 'b': np.full(1000, -value)})
+
+  writer = threading.Thread(target=write)
+  writer.start()
+  generation = 0 # skip the empty, NaN filled, snapshot
+  try:
+    for i in range(2000):
+      generation, columns = snapshot.acquire(generation)
+      if columns is not None:
+        a = columns['a'].copy()
+        b = columns['b'].copy()
+        assert np.all(a == a[0]) and np.all(b == -a[0])
+  finally:
+    stop.set()
+    writer.join()